@@ -0,0 +1,203 @@
+#!/usr/bin/env python2
+# Christian Unhold, DICE GmbH & Co KG
+"""
+Benchmarks of the command core and the protocol layers.
+Runs on the MPSSE emulator by default, so the results show the host side
+cost of encoding and executing, or on the first attached device with
+--hardware. The results are written as JSON, and compared with a previous
+result file by --compare, failing on a slowdown by more than --tolerance.
+Compare results of the same idle machine only, the rates of sub-millisecond
+calls vary by tens of percent with CPU frequency and load.
+Usage:
+	bench.py --output new.json --compare old.json
+"""
+
+import sys, time, json, optparse, platform, re, StringIO
+import ftdi
+from ftdi import MASK, BYTE, DEVICE
+
+def _time(function, count):
+	start = time.time()
+	for i in xrange(count):
+		function()
+	return time.time() - start
+
+def measure(function, minTime=0.05, repeat=5):
+	"""
+	Seconds per call of function, the best of repeat runs of at least
+	minTime s each, which is the least disturbed by other processes.
+	"""
+	count = 1
+	elapsed = _time(function, count)
+	while elapsed < minTime:
+		count *= 2 if elapsed < minTime/8 else 1 + int(minTime/elapsed)
+		elapsed = _time(function, count)
+	best = elapsed
+	for i in range(repeat - 1):
+		best = min(best, _time(function, count))
+	return best/count
+
+class Results(dict):
+	"Rates per second by benchmark name, of the names matching pattern."
+	def __init__(self, pattern=None):
+		dict.__init__(self)
+		self.pattern = pattern
+
+	def measure(self, name, function):
+		if self.pattern is None or re.search(self.pattern, name):
+			self[name] = 1/measure(function)
+
+def _emulator(lowByteValue=MASK.SPI_S, lowByteDirection=MASK.SPI_O):
+	import emulator
+	return ftdi.Mpsse(emulator.MpsseEmulator(DEVICE.FT2232H),
+		lowByteValue, lowByteDirection)
+
+ENCODE_COMMANDS = (
+	ftdi.Loopback(False),
+	ftdi.ClockDivideByFive(True),
+	ftdi.ThreePhaseClocking(False),
+	ftdi.SetClockDivisor(5),
+	ftdi.SetClockFrequency(1e6),
+	ftdi.SendImmediate(),
+	ftdi.SetIo(0x08, 0x0B),
+	ftdi.GetIo(BYTE.LOW),
+	ftdi.WaitOnIo(True),
+	ftdi.ShiftInBit(5),
+	ftdi.ShiftOutBit(5, "\x15"),
+	ftdi.ShiftInOutBit(5, "\x15"),
+	ftdi.ShiftInByte(16),
+	ftdi.ShiftOutByte("\x55"*16),
+	ftdi.ShiftInOutByte("\x55"*16),
+	ftdi.ShiftOut(100, "\x55"*13),
+	ftdi.ShiftIn(100),
+	ftdi.ShiftInOut(100, "\x55"*13),
+	ftdi.ShiftTms([1, 1, 0, 1, 0]),
+	ftdi.Clock(1000))
+
+def benchEncode(results, mpsse):
+	"Encoding of every command type, in commands per second."
+	for command in ENCODE_COMMANDS:
+		results.measure("encode." + command.__class__.__name__,
+			lambda: command.getWriteData(mpsse))
+
+LIST_SHAPES = {
+	"toggle": lambda: [ftdi.SetIo(i&1, 1) for i in range(256)],
+	"smallShifts": lambda: [ftdi.ShiftInOutByte("\x5A"*4)
+		for i in range(64)],
+	"bulkShift": lambda: [ftdi.ShiftInOutByte("\x5A"*0x1000)
+		for i in range(16)],
+	"mixed": lambda: [ftdi.SetIo(0, 0x0B), ftdi.ShiftOutByte("\x03\x00"),
+		ftdi.ShiftInByte(32), ftdi.SetIo(0x08, 0x0B)]*16}
+
+def benchExecuteList(results, mpsse):
+	"""
+	Compile and execute of typical command lists, in lists per second.
+	A list shape is only created once, as the command objects are.
+	"""
+	for name, makeList in LIST_SHAPES.items():
+		commandList = makeList()
+		results.measure("compile." + name,
+			lambda: mpsse.compile(commandList))
+		results.measure("executeList." + name,
+			lambda: mpsse.executeList(commandList))
+
+def benchSpi(results, open):
+	import spi
+	s = spi.SPI(open(MASK.SPI_S, MASK.SPI_O))
+	results.measure("spi.readWrite", lambda: s.readWrite(0x5A))
+
+def benchI2c(results, open):
+	import i2c
+	device = i2c.I2C(open(MASK.I2C_O, MASK.I2C_O), 0x50)
+	results.measure("i2c.read4", lambda: device.read(4))
+	results.measure("i2c.write4", lambda: device.write("\x00\x01\x02\x03"))
+
+def benchJtag(results, open):
+	import jtag
+	j = jtag.Jtag(open(0, MASK.SPI_O))
+	results.measure("jtag.shift_dr32", lambda: j.shift_dr(32, "\x00"*4))
+	results.measure("jtag.shift_dr4096",
+		lambda: j.shift_dr(4096, "\x00"*512))
+
+SVF = """
+! Benchmark sequence
+ENDIR IDLE;
+ENDDR IDLE;
+SIR 8 TDI (FE);
+SDR 32 TDI (00000000) TDO (00000000) MASK (00000000);
+SIR 8 TDI (C0);
+SDR 128 TDI (0123456789ABCDEF0123456789ABCDEF);
+RUNTEST 100 TCK;
+"""
+
+def benchSvf(results, open):
+	"SVF playback of a parsed file, in files per second."
+	import jtag, svf
+	commandList = svf.parse(StringIO.StringIO(SVF*10))
+	j = jtag.Jtag(open(0, MASK.SPI_O))
+	def play():
+		for command in commandList:
+			command.execute(j)
+	results.measure("svf.play", play)
+
+def run(hardware=False, pattern=None):
+	"Run all benchmarks, return a dict of name -> rate per second."
+	open = _emulator
+	if hardware:
+		open = ftdi.openFirst
+	results = Results(pattern)
+	with _emulator() as mpsse:
+		benchEncode(results, mpsse)
+	with open() as mpsse:
+		benchExecuteList(results, mpsse)
+	for bench in (benchSpi, benchI2c, benchJtag, benchSvf):
+		bench(results, open)
+	return dict(results)
+
+def compare(old, new, tolerance):
+	"Print the ratio of new to old rates, return the slower names."
+	slower = []
+	for name in sorted(new):
+		if name not in old:
+			continue
+		ratio = new[name]/old[name]
+		mark = ""
+		if ratio < 1 - tolerance:
+			mark = " SLOWER"
+			slower.append(name)
+		print "%-28s %12.1f %12.1f %6.2f%s" % (name, old[name], new[name],
+			ratio, mark)
+	return slower
+
+def main(args):
+	parser = optparse.OptionParser(usage="%prog [options]")
+	parser.add_option("--hardware", action="store_true",
+		help="use the first attached device instead of the emulator")
+	parser.add_option("--output", help="write the results to a JSON file")
+	parser.add_option("--compare", help="compare with a JSON result file")
+	parser.add_option("--tolerance", type="float", default=0.2,
+		help="relative slowdown to fail a comparison on [%default]")
+	parser.add_option("--filter", help="only benchmarks matching a regex")
+	options, args = parser.parse_args(args)
+	results = run(options.hardware, options.filter)
+	report = {
+		"python": platform.python_version(),
+		"platform": platform.platform(),
+		"target": "hardware" if options.hardware else "emulator",
+		"time": time.strftime("%Y-%m-%dT%H:%M:%S"),
+		"results": results}
+	if options.output:
+		with open(options.output, "w") as file:
+			json.dump(report, file, indent=1, sort_keys=True)
+	if options.compare:
+		with open(options.compare) as file:
+			old = json.load(file)["results"]
+		if compare(old, results, options.tolerance):
+			return 1
+	else:
+		for name in sorted(results):
+			print "%-28s %12.1f /s" % (name, results[name])
+	return 0
+
+if __name__ == "__main__":
+	sys.exit(main(sys.argv[1:]))
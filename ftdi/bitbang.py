@@ -0,0 +1,278 @@
+#!/usr/bin/env python2
+# Christian Unhold, DICE GmbH & Co KG
+"""
+Synchronous bit-bang mode, for FTDI parts without an MPSSE like FT232R.
+Every byte written sets the low byte pins, and the pins are sampled just
+before it is applied, so a write of n bytes returns n samples. A waveform
+is a NumPy uint8 array with one byte of pin states per step, exchange()
+streams it in chunks that keep the device buffers busy and returns the
+samples as an array of the same length.
+The rate of the steps follows from the baud rate, on FT232R it is 16 times
+the baud rate, so 187500 gives 3 MHz (FTDI AN232R-01).
+BitBangSpi and BitBangJtag build their waveforms with array operations,
+BitBangJtag has the interface of jtag.Jtag, so svf runs on it, and returns
+the same data.
+Usage:
+	bitbang = BitBang(handle, MASK.SPI_O, baudRate=187500)
+	samples = bitbang.exchange(numpy.array([0, PIN.SK, 0], numpy.uint8))
+	print BitBangSpi(bitbang).transfer("\\x9F\\x00\\x00\\x00").encode("hex")
+"""
+
+import numpy
+import tap
+from ftdi_mpsse import BIT_MODE, PIN, MASK, Ftdi
+
+def bits(data, length=None):
+	"""
+	Bits of data, a string, as a NumPy bool array, LSB of each byte first.
+	With length, only length bits, of which the first byte holds length%8
+	like in ftdi_mpsse.ShiftInOut.
+	"""
+	allBits = numpy.unpackbits(numpy.frombuffer(data, numpy.uint8))
+	allBits = allBits.reshape(-1, 8)[:, ::-1].reshape(-1)
+	if length is None:
+		return allBits.astype(bool)
+	partial = length%8
+	if partial:
+		allBits = numpy.concatenate((allBits[:partial],
+			allBits[8:8 + length - partial]))
+	return allBits[:length].astype(bool)
+
+def pack(bitArray, high=False):
+	"""
+	The inverse of bits(), a string of the bits in the same layout.
+	With high, the bits of a partial first byte are in its high bits,
+	like the MPSSE reads them.
+	"""
+	bitArray = numpy.asarray(bitArray, numpy.uint8)
+	partial = len(bitArray)%8
+	if partial:
+		padding = numpy.zeros(8 - partial, numpy.uint8)
+		if high:
+			bitArray = numpy.concatenate((padding, bitArray))
+		else:
+			bitArray = numpy.concatenate((bitArray[:partial], padding,
+				bitArray[partial:]))
+	return numpy.packbits(bitArray.reshape(-1, 8)[:, ::-1]).tostring()
+
+class BitBang(Ftdi):
+	"""
+	An FTDI device in synchronous bit-bang mode. direction has the output
+	pins of the low byte set. value is the pin state after the last step.
+	"""
+	def __init__(self, handle, direction=MASK.SPI_O, value=MASK.SPI_S,
+			baudRate=None):
+		self.baudRate = baudRate
+		self.value = value
+		Ftdi.__init__(self, handle, direction, BIT_MODE.SYNC)
+
+	def reset(self):
+		"Reset the device and output value."
+		Ftdi.reset(self)
+		if self.baudRate is not None:
+			self.handle.setBaudRate(self.baudRate)
+		self.exchange(numpy.array([self.value], numpy.uint8))
+
+	def setBaudRate(self, baudRate):
+		self.baudRate = baudRate
+		self.handle.setBaudRate(baudRate)
+
+	def exchange(self, samples):
+		"""
+		Output the steps of samples, a uint8 array or anything convertible,
+		and return the pin states sampled before each step as a uint8
+		array. Chunks are written one ahead of reading, or as submitted
+		transfers with asyncTransfers.
+		"""
+		samples = numpy.ascontiguousarray(samples, numpy.uint8)
+		count = len(samples)
+		readBuffer = bytearray(count)
+		readView = memoryview(readBuffer)
+		chunkSize = min(self.writeChunkSize, self.readChunkSize)
+		if self.asyncTransfers:
+			for start in xrange(0, count, chunkSize):
+				end = min(start + chunkSize, count)
+				self.submit(samples[start:end].tostring(), end - start,
+					readView[start:end])
+			self.complete()
+		else:
+			pending = None # read range of the chunk written ahead
+			for start in xrange(0, count, chunkSize):
+				end = min(start + chunkSize, count)
+				self.write(samples[start:end].tostring())
+				if pending:
+					self.read(pending[1] - pending[0],
+						readView[pending[0]:pending[1]])
+				pending = (start, end)
+			if pending:
+				self.read(pending[1] - pending[0],
+					readView[pending[0]:pending[1]])
+		if count:
+			self.value = int(samples[-1])
+		return numpy.frombuffer(readBuffer, numpy.uint8)
+
+class BitBangSpi:
+	"""
+	SPI master in mode 0, MSB first, on a BitBang. Each bit takes two
+	steps, the chip select one more at each end.
+	"""
+	def __init__(self, bitbang, sck=PIN.SK, mosi=PIN.DO, miso=PIN.DI,
+			cs=PIN.CS):
+		self.bitbang = bitbang
+		self.sck = sck
+		self.mosi = mosi
+		self.miso = miso
+		self.cs = cs
+
+	def transfer(self, data):
+		"Shift out data with chip select low, return the data shifted in."
+		idle = (self.bitbang.value | self.cs) & ~(self.sck | self.mosi)
+		selected = idle & ~self.cs
+		dataBits = numpy.unpackbits(numpy.frombuffer(data, numpy.uint8))
+		low = numpy.where(dataBits, selected | self.mosi,
+			selected).astype(numpy.uint8)
+		samples = numpy.empty(2*len(dataBits) + 2, numpy.uint8)
+		samples[0] = selected
+		samples[1:-1:2] = low
+		samples[2:-1:2] = low | self.sck
+		samples[-1] = idle
+		result = self.bitbang.exchange(samples)
+		misoBits = (result[2:-1:2] & self.miso) != 0
+		return numpy.packbits(misoBits).tostring()
+
+	def readWrite(self, word):
+		"One byte, like spi.SPI.readWrite()."
+		return ord(self.transfer(chr(word)))
+
+class BitBangJtag:
+	"""
+	JTAG master on a BitBang, with the interface of jtag.Jtag.
+	A TCK cycle is a step with TCK low and TMS/TDI set and a step with
+	TCK high, TDO is sampled just before the rising edge. Each shift,
+	including the TAP state changes around it, is one exchange().
+	"""
+	def __init__(self, bitbang, tck=PIN.TCK, tdi=PIN.TDI, tdo=PIN.TDO,
+			tms=PIN.TMS):
+		self.bitbang = bitbang
+		self.tck = tck
+		self.tdi = tdi
+		self.tdo = tdo
+		self.tms = tms
+		self.ir_end_state = "IDLE"
+		self.dr_end_state = "IDLE"
+		self.run_state = "IDLE"
+		self.end_state = "IDLE"
+		self._cycles([1]*5)
+		self.state = "RESET"
+
+	def _cycles(self, tms, tdi=False):
+		"""
+		Clock TCK once per element of tms, with TDI from tdi, arrays or
+		scalars. Return the TDO bits as a bool array.
+		"""
+		tms = numpy.asarray(tms, bool)
+		count = len(tms)
+		base = self.bitbang.value & ~(self.tck | self.tdi | self.tms)
+		low = (base | numpy.where(tms, self.tms, 0) |
+			numpy.where(tdi, self.tdi, 0)).astype(numpy.uint8)
+		samples = numpy.empty(2*count + 1, numpy.uint8)
+		samples[0:-1:2] = low
+		samples[1::2] = low | self.tck
+		samples[-1] = low[-1] if count else base
+		result = self.bitbang.exchange(samples)
+		return (result[1::2] & self.tdo) != 0
+
+	def _path(self, fromState, toState):
+		return tap.find_shortest_edges(tap.STATES, fromState, toState)
+
+	def execute(self, svfCommand):
+		svfCommand.execute(self)
+
+	def execute_list(self, svfCommandList):
+		for svfCommand in svfCommandList:
+			self.execute(svfCommand)
+
+	def set_state(self, state):
+		if state != self.state:
+			self._cycles(self._path(self.state, state))
+			self.state = state
+
+	def _shift(self, shiftState, endState, length, data):
+		enter = self._path(self.state, shiftState)
+		leave = self._path(shiftState, endState)
+		tms = numpy.concatenate((numpy.asarray(enter, bool),
+			numpy.zeros(length, bool), numpy.asarray(leave, bool)))
+		tdi = numpy.zeros(len(tms), bool)
+		tdi[len(enter):len(enter) + length] = bits(data, length)
+		tdo = self._cycles(tms, tdi)
+		self.state = endState
+		return pack(tdo[len(enter):len(enter) + length], True)
+
+	def shift_ir(self, length, data):
+		return self._shift("IRSHIFT", self.ir_end_state, length, data)
+
+	def shift_dr(self, length, data):
+		return self._shift("DRSHIFT", self.dr_end_state, length, data)
+
+	def run(self, cycles):
+		self.set_state(self.run_state)
+		self._cycles(numpy.zeros(cycles, bool))
+		self.set_state(self.end_state)
+
+class _Bypass:
+	"Emulator target with a one bit register between TDI and TDO."
+	def __init__(self):
+		self.bit = False
+
+	def clock(self, tdi, tms):
+		tdo, self.bit = self.bit, tdi
+		return tdo
+
+def test():
+	"Basic module self-test, on the emulator."
+	import emulator, ftdi_mpsse, jtag
+	from ftdi_mpsse import DEVICE
+	print "Module 'bitbang' self test:"
+	assert pack(bits("\x05\xA5", 11)) == "\x05\xA5"
+	assert list(bits("\x06", 3)) == [False, True, True]
+	assert pack([False, True, True], True) == "\xC0"
+	handle = emulator.MpsseEmulator(DEVICE.FT232R)
+	handle.inputValue = PIN.DI
+	with BitBang(handle, baudRate=187500) as bitbang:
+		assert handle.baudRate == 187500
+		ramp = numpy.arange(1000) & MASK.SPI_O
+		samples = bitbang.exchange(ramp)
+		assert samples[0] == MASK.SPI_S | PIN.DI
+		assert (samples[1:] == ramp[:-1] | PIN.DI).all()
+		assert bitbang.checkReadBufferEmpty()
+		bitbang.asyncTransfers = 4
+		assert (bitbang.exchange(ramp)[1:] == samples[1:]).all()
+		bitbang.asyncTransfers = 0
+		handle.target = _Bypass()
+		spi = BitBangSpi(bitbang)
+		assert spi.transfer("\x12\x34\x56") == "\x09\x1A\x2B"
+		assert spi.readWrite(0xFF) == 0x7F
+		assert handle.value[0] == MASK.SPI_S
+		jtags = [BitBangJtag(bitbang)]
+		mpsseHandle = emulator.MpsseEmulator(DEVICE.FT2232H)
+		mpsseHandle.target = _Bypass()
+		mpsse = ftdi_mpsse.Mpsse(mpsseHandle)
+		jtags.append(jtag.Jtag(mpsse))
+		results = []
+		for j in jtags:
+			j.dr_end_state = "DRPAUSE"
+			j.run(3)
+			shifts = (j.shift_ir(5, "\x15"), j.shift_dr(13, "\x15\xA5"),
+				j.shift_dr(8, "\x3C"))
+			assert [type(shift) for shift in shifts] == [str]*3
+			results.append(shifts + (j.state,))
+			j.set_state("RESET")
+		assert results[0] == results[1] == ("\x50", "\x50\x4B", "\x78",
+			"DRPAUSE")
+		assert bitbang.checkReadBufferEmpty()
+		assert mpsse.checkReadBufferEmpty()
+		mpsse.__del__()
+	print "bitbang test done"
+
+if __name__ == "__main__":
+	test()
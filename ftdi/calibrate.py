@@ -0,0 +1,193 @@
+#!/usr/bin/env python2
+# Christian Unhold, DICE GmbH & Co KG
+"""
+Calibration of the fastest TCK/SK frequency a target works with.
+A check is a function check(mpsse) returning True if the target answered
+correctly at the current clock. calibrate() binary searches the clock
+divisor, and ClockDivideByFive on high-speed devices, for the fastest
+setting that passes, assuming every slower one passes too. The result
+is cached by adapter serial number and target name in CACHE_FILE, and a
+cached setting only needs one check to be confirmed.
+Usage:
+	calibrate.calibrate(mpsse, calibrate.spiJedecIdCheck("\\xEF\\x40\\x18"),
+		"W25Q128")
+"""
+
+import os, json, struct
+from ftdi_mpsse import (BYTE, PIN, HIGHSPEED_DEVICES, Loopback,
+	ClockDivideByFive, SetClockDivisor, SetIo, ShiftInOutByte, ShiftInByte,
+	ShiftOutByte, ShiftTms)
+
+CACHE_FILE = os.path.expanduser("~/.ftdi_calibration.json")
+
+MAX_DIVISOR = 0xFFFF
+FIRST_SLOW_DIVISOR = 13107 # 6 MHz/(1 + 13107) < 30 MHz/(1 + MAX_DIVISOR)
+
+def clockFrequency(divideByFive, divisor):
+	"""
+	TCK frequency of a setting, divideByFive is None for devices
+	without the high-speed clock.
+	"""
+	if divideByFive is False:
+		return 30e6 / (1 + divisor)
+	return 6e6 / (1 + divisor)
+
+def _settings(mpsse):
+	"""
+	All settings, fastest first, as a function of the index and their
+	count. Only ClockDivideByFive(True) reaches below 30 MHz/0x10000.
+	"""
+	if mpsse.deviceInfo["type"] not in HIGHSPEED_DEVICES:
+		return (lambda index: (None, index)), MAX_DIVISOR + 1
+	def setting(index):
+		if index <= MAX_DIVISOR:
+			return False, index
+		return True, index - MAX_DIVISOR - 1 + FIRST_SLOW_DIVISOR
+	return setting, 2*(MAX_DIVISOR + 1) - FIRST_SLOW_DIVISOR
+
+def apply(mpsse, divideByFive, divisor):
+	"Set the clock of a setting."
+	commandList = [SetClockDivisor(divisor)]
+	if divideByFive is not None:
+		commandList.insert(0, ClockDivideByFive(divideByFive))
+	mpsse.executeList(commandList)
+
+def _passes(mpsse, check, divideByFive, divisor, repeat):
+	apply(mpsse, divideByFive, divisor)
+	for i in range(repeat):
+		if not check(mpsse):
+			return False
+	return True
+
+def search(mpsse, check, repeat=3, margin=0.1):
+	"""
+	Find the fastest setting where check passes repeat times in a row,
+	then slow it down by the fraction margin. Return (divideByFive,
+	divisor) of the result, which is left applied.
+	"""
+	setting, count = _settings(mpsse)
+	slow = count - 1
+	if not _passes(mpsse, check, repeat=repeat, *setting(slow)):
+		raise EnvironmentError("check fails at %.0f Hz" %
+			clockFrequency(*setting(slow)))
+	fast = 0
+	while fast < slow: # the first passing setting is in fast..slow
+		middle = (fast + slow)/2
+		if _passes(mpsse, check, repeat=repeat, *setting(middle)):
+			slow = middle
+		else:
+			fast = middle + 1
+	limit = clockFrequency(*setting(slow))*(1 - margin)
+	end = count - 1
+	while slow < end: # first setting with a frequency of at most limit
+		middle = (slow + end)/2
+		if clockFrequency(*setting(middle)) <= limit:
+			end = middle
+		else:
+			slow = middle + 1
+	apply(mpsse, *setting(slow))
+	return setting(slow)
+
+def loadCache(fileName=None):
+	"The calibration cache, {serial: {target: [divideByFive, divisor]}}."
+	try:
+		with open(fileName or CACHE_FILE) as file:
+			return json.load(file)
+	except (IOError, ValueError):
+		return {}
+
+def saveCache(cache, fileName=None):
+	with open(fileName or CACHE_FILE, "w") as file:
+		json.dump(cache, file, indent=1, sort_keys=True)
+
+def calibrate(mpsse, check, target=None, repeat=3, margin=0.1,
+		cacheFile=None):
+	"""
+	Set the fastest clock for the target, see search(), and return it
+	in Hz. With a target name, a cached setting for the adapter serial
+	number is used if check passes once with it, and a new result is
+	cached.
+	"""
+	serial = mpsse.deviceInfo["serial"]
+	cache = {}
+	if target is not None:
+		cache = loadCache(cacheFile)
+		cached = cache.get(serial, {}).get(target)
+		if cached and _passes(mpsse, check, repeat=1, *cached):
+			return clockFrequency(*cached)
+	divideByFive, divisor = search(mpsse, check, repeat, margin)
+	if target is not None:
+		cache.setdefault(serial, {})[target] = [divideByFive, divisor]
+		saveCache(cache, cacheFile)
+	return clockFrequency(divideByFive, divisor)
+
+def loopbackCheck(pattern="\x55\xAA\x0F\xF0\x00\xFF"):
+	"""
+	Shift a pattern through the internal loopback. This only tests the
+	adapter, use it for the highest clock a program can run with.
+	"""
+	def check(mpsse):
+		shift = ShiftInOutByte(pattern)
+		mpsse.executeList([Loopback(True), shift, Loopback(False)])
+		return shift.result.tobytes() == pattern
+	return check
+
+def spiJedecIdCheck(expected, chipSelect=PIN.CS):
+	"Read the JEDEC ID of an SPI flash by command 0x9F."
+	def check(mpsse):
+		value = mpsse.ioValue[BYTE.LOW]
+		direction = mpsse.ioDirection[BYTE.LOW]
+		shift = ShiftInByte(len(expected))
+		mpsse.executeList([SetIo(value & ~chipSelect, direction),
+			ShiftOutByte("\x9F"), shift,
+			SetIo(value | chipSelect, direction)])
+		return shift.result.tobytes() == expected
+	return check
+
+def jtagIdCodeCheck(expected):
+	"""
+	Read the IDCODE of a single JTAG device, selected by a TAP reset,
+	and compare it with the number expected.
+	"""
+	def check(mpsse):
+		lsbFirst = mpsse.lsbFirst
+		mpsse.lsbFirst = True
+		try:
+			shift = ShiftInByte(4)
+			mpsse.executeList([ShiftTms([1]*5), ShiftTms([0, 1, 0, 0]),
+				shift, ShiftTms([1, 1, 0])])
+		finally:
+			mpsse.lsbFirst = lsbFirst
+		return struct.unpack("<I", shift.result.tobytes())[0] == expected
+	return check
+
+def test():
+	"Basic module self-test, on the emulator."
+	import emulator, tempfile, ftdi_mpsse
+	print "Module 'calibrate' self test:"
+	handle = emulator.MpsseEmulator(ftdi_mpsse.DEVICE.FT2232H)
+	handle.maxClockFrequency = 7e6
+	cacheFile = tempfile.mktemp(".json")
+	with ftdi_mpsse.Mpsse(handle) as mpsse:
+		check = spiJedecIdCheck("\x00\x00\x00")
+		frequency = calibrate(mpsse, check, "flash", margin=0,
+			cacheFile=cacheFile)
+		assert frequency == 6e6 and handle.clockFrequency() == 6e6
+		frequency = calibrate(mpsse, check, "flash", cacheFile=cacheFile)
+		assert frequency == 6e6
+		assert loadCache(cacheFile) == {"EMU00000": {"flash": [False, 4]}}
+		handle.maxClockFrequency = 1e3
+		assert calibrate(mpsse, loopbackCheck()) <= 0.9e3
+		assert not jtagIdCodeCheck(0x12345678)(mpsse)
+		handle.maxClockFrequency = 50
+		try:
+			calibrate(mpsse, check)
+			assert False
+		except EnvironmentError:
+			pass
+		assert mpsse.checkReadBufferEmpty()
+	os.remove(cacheFile)
+	print "calibrate test done"
+
+if __name__ == "__main__":
+	test()
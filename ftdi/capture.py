@@ -0,0 +1,271 @@
+#!/usr/bin/env python2
+# Christian Unhold, DICE GmbH & Co KG
+"""
+Continuous sampling of the I/O lines, a simple logic analyzer.
+A sample is one GetIo of the low byte, or of the low and high byte as a
+little-endian 16 bit value, optionally followed by Clock cycles to pace the
+samples by the TCK frequency. The sample commands are encoded once and
+sent in blocks that fill the device buffers, with the next block written
+before the previous one is read, so the adapter always has work queued.
+The samples go into a preallocated buffer: a NumPy array (uint8 or
+uint16, also numpy.memmap), a bytearray or an mmap of a file.
+A Trigger starts the capture at the first matching sample and keeps up to
+preTrigger samples before it in a ring buffer, fewer if it comes earlier.
+NumPy is optional; without it the trigger search is done in Python.
+Usage:
+	samples, index = capture.capture(mpsse, 100000, highByte=True,
+		trigger=capture.Trigger(ftdi.PIN.CS, 0), preTrigger=1000)
+"""
+
+import array, time, collections
+from ftdi_mpsse import BYTE, GetIo, Clock
+
+def _numpy():
+	try:
+		import numpy
+		return numpy
+	except ImportError:
+		return None
+
+class Trigger:
+	"""
+	Condition sample & mask == value. With edge, only a sample matching
+	after one that does not is a trigger, so the capture does not start
+	while the condition already holds.
+	"""
+	def __init__(self, mask, value, edge=True):
+		self.mask = mask
+		self.value = value
+		self.edge = edge
+		self.reset()
+
+	def reset(self):
+		"Forget the samples seen, done at the start of a capture."
+		self.matched = True # of the last sample seen
+
+	def find(self, samples):
+		"""
+		Index of the first trigger in a sequence of samples following the
+		ones seen before, or None. samples is a NumPy array or an
+		array.array.
+		"""
+		numpy = _numpy()
+		if numpy and isinstance(samples, numpy.ndarray):
+			if not len(samples):
+				return None
+			matches = (samples & self.mask) == self.value
+			if self.edge:
+				previous = numpy.empty_like(matches)
+				previous[0] = self.matched
+				previous[1:] = matches[:-1]
+				matches &= ~previous
+			self.matched = bool(((samples[-1:] & self.mask) ==
+				self.value)[0])
+			indices = numpy.flatnonzero(matches)
+			if len(indices):
+				return int(indices[0])
+			return None
+		mask, value, edge = self.mask, self.value, self.edge
+		matched = self.matched
+		for index in xrange(len(samples)):
+			previous = matched
+			matched = samples[index] & mask == value
+			if matched and not (edge and previous):
+				self.matched = matched
+				return index
+		self.matched = matched
+		return None
+
+class _Sink:
+	"Byte level writes to a NumPy array, bytearray or mmap."
+	def __init__(self, out):
+		numpy = _numpy()
+		self.isArray = numpy is not None and isinstance(out, numpy.ndarray)
+		if self.isArray:
+			self.numpy = numpy
+			self.out = out.reshape(-1).view(numpy.uint8)
+		else:
+			self.out = out
+		self.size = len(self.out)
+
+	def write(self, offset, data):
+		end = offset + len(data)
+		if self.isArray:
+			self.out[offset:end] = self.numpy.frombuffer(str(data),
+				self.numpy.uint8)
+		else:
+			self.out[offset:end] = str(data)
+
+def _samples(data, sampleSize):
+	"A block of bytes as sample values, for Trigger.find()."
+	numpy = _numpy()
+	if numpy:
+		return numpy.frombuffer(str(data),
+			(numpy.uint8, numpy.dtype("<u2"))[sampleSize - 1])
+	samples = array.array("BH"[sampleSize - 1], str(data))
+	if sampleSize == 2 and array.array("H", "\x01\x00")[0] != 1:
+		samples.byteswap()
+	return samples
+
+class Capture:
+	"""
+	Sampling setup of an Mpsse, see capture().
+	clocks is the number of TCK cycles after each sample.
+	"""
+	def __init__(self, mpsse, highByte=False, clocks=0):
+		self.mpsse = mpsse
+		self.sampleSize = 2 if highByte else 1
+		sample = GetIo(BYTE.LOW).getWriteData(mpsse)
+		if highByte:
+			sample += GetIo(BYTE.HIGH).getWriteData(mpsse)
+		if clocks:
+			sample += Clock(clocks).getWriteData(mpsse)
+		flush = mpsse.getFlushData()
+		self.blockSamples = max(1, min(
+			mpsse.readChunkSize/self.sampleSize,
+			(mpsse.writeChunkSize - len(flush))/len(sample)))
+		self.sample = sample
+		self.flush = flush
+
+	def _blockData(self, samples):
+		return self.sample*samples + self.flush
+
+	def run(self, sampleCount, out, trigger=None, preTrigger=0,
+			timeout=None):
+		"""
+		Capture sampleCount samples into out, starting preTrigger samples
+		before the first one matching trigger, if given. Return the index
+		of the trigger sample in out. Raise an EnvironmentError if the
+		trigger does not match within timeout seconds.
+		"""
+		mpsse = self.mpsse
+		sampleSize = self.sampleSize
+		sink = _Sink(out)
+		size = sampleCount*sampleSize
+		assert sink.size >= size
+		assert preTrigger < sampleCount
+		mpsse.flush()
+		mpsse.complete()
+		blockSamples = self.blockSamples
+		blockData = self._blockData(blockSamples)
+		blockBuffer = bytearray(blockSamples*sampleSize)
+		ring = "" # last samples before the trigger
+		ringSize = preTrigger*sampleSize
+		deadline = None
+		if timeout is not None:
+			deadline = time.time() + timeout
+		inFlight = collections.deque() # sample counts of written blocks
+		wanted = None # samples still to write, None until triggered
+		if trigger is None:
+			wanted = sampleCount
+		else:
+			trigger.reset()
+		offset = 0 # in out
+		triggerIndex = 0
+		while offset < size:
+			while len(inFlight) < 2 and wanted != 0:
+				count = blockSamples
+				if wanted is not None:
+					count = min(count, wanted)
+					wanted -= count
+				mpsse.write(blockData if count == blockSamples else
+					self._blockData(count))
+				inFlight.append(count)
+			view = memoryview(blockBuffer)[:inFlight.popleft()*sampleSize]
+			mpsse.read(len(view), view)
+			data = view.tobytes()
+			if wanted is None:
+				index = trigger.find(_samples(data, sampleSize))
+				if index is None:
+					if ringSize:
+						ring = (ring + data)[-ringSize:]
+					if deadline is not None and time.time() > deadline:
+						self._drain(inFlight)
+						raise EnvironmentError("capture trigger timeout")
+					continue
+				pre = ""
+				if ringSize:
+					pre = (ring + data[:index*sampleSize])[-ringSize:]
+				sink.write(0, pre)
+				offset = len(pre)
+				triggerIndex = offset/sampleSize
+				data = data[index*sampleSize:]
+				wanted = max(0, (size - offset - len(data))/sampleSize -
+					sum(inFlight))
+			data = data[:size - offset]
+			sink.write(offset, data)
+			offset += len(data)
+		self._drain(inFlight)
+		return triggerIndex
+
+	def _drain(self, inFlight):
+		"Read and drop the samples of the blocks written ahead."
+		while inFlight:
+			self.mpsse.read(inFlight.popleft()*self.sampleSize)
+
+def capture(mpsse, sampleCount, out=None, highByte=False, clocks=0,
+		trigger=None, preTrigger=0, timeout=None):
+	"""
+	Capture samples of the I/O lines, see Capture.run().
+	Without out, a NumPy array is allocated, or an array.array without
+	NumPy. Return out and the index of the trigger sample in it.
+	"""
+	c = Capture(mpsse, highByte, clocks)
+	if out is None:
+		numpy = _numpy()
+		if numpy:
+			out = numpy.zeros(sampleCount,
+				(numpy.uint8, numpy.dtype("<u2"))[c.sampleSize - 1])
+		else:
+			out = bytearray(sampleCount*c.sampleSize)
+	triggerIndex = c.run(sampleCount, out, trigger, preTrigger, timeout)
+	if isinstance(out, bytearray):
+		out = _samples(out, c.sampleSize)
+	return out, triggerIndex
+
+class _Counter:
+	"Emulator target counting 16 TCK cycles up on the low byte inputs."
+	def __init__(self, emulator):
+		self.emulator = emulator
+		self.count = 0
+
+	def clock(self, tdi, tms):
+		self.count += 1
+		self.emulator.inputValue = (self.count >> 4) & 0xFF
+		return 0
+
+def test():
+	"Basic module self-test, on the emulator."
+	import emulator, ftdi_mpsse
+	print "Module 'capture' self test:"
+	handle = emulator.MpsseEmulator(ftdi_mpsse.DEVICE.FT2232H)
+	handle.target = counter = _Counter(handle)
+	with ftdi_mpsse.Mpsse(handle, 0, 0) as mpsse:
+		samples, index = capture(mpsse, 1000, clocks=16)
+		assert index == 0 and len(samples) == 1000
+		assert list(samples[:3]) == [0, 1, 2]
+		assert list(samples[998:]) == [998 & 0xFF, 999 & 0xFF]
+		trigger = Trigger(0xFF, 200)
+		counter.count = 0
+		samples, index = capture(mpsse, 5000, highByte=True, clocks=16,
+			trigger=trigger, preTrigger=150)
+		assert index == 150 and list(samples[index - 1:index + 2]) == [
+			199, 200, 201]
+		assert list(samples[:2]) == [50, 51] and samples[-1] == 5049 & 0xFF
+		out = bytearray(300)
+		capture(mpsse, 300, out, clocks=16, trigger=trigger, preTrigger=10)
+		assert out[10] == 200 and out[9] == 199
+		trigger.reset()
+		assert trigger.find(array.array("H", [200, 0, 200])) == 2
+		assert Trigger(0xFF, 200, False).find(array.array("B", [200])) == 0
+		try:
+			capture(mpsse, 10, clocks=16, trigger=Trigger(0xFF, 0x100),
+				timeout=0.05)
+			assert False
+		except EnvironmentError:
+			pass
+		assert mpsse.checkReadBufferEmpty()
+	print "capture test done"
+
+if __name__ == "__main__":
+	test()
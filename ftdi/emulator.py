@@ -0,0 +1,495 @@
+#!/usr/bin/env python2
+# Christian Unhold, DICE GmbH & Co KG
+"""
+Software model of the MPSSE of an FT2232H/FT4232H channel.
+Takes the command bytes a real device would get over USB and produces the
+same read data, so the ftdi modules run without an adapter attached.
+The synchronous bit-bang mode is modelled as well, on the low byte.
+Performs a basic test program when executed directly.
+"""
+
+import array
+
+# Numeric values of the bit modes, see ftdi_mpsse.BIT_MODE.
+_RESET = 0x00
+_MPSSE = 0x02
+_SYNC = 0x04
+
+_TCK = 1<<0
+_TDI = 1<<1
+_TDO = 1<<2
+_TMS = 1<<3
+_GPIOL1 = 1<<5
+
+# Shift opcode flags, see ftdi_mpsse.FLAG.
+_WRITE_NEGEDGE = 0x01
+_BIT_MODE      = 0x02
+_READ_NEGEDGE  = 0x04
+_LSB_FIRST     = 0x08
+_WRITE_TDI     = 0x10
+_READ_TDO      = 0x20
+_WRITE_TMS     = 0x40
+
+BAD_COMMAND = 0xFA
+
+def _isShift(opcode):
+	if opcode & 0x80:
+		return False
+	if opcode & _WRITE_TMS:
+		return bool(opcode & _BIT_MODE) and not opcode & _WRITE_TDI
+	return bool(opcode & (_WRITE_TDI|_READ_TDO))
+
+def _commandLength(opcode, data, index):
+	"""
+	Number of bytes of the command at index,
+	or None if it is not yet complete.
+	"""
+	available = len(data) - index
+	if opcode in (0x80, 0x82, 0x86, 0x8F, 0x9C, 0x9D, 0x9E):
+		length = 3
+	elif opcode in (0x8E,):
+		length = 2
+	elif _isShift(opcode):
+		if opcode & _BIT_MODE:
+			length = 2
+			if opcode & (_WRITE_TDI|_WRITE_TMS):
+				length = 3
+		else:
+			length = 3
+			if opcode & _WRITE_TDI:
+				if available < 3:
+					return None
+				length += (data[index+1] | data[index+2]<<8) + 1
+	else:
+		length = 1
+	if available < length:
+		return None
+	return length
+
+class _Transfer:
+	"Asynchronous transfer of the emulator."
+	def __init__(self, count, emulator=None, readCount=0, readBuffer=None):
+		self.count = count
+		self.emulator = emulator
+		self.readCount = readCount
+		self.readBuffer = readBuffer
+
+	def done(self):
+		if self.emulator is not None:
+			data = self.emulator.read(self.readCount)
+			self.readBuffer[:len(data)] = data
+			self.count = len(data)
+			self.emulator.readSubmitted = False
+			self.emulator = None
+		return self.count
+
+class MpsseEmulator:
+	"""
+	Emulated FTDI device in MPSSE mode, a transport for ftdi_mpsse
+	including asynchronous transfers. deviceType is a ftdi_mpsse.DEVICE.
+
+	Pins not driven by the device read inputValue.
+	TDO comes from the internal loopback, the optional target or inputValue.
+	A target is an object with a method clock(tdi, tms) returning tdo,
+	called once per TCK cycle.
+	Above maxClockFrequency, if set, every bit shifted in reads as 1,
+	like a target that cannot follow the clock.
+	In synchronous bit-bang mode every byte written first samples the
+	pins, then drives them. The target is clocked by rising edges of TCK
+	and its TDO is part of the sample taken at the edge.
+	"""
+	def __init__(self, deviceType, serialNumber="EMU00000",
+			description="MPSSE emulator"):
+		self.type = deviceType
+		self.serialNumber = serialNumber
+		self.description = description
+		self.readTimeout = 1000 # ms
+		self.writeTimeout = 1000 # ms
+		self.latencyTimer = 16 # ms
+		self.inputValue = 0
+		self.target = None
+		self.maxClockFrequency = None # Hz
+		self.baudRate = 9600
+		self.readSubmitted = False # a read transfer is in flight
+		self.maxReadChunk = None # bytes per read, None for unlimited
+		self.bytesWritten = 0
+		self.bytesRead = 0
+		self.clockCount = 0
+		self.setBitMode(0, _RESET)
+
+	def resetDevice(self):
+		"USB reset: drop all buffered data, the bit mode is kept."
+		self.purge()
+
+	def _resetMpsse(self):
+		self.value = [0, 0]
+		self.direction = [0, 0]
+		self.loopback = False
+		self.clockDivisor = 0
+		self.clockDivideByFive = True
+		self.threePhaseClocking = False
+		self.adaptiveClocking = False
+		self.purge()
+
+	def purge(self):
+		self.commandBuffer = bytearray()
+		self.readBuffer = bytearray()
+		self.readSubmitted = False # the transfer is cancelled
+
+	def close(self):
+		self.purge()
+
+	def getDeviceInfo(self):
+		return {"type": self.type, "id": 0, "serial": self.serialNumber,
+			"description": self.description}
+
+	def setLatencyTimer(self, latencyTimer):
+		self.latencyTimer = latencyTimer
+
+	def setTimeouts(self, readTimeout, writeTimeout):
+		self.readTimeout = readTimeout
+		self.writeTimeout = writeTimeout
+
+	def setBitMode(self, mask, bitMode):
+		"Only BIT_MODE.RESET ends a pending WaitOnIo."
+		self.bitMode = bitMode
+		self._resetMpsse()
+		if bitMode == _RESET:
+			self.waitOnIo = None
+		if bitMode in (_MPSSE, _SYNC):
+			self.direction[0] = mask
+
+	def setBaudRate(self, baudRate):
+		"Only stored, the bit-bang rate is not modelled."
+		self.baudRate = baudRate
+
+	def setInput(self, inputValue):
+		"Change the level of the undriven pins, e.g. to end a WaitOnIo."
+		self.inputValue = inputValue
+		self._process()
+
+	def write(self, data):
+		self.bytesWritten += len(data)
+		if self.bitMode == _MPSSE:
+			self.commandBuffer.extend(data)
+			self._process()
+		elif self.bitMode == _SYNC:
+			self._bitBang(data)
+		return len(data)
+
+	def _bitBang(self, data):
+		readBuffer = self.readBuffer
+		value = self.value
+		for byte in bytearray(data):
+			if self.target and byte & ~value[0] & _TCK:
+				tdo = self.target.clock(self._pin(_TDI), self._pin(_TMS))
+				self.inputValue = (self.inputValue & ~_TDO |
+					(_TDO if tdo else 0))
+			readBuffer.append(self.getIo(0))
+			value[0] = byte
+
+	def read(self, readCount):
+		if self.maxReadChunk is not None:
+			readCount = min(readCount, self.maxReadChunk)
+		data = str(self.readBuffer[:readCount])
+		del self.readBuffer[:readCount]
+		self.bytesRead += len(data)
+		return data
+
+	def writeSubmit(self, data):
+		"Asynchronous write, the data is processed right away."
+		return _Transfer(self.write(data))
+
+	def readSubmit(self, readCount, readBuffer):
+		"""
+		Asynchronous read, done when the transfer is completed. Only one
+		may be in flight, like with the one read buffer of a libftdi
+		context.
+		"""
+		assert not self.readSubmitted, "read submitted while one in flight"
+		self.readSubmitted = True
+		return _Transfer(None, self, readCount, readBuffer)
+
+	def getIo(self, lowHighByte):
+		"Current level of the I/O lines as seen by GetIo."
+		shift = 8*lowHighByte
+		inputValue = (self.inputValue >> shift) & 0xFF
+		direction = self.direction[lowHighByte]
+		return (self.value[lowHighByte] & direction |
+			inputValue & ~direction & 0xFF)
+
+	def _process(self):
+		data = self.commandBuffer
+		index = 0
+		while index < len(data):
+			if self.waitOnIo is not None:
+				state = bool(self.getIo(0) & _GPIOL1)
+				if state != self.waitOnIo:
+					break
+				self.waitOnIo = None
+			opcode = data[index]
+			length = _commandLength(opcode, data, index)
+			if length is None:
+				break
+			self._execute(opcode, data[index+1:index+length])
+			index += length
+		del data[:index]
+
+	def _execute(self, opcode, args):
+		if opcode in (0x80, 0x82):
+			byte = (opcode >> 1) & 1
+			self.value[byte] = args[0]
+			self.direction[byte] = args[1]
+		elif opcode in (0x81, 0x83):
+			self.readBuffer.append(self.getIo((opcode >> 1) & 1))
+		elif opcode in (0x84, 0x85):
+			self.loopback = opcode == 0x84
+		elif opcode == 0x86:
+			self.clockDivisor = args[0] | args[1]<<8
+		elif opcode == 0x87:
+			pass # read data is always available immediately
+		elif opcode in (0x88, 0x89, 0x94, 0x95):
+			self.waitOnIo = opcode in (0x88, 0x94)
+		elif opcode in (0x8A, 0x8B):
+			self.clockDivideByFive = opcode == 0x8B
+		elif opcode in (0x8C, 0x8D):
+			self.threePhaseClocking = opcode == 0x8C
+		elif opcode == 0x8E:
+			self._clock(args[0] + 1)
+		elif opcode == 0x8F:
+			self._clock(((args[0] | args[1]<<8) + 1) * 8)
+		elif opcode in (0x96, 0x97):
+			self.adaptiveClocking = opcode == 0x96
+		elif opcode in (0x9C, 0x9D):
+			self._clock(((args[0] | args[1]<<8) + 1) * 8)
+		elif opcode == 0x9E:
+			pass # open drain outputs do not change the logic levels
+		elif _isShift(opcode):
+			self._shift(opcode, args)
+		else:
+			self.readBuffer.extend((BAD_COMMAND, opcode))
+
+	def clockFrequency(self):
+		"TCK frequency of the current clock settings, in Hz."
+		base = 12e6 if self.clockDivideByFive else 60e6
+		return base / ((1 + self.clockDivisor) * 2)
+
+	def _readShift(self, data):
+		"Return the data shifted in, all ones if clocked too fast."
+		if (self.maxClockFrequency is not None and
+				self.clockFrequency() > self.maxClockFrequency):
+			data = bytearray((0xFF,)) * len(data)
+		self.readBuffer.extend(data)
+
+	def _pin(self, pin):
+		return bool(self.value[0] & pin)
+
+	def _setPin(self, pin, state):
+		if state:
+			self.value[0] |= pin
+		else:
+			self.value[0] &= ~pin
+
+	def _clock(self, count):
+		self.clockCount += count
+		if self.target:
+			tdi, tms = self._pin(_TDI), self._pin(_TMS)
+			for i in range(count):
+				self.target.clock(tdi, tms)
+
+	def _tdo(self, tdi, tms):
+		if self.target:
+			tdo = self.target.clock(tdi, tms)
+		else:
+			tdo = self.getIo(0) & _TDO
+		if self.loopback:
+			tdo = tdi
+		return bool(tdo)
+
+	def _shiftBits(self, bits):
+		"Clock out bits on TDI, return the sampled TDO bits."
+		self.clockCount += len(bits)
+		tms = self._pin(_TMS)
+		result = [self._tdo(bit, tms) for bit in bits]
+		self._setPin(_TDI, bits[-1])
+		return result
+
+	def _shiftTms(self, bits):
+		"Clock out bits on TMS, return the sampled TDO bits."
+		self.clockCount += len(bits)
+		tdi = self._pin(_TDI)
+		result = [self._tdo(tdi, bit) for bit in bits]
+		self._setPin(_TMS, bits[-1])
+		return result
+
+	def _shift(self, opcode, args):
+		lsbFirst = bool(opcode & _LSB_FIRST)
+		read = bool(opcode & _READ_TDO)
+		if opcode & _BIT_MODE:
+			count = args[0] + 1
+			if opcode & _WRITE_TMS:
+				byte = args[1]
+				self._setPin(_TDI, byte & 0x80)
+				tms = [bool(byte >> i & 1) for i in range(count)]
+				result = self._shiftTms(tms)
+			else:
+				if opcode & _WRITE_TDI:
+					byte = args[1]
+				else:
+					byte = 0xFF if self._pin(_TDI) else 0x00
+				if lsbFirst:
+					bits = [bool(byte >> i & 1) for i in range(count)]
+				else:
+					bits = [bool(byte >> (7-i) & 1)
+						for i in range(count)]
+				result = self._shiftBits(bits)
+			if read:
+				byte = 0
+				for bit in result:
+					if lsbFirst:
+						byte = byte >> 1 | bit << 7
+					else:
+						byte = (byte << 1 | bit) & 0xFF
+				self._readShift(bytearray((byte,)))
+			return
+		count = (args[0] | args[1]<<8) + 1
+		if opcode & _WRITE_TDI:
+			data = args[2:]
+		else:
+			idle = 0xFF if self._pin(_TDI) else 0x00
+			data = bytearray((idle,)) * count
+		if not self.target:
+			# fast path, no need to look at the single bits
+			self.clockCount += 8*count
+			if self.loopback:
+				result = data
+			else:
+				tdo = 0xFF if self.getIo(0) & _TDO else 0x00
+				result = bytearray((tdo,)) * count
+			if read:
+				self._readShift(result)
+			self._setPin(_TDI, data[-1] & (0x80 if lsbFirst else 0x01))
+			return
+		result = bytearray()
+		for byte in data:
+			if lsbFirst:
+				bits = [bool(byte >> i & 1) for i in range(8)]
+			else:
+				bits = [bool(byte >> (7-i) & 1) for i in range(8)]
+			byte = 0
+			for i, bit in enumerate(self._shiftBits(bits)):
+				if lsbFirst:
+					byte |= bit << i
+				else:
+					byte |= bit << (7-i)
+			result.append(byte)
+		if read:
+			self._readShift(result)
+
+class UsbDevice:
+	"""
+	Fake pyusb device for ftdi_pyusb, interface A is the emulator.
+	Handles the FTDI vendor requests and the bulk endpoints,
+	every packet read starts with the two modem status bytes.
+	"""
+	def __init__(self, emulator, bcdDevice=0x700, packetSize=512):
+		self.emulator = emulator
+		self.idVendor = 0x0403
+		self.idProduct = 0x6010
+		self.bcdDevice = bcdDevice
+		self.serial_number = emulator.serialNumber
+		self.product = emulator.description
+		self.packetSize = packetSize
+		self.modemStatus = "\x31\x60"
+		self.packetsRead = 0
+
+	def ctrl_transfer(self, bmRequestType, bRequest, wValue=0, wIndex=0,
+			data_or_wLength=None, timeout=None):
+		assert bmRequestType == 0x40
+		if bRequest == 0x03:
+			self.emulator.setBaudRate(self._baudRate(wValue, wIndex))
+			return 0
+		assert wIndex == 1
+		if bRequest == 0x00 and wValue == 0:
+			self.emulator.resetDevice()
+		elif bRequest == 0x00:
+			self.emulator.purge()
+		elif bRequest == 0x09:
+			self.emulator.setLatencyTimer(wValue)
+		elif bRequest == 0x0B:
+			self.emulator.setBitMode(wValue & 0xFF, wValue >> 8)
+		return 0
+
+	def _baudRate(self, wValue, wIndex):
+		"""
+		Baud rate of a SET_BAUDRATE request. Multi-channel types have the
+		channel in the low byte of wIndex and the high divisor bits above.
+		"""
+		if self.bcdDevice in (0x500, 0x700, 0x800, 0x900):
+			assert wIndex & 0xFF == 1
+			wIndex >>= 8
+		divisor = wValue | wIndex<<16
+		if divisor in (0, 1):
+			eighths = (8, 12)[divisor] # 3 and 2 MBaud
+		else:
+			eighths = 8*(divisor & 0x3FFF) + (0, 4, 2, 1, 3, 5, 6, 7)[
+				divisor>>14]
+		return 8*3e6/eighths
+
+	def write(self, endpoint, data, timeout=None):
+		assert endpoint == 0x02
+		return self.emulator.write(data)
+
+	def read(self, endpoint, size, timeout=None):
+		"Packets up to size bytes, up to the first short one."
+		assert endpoint == 0x81
+		result = bytearray()
+		while size > len(self.modemStatus):
+			packetSize = min(size, self.packetSize)
+			data = self.emulator.read(packetSize - len(self.modemStatus))
+			result += self.modemStatus + data
+			self.packetsRead += 1
+			size -= packetSize
+			if len(data) + len(self.modemStatus) < packetSize:
+				break
+		return array.array("B", str(result))
+
+def test():
+	"Basic module self-test."
+	print "Module 'emulator' self test:"
+	e = MpsseEmulator(None)
+	e.setBitMode(0, _MPSSE)
+	e.inputValue = 0xA500
+	e.write("\x80\x3C\x0F\x82\xC3\xF0\x81\x83")
+	assert e.read(2) == "\x0C\xC5"
+	e.write("\xAA\xAB")
+	assert e.read(4) == "\xFA\xAA\xFA\xAB"
+	e.write("\x84")
+	e.write("\x3B\x04\x15")
+	assert e.read(1) == "\xA8"
+	e.write("\x33\x04\xA8")
+	assert e.read(1) == "\x15"
+	e.write("\x39\x02\x00\x01")
+	e.write("\x02\xF0")
+	assert e.read(4) == "\x01\x02\xF0"
+	e.write("\x6B\x02\x83")
+	assert e.read(1) == "\xE0"
+	assert e.value[0] & _TMS == 0
+	e.write("\x85\x86\x3B\x00\x8A")
+	assert e.clockDivisor == 0x3B and not e.clockDivideByFive
+	clockCount = e.clockCount
+	e.write("\x8F\x01\x00\x8E\x02")
+	assert e.clockCount == clockCount + 16 + 3
+	e.maxReadChunk = 2
+	e.write("\x81\x81\x81")
+	assert len(e.read(3)) == 2
+	assert len(e.read(3)) == 1
+	e.maxReadChunk = None
+	e.setBitMode(0x0F, _SYNC)
+	e.inputValue = 0xF0
+	e.write("\x01\x02\x03")
+	assert e.read(3) == "\xF0\xF1\xF2"
+	print "emulator test done"
+
+if __name__ == "__main__":
+	test()
@@ -0,0 +1,84 @@
+#!/usr/bin/env python2
+# Christian Unhold, DICE GmbH & Co KG
+"""
+Facade for the FTDI modules: everything of ftdi_mpsse, and functions to open
+an Mpsse on a transport module that is chosen and imported on first use.
+The backend is the one named by the environment variable FTDI_BACKEND, or
+else the first one of BACKENDS that can be imported, including a library it
+imports on first use, like PyUSB. Importing this module does not load any
+driver library.
+Performs a basic test program when executed directly.
+"""
+
+import os
+from ftdi_mpsse import *
+
+BACKENDS = ("d2xx", "libftdi", "pyusb")
+
+_backend = None
+
+def setBackend(name):
+	"""
+	Select the transport module ftdi_<name>, e.g. 'd2xx' or 'libftdi'.
+	Raise ImportError if it or a library it needs is missing.
+	"""
+	global _backend
+	backend = __import__("ftdi_" + name)
+	if hasattr(backend, "load"):
+		backend.load()
+	_backend = backend
+
+def getBackend():
+	"The transport module, selected on first use."
+	if _backend is None:
+		names = BACKENDS
+		if os.environ.get("FTDI_BACKEND"):
+			names = (os.environ["FTDI_BACKEND"],)
+		for name in names:
+			try:
+				setBackend(name)
+				break
+			except ImportError:
+				pass
+		else:
+			raise EnvironmentError("no FTDI backend available of %s" %
+				(", ".join(names),))
+	return _backend
+
+def open(lowByteValue=MASK.SPI_S, lowByteDirection=MASK.SPI_O, index=0):
+	"Open the index-th device."
+	return Mpsse(getBackend().openIndex(index),
+		lowByteValue, lowByteDirection)
+
+def openFirst(lowByteValue=MASK.SPI_S, lowByteDirection=MASK.SPI_O):
+	return open(lowByteValue, lowByteDirection)
+
+def openBySerialNumber(serialNumber,
+		lowByteValue=MASK.SPI_S,
+		lowByteDirection=MASK.SPI_O):
+	return Mpsse(getBackend().openBySerialNumber(serialNumber),
+		lowByteValue, lowByteDirection)
+
+def openDevice(vendor, product, lowByteValue, lowByteDirection,
+		serialNumber=None):
+	return Mpsse(getBackend().openDevice(vendor, product, serialNumber),
+		lowByteValue, lowByteDirection)
+
+def test():
+	"Basic module self-test, with the first device attached."
+	print "Module 'ftdi' self test:"
+	with open(MASK.SPI_S, 0) as mpsse:
+		assert mpsse.checkReadBufferEmpty()
+		mpsse.readTimeout = 100
+		mpsse.reset()
+		assert mpsse.checkReadBufferEmpty()
+		mpsse.execute(SetClockDivisor(0))
+		mpsse.lsbFirst = True
+		ioTest(mpsse)
+		print "ioTest done"
+		shiftTest(mpsse)
+		print "shiftTest done"
+		assert mpsse.checkReadBufferEmpty()
+
+if __name__ == "__main__":
+	test()
@@ -1,710 +1,163 @@
 #!/usr/bin/env python2
 # Christian Unhold, DICE GmbH & Co KG
 """
-Abstraction layer for FTDI USB interface chips.
-Uses pylibftdi, the minimal Pythonic interface to FTDI devices using libftdi
+Transport for ftdi_mpsse using libftdi.
+Uses the ftdi1 Python binding of libftdi
 from http://www.intra2net.com/en/developer/libftdi/, Debian package python-ftdi
-Performs a basic test program when executed directly.
 """
 
 # https://pypi.python.org/pypi/pylibftdi # TODO
 
-import ftdi1, ctypes
+import ftdi1, ctypes, ctypes.util
+from ftdi_mpsse import DEVICE
 
-class BIT_MODE:
-	"""
-	Bit modes for the FT2232 and other compatible FTDI devices.
-	(FTDI AN2232-02)
-	"""
-	RESET = ftdi1.BITMODE_RESET
-	ASYNC = ftdi1.BITMODE_BITBANG
-	MPSSE = ftdi1.BITMODE_MPSSE
-	SYNC  = ftdi1.BITMODE_SYNCBB
-	MCU   = ftdi1.BITMODE_MCU
-	OPTO  = ftdi1.BITMODE_OPTO
-	UNDEF = 0xFF
-
-class BYTE:
-	"Name the I/O port of an FTDI device."
-	LOW  = 0
-	HIGH = 1
-
-class PIN:
-	"Pin masks for the I/O pins. (FTDI FT2232H DS)"
-	ADBUS0 = BDBUS0 = TCK = SK = 1<<0
-	ADBUS1 = BDBUS1 = TDI = DO = 1<<1
-	ADBUS2 = BDBUS2 = TDO = DI = 1<<2
-	ADBUS3 = BDBUS3 = TMS = CS = 1<<3
-	ADBUS4 = BDBUS4 = GPIOL0 = 1<<4
-	ADBUS5 = BDBUS5 = GPIOL1 = 1<<5
-	ADBUS6 = BDBUS6 = GPIOL2 = 1<<6
-	ADBUS7 = BDBUS7 = GPIOL3 = 1<<7
-	ACBUS0 = BCBUS0 = GPIOH0 = 1<<8
-	ACBUS1 = BCBUS1 = GPIOH1 = 1<<9
-	ACBUS2 = BCBUS2 = GPIOH2 = 1<<10
-	ACBUS3 = BCBUS3 = GPIOH3 = 1<<11
-	ACBUS4 = BCBUS4 = GPIOH4 = 1<<12
-	ACBUS5 = BCBUS5 = GPIOH5 = 1<<13
-	ACBUS6 = BCBUS6 = GPIOH6 = 1<<14
-	ACBUS7 = BCBUS7 = GPIOH7 = 1<<15
-
-class MASK:
-	"Combined pin masks for the I/O pins."
-	JTAG_I = SPI_I = I2C_I = PIN.TDO
-	JTAG_O = SPI_O = PIN.TCK|PIN.TDI|PIN.TMS
-	I2C_O = PIN.SK|PIN.DO
-	JTAG_IO = SPI_IO = JTAG_I|JTAG_O
-	JTAG_S = SPI_S = PIN.TMS
-
-class FLAG:
-	"Flags for MPSSE mode."
-	WRITE_NEGEDGE = 0x01
-	BIT_MODE      = 0x02
-	READ_NEGEDGE  = 0x04
-	LSB_FIRST     = 0x08
-	WRITE_TDI     = 0x10
-	READ_TDO      = 0x20
-	WRITE_TMS     = 0x40
-
-class EDGE:
-	"Name the polarity of an edge."
-	POS = 0
-	NEG = 1
-
-EXTENDED_DEVICES = (
-	ftdi1.TYPE_2232C,
-	ftdi1.TYPE_2232H,
-	ftdi1.TYPE_4232H)
-
-MPSSE_DEVICES = (
-	ftdi1.TYPE_2232C,
-	ftdi1.TYPE_2232H,
-	ftdi1.TYPE_4232H)
-
-HIGHSPEED_DEVICES = (
-	ftdi1.TYPE_2232H,
-	ftdi1.TYPE_4232H)
+DEVICE_TYPES = {
+	ftdi1.TYPE_AM: DEVICE.AM,
+	ftdi1.TYPE_BM: DEVICE.BM,
+	ftdi1.TYPE_2232C: DEVICE.FT2232C,
+	ftdi1.TYPE_R: DEVICE.FT232R,
+	ftdi1.TYPE_2232H: DEVICE.FT2232H,
+	ftdi1.TYPE_4232H: DEVICE.FT4232H,
+	ftdi1.TYPE_232H: DEVICE.FT232H}
 
 def _ftdi1_check(context, function, *args):
-	if function == ftdi1.write_data:
-		writeData, writeCount = args
 	result = function(context, *args)
 	if result < 0:
 		error_string = ftdi1.get_error_string(context)
 		raise EnvironmentError(error_string)
 	return result
 
-def _ftdi1_read(ftdiContext, readCount):
-	actualReadCount, readData = _ftdi1_check(ftdiContext, ftdi1.read_data,
-							readCount)
-	if actualReadCount == 0:
-		return ""
-	assert actualReadCount == len(readData)
-	return readData
-
-class Ftdi:
-	"Basic interface for an FTDI device."
-	def __init__(self, handle, lowByteDirection):
-		self.handle = handle
-		self.lowByteDirection = lowByteDirection
-		self.bitMode = BIT_MODE.RESET
-		self.readTimeout = 1000 # ms
-		self.writeTimeout = 1000 # ms
-		self.receiveBufferTimeout = 16 # ms
-		self.reset()
-
-	def __enter__(self):
-		return self
-
-	def __exit__(self, exc_type, exc_value, traceback):
-		self.__del__()
-
-	def __del__(self):
-		try:
-			self.handle.resetDevice()
-			self.handle.close()
-			del self.handle
-		except AttributeError:
-			pass
-
-	def reset(self):
-		"Reset the device."
-		h = self.handle
-		_ftdi1_check(h, ftdi1.usb_reset)
-		_ftdi1_check(h, ftdi1.usb_purge_buffers)
-		if h.type in EXTENDED_DEVICES:
-			_ftdi1_check(h, ftdi1.set_latency_timer,
-					self.receiveBufferTimeout)
-		h.usb_read_timeout = self.readTimeout
-		h.usb_write_timeout = self.writeTimeout
-		_ftdi1_check(h, ftdi1.set_bitmode, self.lowByteDirection,
-				self.bitMode)
-		_ftdi1_check(h, ftdi1.usb_reset)
-		_ftdi1_check(h, ftdi1.usb_purge_buffers)
-
-	def execute(self, command):
-		"Execute a command on the device."
-		assert self.bitMode in command.bitModes
-		if isinstance(command, ClockDivideByFive):
-			assert self.deviceInfo["type"] in HIGHSPEED_DEVICES
-		writeData = command.getWriteData(self)
-		readCount = command.getReadCount(self)
-		if not writeData:
-			assert readCount == 0
-			return
-		writeCount = _ftdi1_check(self.handle, ftdi1.write_data,
-						writeData, len(writeData))
-		assert writeCount == len(writeData)
-		if readCount != 0:
-			readData = _ftdi1_read(self.handle, readCount)
-			command.setReadData(self, readData)
-			return command.result
-
-	def executeListSimple(self, commandList):
-		"Execute a list of commands. Simple and inefficient."
-		for command in commandList:
-			self.execute(command)
-
-	def executeList(self, commandList):
-		"Execute a list of commands."
-		writeData = []
-		readCount = 0
-		for command in commandList:
-			assert self.bitMode in command.bitModes
-			if isinstance(command, ClockDivideByFive):
-				assert self.handle.type in HIGHSPEED_DEVICES
-			writeData.append(command.getWriteData(self))
-			readCount += command.getReadCount(self)
-		writeData = "".join(writeData)
-		if not writeData:
-			assert readCount == 0
-			return
-		writeCount = _ftdi1_check(self.handle, ftdi1.write_data,
-						writeData, len(writeData))
-		if readCount != 0:
-			readData = _ftdi1_read(self.handle, readCount)
-			readIndex = 0
-			for command in commandList:
-				subReadCount = command.getReadCount(self)
-				if subReadCount != 0:
-					begin = readIndex
-					end = readIndex + subReadCount
-					subReadData = readData[begin:end]
-					command.setReadData(self, subReadData)
-					readIndex += subReadCount
-			assert readIndex == readCount
-
-	def checkReadBufferEmpty(self):
-		readData = _ftdi1_read(self.handle, 1)
-		if readData == "":
-			return True
-		else:
-			print "Ftdi.checkReadBuffer:", readData.encode("hex")
-			return False
-
-class Mpsse(Ftdi):
-	"MPSSE interface of an FTDI device."
-	def __init__(self, handle, lowByteValue, lowByteDirection):
-		assert handle.type in MPSSE_DEVICES
-		self.handle = handle
-		self.resetLowByteValue = lowByteValue
-		self.lowByteDirection = lowByteDirection
-		self.bitMode = BIT_MODE.MPSSE
-		self.readTimeout = 1000 # ms
-		self.writeTimeout = 1000 # ms
-		self.receiveBufferTimeout = 16 # ms
-		self.lsbFirst = False
-		self.reset()
-
-	__enter__ = Ftdi.__enter__
-	__exit__ = Ftdi.__exit__
-	__del__ = Ftdi.__del__
-
-	def reset(self):
-		"Reset the device and setup for MPSSE mode."
-		Ftdi.reset(self)
-		def clearMpsseBuffer():
-			sendImmediate = SendImmediate()
-			commandList = [sendImmediate for i in range(65537)]
-			self.executeList(commandList)
-		clearMpsseBuffer()
-		Ftdi.reset(self)
-		resetCommandList = [Loopback(False),
-					SetIo(self.resetLowByteValue,
-						self.lowByteDirection,
-						BYTE.LOW)]
-		if self.handle.type in HIGHSPEED_DEVICES:
-			resetCommandList += [ClockDivideByFive(True)]
-				# compatible with low-speed by default
-		self.executeList(resetCommandList)
-
-class Command:
-	def getReadCount(self, ftdi):
-		return 0
-
-class CommandContainer(Command):
-	def __init__(self):
-		self.subCommands = []
-
-	def getWriteData(self, ftdi):
-		return "".join([command.getWriteData(ftdi) for
-				command in self.subCommands])
-
-	def getReadCount(self, ftdi):
-		return sum([command.getReadCount(ftdi) for
-				command in self.subCommands])
-
-	def setReadData(self, ftdi, readData):
-		assert len(readData) == self.getReadCount(ftdi)
-		self.result = readData
-
-class Loopback(Command):
-	"Enable/disable internal connection between TDI/DO and TDO/DI."
-	def __init__(self, enableLoopback):
-		self.enableLoopback = enableLoopback
-		self.bitModes = (BIT_MODE.MPSSE,)
-
-	def getWriteData(self, mpsse):
-		if self.enableLoopback:
-			return "\x84"
-		else:
-			return "\x85"
-
-class ClockDivideByFive(Command):
-	"""
-	Only for FT2232H, FT4232H!
-	Enable/disable divide by 5 from the 60 MHz clock in the FTDI device.
-	"""
-	def __init__(self, enableClockDivideByFive):
-		self.enableClockDivideByFive = enableClockDivideByFive
-		self.bitModes = (BIT_MODE.MPSSE,)
-
-	def getWriteData(self, mpsse):
-		if self.enableClockDivideByFive:
-			return "\x8B"
-		else:
-			return "\x8A"
-
-class ThreePhaseClocking(Command):
-	"""
-	Only for FT2232H, FT4232H!
-	Enable/disable three phase data clocking:
-	Data setup, pulse clock, data hold.
-	"""
-	def __init__(self, enableThreePhaseClocking):
-		self.enableThreePhaseClocking = enableThreePhaseClocking
-		self.bitModes = (BIT_MODE.MPSSE,)
-
-	def getWriteData(self, mpsse):
-		if self.enableThreePhaseClocking:
-			return "\x8C"
+_libftdi1 = None
+
+def _libftdi1_function(name):
+	"""
+	Function of the libftdi1 shared library,
+	for the asynchronous transfers not wrapped by ftdi1.
+	"""
+	global _libftdi1
+	if _libftdi1 is None:
+		library = ctypes.CDLL(ctypes.util.find_library("ftdi1"))
+		for submit in (library.ftdi_write_data_submit,
+				library.ftdi_read_data_submit):
+			submit.restype = ctypes.c_void_p
+			submit.argtypes = (ctypes.c_void_p, ctypes.c_void_p,
+				ctypes.c_int)
+		library.ftdi_transfer_data_done.argtypes = (ctypes.c_void_p,)
+		_libftdi1 = library
+	return getattr(_libftdi1, "ftdi_" + name)
+
+class _AsyncTransfer:
+	"A bulk transfer in flight, submitted to libftdi without waiting."
+	def __init__(self, context, writeData=None, readCount=0, readBuffer=None):
+		self.context = context
+		self.readBuffer = readBuffer
+		if writeData is not None:
+			self.size = len(writeData)
+			self.buffer = ctypes.create_string_buffer(writeData, self.size)
+			name = "write_data_submit"
 		else:
-			return "\x8D"
-
-class SetClockDivisor(Command):
-	"""
-	Set the clock divisor. The TCK/SK always has a duty cycle of 50%,
-	except between commands where it will remain in its initial state.
-	F(TCK/SK) = F(FTDI) / (( 1 + clockDivisorValue) * 2)
-	with F(FTDI) = 12MHz or 60MHz for high-speed devices
-	with clock divider off.
-	"""
-	def __init__(self, clockDivisorValue):
-		assert clockDivisorValue <= 0xFFFF
-		self.clockDivisor = clockDivisorValue
-		self.bitModes = (BIT_MODE.MPSSE,)
-
-	def getWriteData(self, mpsse):
-		return ("\x86" + chr(self.clockDivisor & 0xFF) +
-			chr(self.clockDivisor >> 8))
-
-class SetClockFrequency(Command):
-	"""
-	Set the clock frequency by using SetClockDivisor
-	and ClockDivideByFive for high-speed devices.
-	"""
-	def __init__(self, clockFrequency):
-		self.clockFrequency = clockFrequency
-		self.bitModes = (BIT_MODE.MPSSE,)
-
-	def getWriteData(self, mpsse):
-		minFrequency = 6e6 / 0x1000
-		assert self.clockFrequency >= minFrequency
-		if mpsse.deviceInfo["type"] in HIGHSPEED_DEVICES:
-			minHsFrequency = 30e6 / 0x1000
-			divide = False
-			divisor = 30e6 / self.clockFrequency - 1
-			if self.clockFrequency < minHsFrequency:
-				divide = True
-				divisor = 6e6 / self.clockFrequency - 1
-			divint = int(round(divisor))
-			return (ClockDivideByFive(divide).getWriteData(mpsse) +
-				SetClockDivisor(divint).getWriteData(mpsse))
-		else:
-			divisor = 6e6 / self.clockFrequency - 1
-			divint = int(round(divisor))
-			return SetClockDivisor(divint).getWriteData(mpsse)
-
-class SendImmediate(Command):
-	"Make the FTDI flush its buffer back to the PC."
-	def __init__(self):
-		self.bitModes = (BIT_MODE.MPSSE, BIT_MODE.MCU)
-
-	def getWriteData(self, ftdi):
-		return "\x87"
-
-class SetIo(Command):
-	"""
-	Setup the direction of the I/O lines and
-	force a value on the bits that are set as output.
-	"""
-	def __init__(self, value, direction, lowHighByte=BYTE.LOW):
-		self.bitModes = (BIT_MODE.MPSSE,)
-		assert lowHighByte in (BYTE.LOW, BYTE.HIGH)
-		self.lowHighByte = lowHighByte
-		self.value = value
-		self.direction = direction
-
-	def getWriteData(self, ftdi):
-		if self.lowHighByte == BYTE.LOW:
-			opcode = "\x80"
-		elif self.lowHighByte == BYTE.HIGH:
-			opcode = "\x82"
-		return opcode + chr(self.value) + chr(self.direction)
-
-class GetIo:
-	"Read the current state of the I/O lines."
-	def __init__(self, lowHighByte):
-		self.bitModes = (BIT_MODE.MPSSE,)
-		assert lowHighByte in (BYTE.LOW, BYTE.HIGH)
-		self.lowHighByte = lowHighByte
-
-	def getWriteData(self, mpsse):
-		if self.lowHighByte == BYTE.LOW:
-			return "\x81"
-		elif self.lowHighByte == BYTE.HIGH:
-			return "\x83"
-
-	def getReadCount(self, mpsse):
-		return 1
-
-	def setReadData(self, mpsse, readData):
-		assert len(readData) == 1
-		self.result = ord(readData)
-
-class WaitOnIo(Command):
-	"""
-	Wait until GPIOL1 (MPSSE mode) or I/O1 (MCU mode)
-	is in a certain state then process the next instruction.
-	The only way out of this is to disable the FTDI
-	if the I/O never goes into the state.
-	"""
-	def __init__(self, stateToWaitFor):
-		self.bitModes = (BIT_MODE.MPSSE, BIT_MODE.MCU)
-		self.stateToWaitFor = stateToWaitFor
-
-	def getWriteData(self, mpsse):
-		if self.stateToWaitFor:
-			return "\x88"
-		else:
-			return "\x89"
-
-class ShiftInBit(Command):
-	def __init__(self, bitCount):
-		self.bitModes = (BIT_MODE.MPSSE,)
-		assert bitCount >= 1
-		assert bitCount <= 8
-		self.bitCount = bitCount
-		self.opcode = FLAG.READ_TDO|FLAG.BIT_MODE
-
-	def getWriteData(self, mpsse):
-		opcode = self.opcode
-		if mpsse.lsbFirst: opcode |= FLAG.LSB_FIRST
-		return chr(opcode) + chr(self.bitCount-1)
-
-	def getReadCount(self, mpsse):
-		return 1
-
-	def setReadData(self, mpsse, readData):
-		assert len(readData) == 1
-		data = ord(readData)
-		if mpsse.lsbFirst:
-			data >>= 8 - self.bitCount
-		self.result = chr(data & self.getMask())
-
-	def getMask(self):
-		return (1 << self.bitCount) - 1
-
-class ShiftOutBit(Command):
-	def __init__(self, bitCount, writeData):
-		self.bitModes = (BIT_MODE.MPSSE,)
-		assert bitCount > 0
-		assert bitCount <= 8
-		self.bitCount = bitCount
-		assert len(writeData) == 1
-		self.writeData = writeData
-		self.opcode = FLAG.WRITE_TDI|FLAG.BIT_MODE|FLAG.WRITE_NEGEDGE
-
-	def getWriteData(self, mpsse):
-		opcode = self.opcode
-		data = ord(self.writeData)
-		if mpsse.lsbFirst:
-			opcode |= FLAG.LSB_FIRST
-		else:
-			if self.bitCount != 8:
-				data &= self.getMask()
-				addTrail = data & 1 != 0
-				data <<= 8 - self.bitCount
-				if addTrail:
-					data |= 1 << (8 - self.bitCount - 1)
-		return chr(opcode) + chr(self.bitCount - 1) + chr(data)
-
-	def getMask(self):
-		return (1 << self.bitCount) - 1
-
-class ShiftInOutBit(ShiftOutBit, ShiftInBit):
-	def __init__(self, bitCount, writeData):
-		ShiftInBit.__init__(self, bitCount)
-		ShiftOutBit.__init__(self, bitCount, writeData)
-		self.opcode = (FLAG.WRITE_TDI|FLAG.READ_TDO|FLAG.BIT_MODE|
-			FLAG.WRITE_NEGEDGE)
-
-	def getReadCount(self, mpsse):
-		return 1
-
-class ShiftInByte(Command):
-	def __init__(self, byteCount):
-		self.bitModes = (BIT_MODE.MPSSE,)
-		assert byteCount > 0
-		assert byteCount <= 0x1000
-		self.byteCount = byteCount
-		self.resultReceiver = None
-		self.opcode = FLAG.READ_TDO
-
-	def getWriteData(self, mpsse):
-		count = self.byteCount - 1
-		opcode = self.opcode
-		if mpsse.lsbFirst:
-			opcode |= FLAG.LSB_FIRST
-		return chr(opcode) + chr(count&0xff) + chr(count>>8)
-
-	def getReadCount(self, mpsse):
-		return self.byteCount
-
-	def setReadData(self, mpsse, readData):
-		assert len(readData) == self.getReadCount(mpsse)
-		self.result = readData
-		if self.resultReceiver:
-			self.resultReceiver.result = readData
-
-class ShiftOutByte(Command):
-	def __init__(self, writeData):
-		self.bitModes = (BIT_MODE.MPSSE,)
-		assert len(writeData) <= 0x1000
-		self.writeData = writeData
-		self.opcode = FLAG.WRITE_TDI|FLAG.WRITE_NEGEDGE
-
-	def getWriteData(self, mpsse):
-		count = len(self.writeData) - 1
-		opcode = self.opcode
-		if mpsse.lsbFirst:
-			opcode |= FLAG.LSB_FIRST
-		return (chr(opcode) + chr(count&0xff) + chr(count>>8) +
-			self.writeData)
-
-class ShiftInOutByte(ShiftOutByte, ShiftInByte):
-	def __init__(self, writeData):
-		ShiftInByte.__init__(self, len(writeData))
-		ShiftOutByte.__init__(self, writeData)
-		self.opcode = (FLAG.WRITE_TDI|FLAG.READ_TDO|FLAG.WRITE_NEGEDGE)
-
-	def getReadCount(self, mpsse):
-		return self.byteCount
-
-class ShiftOut(CommandContainer):
-	def __init__(self, bitCount, writeData):
-		CommandContainer.__init__(self)
-		self.bitModes = (BIT_MODE.MPSSE,)
-		self.bitCount = bitCount
-		self.writeData = writeData
-		bits = bitCount%8
-		bytes = bitCount/8
-		offset = 0
-		if bits:
-			self.subCommands.append(
-				ShiftOutBit(bits, self.writeData[0]))
-			offset = 1
-		if bytes:
-			self.subCommands.append(
-				ShiftOutByte(self.writeData[offset:]))
-
-class ShiftIn(CommandContainer):
-	def __init__(self, bitCount):
-		CommandContainer.__init__(self)
-		self.bitModes = (BIT_MODE.MPSSE,)
-		self.bitCount = bitCount
-		bits = bitCount%8
-		bytes = bitCount/8
-		if bits:
-			self.subCommands.append(ShiftInBit(bits))
-		if bytes:
-			self.subCommands.append(ShiftInByte(bytes))
-
-class ShiftInOut(CommandContainer):
-	def __init__(self, bitCount, writeData):
-		CommandContainer.__init__(self)
-		self.bitModes = (BIT_MODE.MPSSE,)
-		self.bitCount = bitCount
-		self.writeData = writeData
-		bits = bitCount%8
-		bytes = bitCount/8
-		offset = 0
-		if bits:
-			self.subCommands.append(
-				ShiftInOutBit(bits, self.writeData[0]))
-			offset = 1
-		if bytes:
-			self.subCommands.append(
-				ShiftInOutByte(self.writeData[offset:]))
-
-class ShiftTms(Command):
-	"Clock data to TMS pin."
-	def __init__(self, data):
-		self.bitModes = (BIT_MODE.MPSSE,)
-		assert len(data) <= 7
-		self.data = data
-
-	def getWriteData(self, mpsse):
-		length = len(self.data)
-		byte = 0
-		for i in range(length):
-			if self.data[-i] in (1, "1", "H"):
-				byte |= 1<<i
-		return "\x4A" + chr(length-1) + chr(byte)
-
-class Clock(Command):
-	"Clock without data transfer."
-	def __init__(self, count):
-		self.bitModes = (BIT_MODE.MPSSE,)
-		self.count = count
-
-	def getWriteData(self, mpsse):
-		result = ""
-		byteCount = self.count/8
-		bitCount = self.count%8
-		if bitCount:
-			result += "\x8E" + chr(bitCount)
-		if byteCount:
-			result += ("\x8F" + chr(byteCount&0xFF) +
-					chr(byteCount>>8))
-		return result
-
-def openBySerialNumber(serialNumber,
-		lowByteValue = MASK.SPI_S,
-		lowByteDirection = MASK.SPI_O):
-	return Mpsse(d2xx.openEx(serialNumber, d2xx.OPEN_BY_SERIAL_NUMBER),
-		lowByteValue, lowByteDirection)
-
-def openFirst(lowByteValue = MASK.SPI_S, lowByteDirection = MASK.SPI_O):
-	return Mpsse(d2xx.open(0), lowByteValue, lowByteDirection)
-
-def openDevice(vendor, product, lowByteValue, lowByteDirection):
+			self.size = readCount
+			self.buffer = ctypes.create_string_buffer(readCount)
+			name = "read_data_submit"
+		self.control = _libftdi1_function(name)(int(context.this),
+			self.buffer, self.size)
+		if not self.control:
+			raise EnvironmentError(ftdi1.get_error_string(context))
+
+	def done(self):
+		"Wait for the transfer to complete, return the count transferred."
+		count = _libftdi1_function("transfer_data_done")(self.control)
+		if count < 0:
+			raise EnvironmentError(ftdi1.get_error_string(self.context))
+		if self.readBuffer is not None:
+			self.readBuffer[:count] = ctypes.string_at(self.buffer, count)
+		return count
+
+class Transport:
+	"libftdi context with the transport interface of ftdi_mpsse."
+	def __init__(self, context, serialNumber="", description=""):
+		self.context = context
+		self.deviceInfo = {
+			"type": DEVICE_TYPES.get(context.type, DEVICE.UNKNOWN),
+			"serial": serialNumber,
+			"description": description}
+
+	def getDeviceInfo(self):
+		return self.deviceInfo
+
+	def resetDevice(self):
+		_ftdi1_check(self.context, ftdi1.usb_reset)
+
+	def purge(self):
+		_ftdi1_check(self.context, ftdi1.usb_purge_buffers)
+
+	def setLatencyTimer(self, latencyTimer):
+		_ftdi1_check(self.context, ftdi1.set_latency_timer, latencyTimer)
+
+	def setTimeouts(self, readTimeout, writeTimeout):
+		self.context.usb_read_timeout = readTimeout
+		self.context.usb_write_timeout = writeTimeout
+
+	def setBitMode(self, mask, bitMode):
+		_ftdi1_check(self.context, ftdi1.set_bitmode, mask, bitMode)
+
+	def setBaudRate(self, baudRate):
+		"Without the factor of 4 libftdi applies in bit-bang mode."
+		bitbangEnabled = self.context.bitbang_enabled
+		self.context.bitbang_enabled = 0
+		try:
+			_ftdi1_check(self.context, ftdi1.set_baudrate, baudRate)
+		finally:
+			self.context.bitbang_enabled = bitbangEnabled
+
+	def write(self, writeData):
+		return _ftdi1_check(self.context, ftdi1.write_data,
+			writeData, len(writeData))
+
+	def read(self, readCount):
+		actualReadCount, readData = _ftdi1_check(self.context,
+			ftdi1.read_data, readCount)
+		if actualReadCount == 0:
+			return ""
+		assert actualReadCount == len(readData)
+		return readData
+
+	def writeSubmit(self, writeData):
+		return _AsyncTransfer(self.context, writeData=writeData)
+
+	def readSubmit(self, readCount, readBuffer):
+		return _AsyncTransfer(self.context, readCount=readCount,
+			readBuffer=readBuffer)
+
+	def close(self):
+		_ftdi1_check(self.context, ftdi1.usb_close)
+		ftdi1.free(self.context)
+
+def _open(function, *args):
 	context = ftdi1.new()
 	assert context
 	try:
-		_ftdi1_check(context, ftdi1.usb_open, vendor, product)
-		return Mpsse(context, lowByteValue, lowByteDirection)
+		_ftdi1_check(context, function, *args)
 	except:
 		ftdi1.free(context)
 		raise
-
-def ioTest(mpsse):
-	"""
-	Basic test of the I/O functions of an MPSSE.
-	This sets ports to output,
-	so don't execute with JTAG/SPI peripheral attached!
-	"""
-	ioCommandList = (
-		SetIo(0x3C, 0x0F, BYTE.LOW),
-		SetIo(0xC3, 0xF0, BYTE.HIGH),
-		GetIo(BYTE.LOW),
-		GetIo(BYTE.HIGH),
-		SendImmediate())
-	mpsse.executeList(ioCommandList)
-	low = ioCommandList[2].result
-	high = ioCommandList[3].result
-	assert low & 0x0F == 0x0C
-	assert high & 0xF0 == 0xC0
-	mpsse.executeList((
-		SetIo(0, 0, BYTE.LOW),
-		SetIo(0, 0, BYTE.HIGH)))
-
-def shiftTest(mpsse):
-	"""
-	Basic test of the shift functions of an MPSSE.
-	This sets ports to output,
-	so don't execute with JTAG/SPI peripheral attached!
-	"""
-	mpsse.execute(Loopback(True))
-	s = ShiftOutBit(5, "\x5C")
-	mpsse.execute(s)
-	s = ShiftInBit(4)
-	mpsse.execute(s)
-	shiftList = []
-	for l in range(1, 9):
-		for d in range(0, 1 << l):
-			s = ShiftInOutBit(l, chr(d))
-			s.expectedResult = chr(d)
-			shiftList.append(s)
-			if True:
-				mpsse.execute(s)
-				if s.result != s.expectedResult:
-					print ("Error:\n" +
-						"bitCount=%d\n" +
-						"result=0x%X\n" +
-						"expected=0x%X") % (
-						s.bitCount,
-						ord(s.result),
-						ord(s.expectedResult))
-				assert mpsse.checkReadBufferEmpty()
-				assert s.result == s.expectedResult
-	mpsse.executeList(shiftList)
-	assert mpsse.checkReadBufferEmpty()
-	for s in shiftList:
-		if s.result != s.expectedResult:
-			print ("Error:\n" +
-				"bitCount=%d\n" +
-				"result=0x%X\n" +
-				"expected=0x%X") % (
-				s.bitCount,
-				ord(s.result),
-				ord(s.expectedResult))
-		assert s.result == s.expectedResult
-	data = "\x01\x02\x03\xF0\xF1\xF2"
-	s = ShiftInByte(6)
-	mpsse.execute(s)
-	s = ShiftOutByte(data)
-	mpsse.execute(s)
-	s = ShiftInOutByte(data)
-	mpsse.execute(s)
-	assert s.result == data
-	mpsse.execute(Loopback(False))
-
-def test():
-	"Basic module self-test."
-	print "Module 'ftdi' self test:"
-	with openDevice(0x15ba, 0x002a, MASK.SPI_S, 0) as mpsse:
-		assert mpsse.checkReadBufferEmpty()
-		mpsse.readTimeout = 100
-		mpsse.reset()
-		assert mpsse.checkReadBufferEmpty()
-		mpsse.execute(SetClockDivisor(0))
-		mpsse.lsbFirst = True
-		ioTest(mpsse)
-		print "ioTest done"
-		shiftTest(mpsse)
-		print "shiftTest done"
-		assert mpsse.checkReadBufferEmpty()
-
-if __name__ == "__main__":
-	test()
+	return context
+
+def openDevice(vendor, product, serialNumber=None, description=None):
+	"Open the device with the USB IDs and optional serial/description."
+	if serialNumber is None and description is None:
+		context = _open(ftdi1.usb_open, vendor, product)
+	else:
+		context = _open(ftdi1.usb_open_desc, vendor, product,
+			description, serialNumber)
+	return Transport(context, serialNumber or "", description or "")
+
+def openBySerialNumber(serialNumber, vendor=0x0403, product=0x6010):
+	"Open by serial number, FT2232 USB IDs by default."
+	return openDevice(vendor, product, serialNumber)
+
+def openIndex(index=0, vendor=0x0403, product=0x6010):
+	"Open the index-th device with the USB IDs, FT2232 by default."
+	context = _open(ftdi1.usb_open_desc_index, vendor, product,
+		None, None, index)
+	return Transport(context)
@@ -0,0 +1,1062 @@
+#!/usr/bin/env python2
+# Christian Unhold, DICE GmbH & Co KG
+"""
+Abstraction layer for FTDI USB interface chips, independent of the driver.
+Commands, their encoding and the batching of transfers are implemented here,
+the USB access is done by a transport object:
+ftdi_d2xx (FTDI D2XX driver), ftdi_libftdi (libftdi), ftdi_pyusb (PyUSB)
+or emulator.MpsseEmulator.
+A transport has the methods of a d2xx handle:
+	getDeviceInfo() returning a dict with "type" (a DEVICE), "serial"
+	and "description", resetDevice(), purge(), setLatencyTimer(ms),
+	setTimeouts(readMs, writeMs), setBitMode(mask, bitMode),
+	write(data) returning the count written, read(count) returning the
+	data received so far, possibly less than count, and close().
+Transports supporting asynchronous transfers also have writeSubmit(data)
+and readSubmit(count, readBuffer), returning transfers with a method done()
+that waits for the transfer and returns the count transferred.
+Transports for bit-bang mode also have setBaudRate(baudRate), which sets
+the divisor for baudRate like FT_SetBaudRate of D2XX, in bit-bang mode too.
+The result of a command depends on its kind: GetIo gives an int, bit shifts
+give a str and byte shifts a memoryview of the read buffer. A compiled
+program reuses its buffer on the next run, copy a result with tobytes().
+The drivers spi, i2c and jtag return copies, str or int.
+Use the ftdi module to open devices.
+Performs a basic test program with the emulator when executed directly.
+"""
+
+import collections, time
+import program
+
+class BIT_MODE:
+	"""
+	Bit modes for the FT2232 and other compatible FTDI devices.
+	(FTDI AN2232-02)
+	"""
+	RESET = 0x00
+	ASYNC = 0x01
+	MPSSE = 0x02
+	SYNC  = 0x04
+	MCU   = 0x08
+	OPTO  = 0x10
+	UNDEF = 0xFF
+
+class DEVICE:
+	"Device types, the values of the FTDI D2XX driver."
+	BM      = 0
+	AM      = 1
+	FT100AX = 2
+	UNKNOWN = 3
+	FT2232C = 4
+	FT232R  = 5
+	FT2232H = 6
+	FT4232H = 7
+	FT232H  = 8
+
+class BYTE:
+	"Name the I/O port of an FTDI device."
+	LOW  = 0
+	HIGH = 1
+
+class PIN:
+	"Pin masks for the I/O pins. (FTDI FT2232H DS)"
+	ADBUS0 = BDBUS0 = TCK = SK = 1<<0
+	ADBUS1 = BDBUS1 = TDI = DO = 1<<1
+	ADBUS2 = BDBUS2 = TDO = DI = 1<<2
+	ADBUS3 = BDBUS3 = TMS = CS = 1<<3
+	ADBUS4 = BDBUS4 = GPIOL0 = 1<<4
+	ADBUS5 = BDBUS5 = GPIOL1 = 1<<5
+	ADBUS6 = BDBUS6 = GPIOL2 = 1<<6
+	ADBUS7 = BDBUS7 = GPIOL3 = 1<<7
+	ACBUS0 = BCBUS0 = GPIOH0 = 1<<8
+	ACBUS1 = BCBUS1 = GPIOH1 = 1<<9
+	ACBUS2 = BCBUS2 = GPIOH2 = 1<<10
+	ACBUS3 = BCBUS3 = GPIOH3 = 1<<11
+	ACBUS4 = BCBUS4 = GPIOH4 = 1<<12
+	ACBUS5 = BCBUS5 = GPIOH5 = 1<<13
+	ACBUS6 = BCBUS6 = GPIOH6 = 1<<14
+	ACBUS7 = BCBUS7 = GPIOH7 = 1<<15
+
+class MASK:
+	"Combined pin masks for the I/O pins."
+	JTAG_I = SPI_I = I2C_I = PIN.TDO
+	JTAG_O = SPI_O = PIN.TCK|PIN.TDI|PIN.TMS
+	I2C_O = PIN.SK|PIN.DO
+	JTAG_IO = SPI_IO = JTAG_I|JTAG_O
+	JTAG_S = SPI_S = PIN.TMS
+
+class FLAG:
+	"Flags for MPSSE mode."
+	WRITE_NEGEDGE = 0x01
+	BIT_MODE      = 0x02
+	READ_NEGEDGE  = 0x04
+	LSB_FIRST     = 0x08
+	WRITE_TDI     = 0x10
+	READ_TDO      = 0x20
+	WRITE_TMS     = 0x40
+
+class LATENCY:
+	"""
+	Latency timer policies, value in ms.
+	Reads are flushed with SendImmediate, the latency timer only limits
+	how long the device holds back other partially filled packets.
+	"""
+	LOW  = 1  # short round trips, more USB packets
+	BULK = 16 # fewer and fuller packets for long transfers
+
+class EDGE:
+	"Name the polarity of an edge."
+	POS = 0
+	NEG = 1
+
+EXTENDED_DEVICES = (
+	DEVICE.FT232R,
+	DEVICE.FT2232C,
+	DEVICE.FT2232H,
+	DEVICE.FT4232H,
+	DEVICE.FT232H)
+
+MPSSE_DEVICES = (
+	DEVICE.FT2232C,
+	DEVICE.FT2232H,
+	DEVICE.FT4232H,
+	DEVICE.FT232H)
+
+BAD_COMMAND = "\xFA" # MPSSE response to an invalid opcode
+
+MAX_SHIFT_BYTES = 0x1000 # per byte shift command, see stream for longer
+
+HIGHSPEED_DEVICES = (
+	DEVICE.FT2232H,
+	DEVICE.FT4232H,
+	DEVICE.FT232H)
+
+BUFFER_SIZES = { # transmit, receive buffer, USB packet size
+	DEVICE.FT232R: (256, 128, 64),
+	DEVICE.FT2232C: (128, 384, 64),
+	DEVICE.FT2232H: (4096, 4096, 512),
+	DEVICE.FT4232H: (2048, 2048, 512),
+	DEVICE.FT232H: (1024, 1024, 512)}
+
+def chunkSizes(deviceType):
+	"""
+	Write and read chunk sizes for a device type.
+	Two read chunks fit into the receive buffer, so the next chunk can be
+	written before the previous one is read. Read chunks are a multiple of
+	the packet payload, without the two modem status bytes.
+	"""
+	writeBuffer, readBuffer, packetSize = BUFFER_SIZES.get(deviceType,
+		(128, 128, 64))
+	payload = packetSize - 2
+	return writeBuffer, readBuffer/2/payload*payload
+
+class Ftdi:
+	"Basic interface for an FTDI device, on a transport as handle."
+	def __init__(self, handle, lowByteDirection=0, bitMode=BIT_MODE.RESET):
+		self.handle = handle
+		self.lowByteDirection = lowByteDirection
+		self.bitMode = bitMode
+		self.lsbFirst = False
+		self.readTimeout = 1000 # ms
+		self.writeTimeout = 1000 # ms
+		self.receiveBufferTimeout = LATENCY.BULK # ms
+		self.deviceInfo = handle.getDeviceInfo()
+		self.writeChunkSize, self.readChunkSize = chunkSizes(
+			self.deviceInfo["type"])
+		self.asyncTransfers = 0 # transfers in flight, 0 for blocking
+		self.transfers = collections.deque() # (transfer, size, read)
+		self.readsInFlight = 0 # at most 1, see submit()
+		self.queue = None
+		self.optimizer = None # e.g. optimize.optimize, for executeList
+		self.stats = None # stats.Stats when instrumented
+		self.reset()
+
+	def __enter__(self):
+		return self
+
+	def __exit__(self, exc_type, exc_value, traceback):
+		self.__del__()
+
+	def __del__(self):
+		try:
+			self.handle.resetDevice()
+			self.handle.close()
+			del self.handle
+		except AttributeError:
+			pass
+
+	def reset(self):
+		"Reset the device, executes pending commands and leaves queue mode."
+		self.disableQueue()
+		self.complete()
+		h = self.handle
+		h.resetDevice()
+		h.purge()
+		if self.deviceInfo["type"] in EXTENDED_DEVICES:
+			h.setLatencyTimer(self.receiveBufferTimeout)
+		h.setTimeouts(self.readTimeout, self.writeTimeout)
+		h.setBitMode(self.lowByteDirection, self.bitMode)
+		h.resetDevice()
+		h.purge()
+
+	def setLatencyPolicy(self, latency):
+		"Set the latency timer according to a LATENCY policy."
+		self.receiveBufferTimeout = latency
+		if self.deviceInfo["type"] in EXTENDED_DEVICES:
+			self.handle.setLatencyTimer(latency)
+
+	def getFlushData(self):
+		"""
+		Write data that makes the device send back its read data
+		immediately, empty if not supported in the current bit mode.
+		"""
+		if self.bitMode in (BIT_MODE.MPSSE, BIT_MODE.MCU):
+			return "\x87"
+		return ""
+
+	def check(self, command):
+		"Check if a command can be executed on the device."
+		assert self.bitMode in command.bitModes
+		if isinstance(command, ClockDivideByFive):
+			assert self.deviceInfo["type"] in HIGHSPEED_DEVICES
+
+	def read(self, readCount, readBuffer=None):
+		"""
+		Read exactly readCount bytes into readBuffer, a bytearray
+		allocated if not given. Short USB reads are continued
+		until readTimeout expires.
+		"""
+		self.complete()
+		if readBuffer is None:
+			readBuffer = bytearray(readCount)
+		readIndex = 0
+		deadline = time.time() + self.readTimeout/1000.0
+		while readIndex < readCount:
+			readData = self.handle.read(readCount - readIndex)
+			end = readIndex + len(readData)
+			readBuffer[readIndex:end] = readData
+			readIndex = end
+			if readIndex < readCount and time.time() > deadline:
+				raise EnvironmentError("read timeout, %d of %d bytes" %
+					(readIndex, readCount))
+		return readBuffer
+
+	def write(self, writeData):
+		"Write all data to the device."
+		writeData = str(writeData)
+		writeCount = self.handle.write(writeData)
+		assert writeCount == len(writeData)
+
+	def transfer(self, writeData, readCount, readBuffer=None):
+		"""
+		Write data to the device and read the response
+		into a bytearray, see read().
+		"""
+		self.write(writeData)
+		if readCount != 0:
+			return self.read(readCount, readBuffer)
+		return readBuffer
+
+	def submit(self, writeData, readCount=0, readBuffer=None):
+		"""
+		Write data and read the response into readBuffer.
+		With asyncTransfers set, the transfers are only submitted and
+		completed later, keeping up to asyncTransfers of them in flight.
+		Only writes are pipelined: a read is submitted after the one before
+		is done, as libftdi reads every submitted read through the one
+		read buffer of its context.
+		This needs a transport with writeSubmit/readSubmit.
+		Blocking reads complete all transfers in flight first.
+		"""
+		if not self.asyncTransfers:
+			self.transfer(writeData, readCount, readBuffer)
+			return
+		writeData = str(writeData)
+		self.transfers.append((self.handle.writeSubmit(writeData),
+			len(writeData), False))
+		if readCount != 0:
+			while self.readsInFlight:
+				self._done()
+			self.transfers.append((self.handle.readSubmit(readCount,
+				readBuffer), readCount, True))
+			self.readsInFlight += 1
+		while len(self.transfers) > self.asyncTransfers:
+			self._done()
+
+	def complete(self):
+		"Wait for all transfers in flight, see submit()."
+		while self.transfers:
+			self._done()
+
+	def _done(self):
+		transfer, size, read = self.transfers.popleft()
+		self.readsInFlight -= read
+		count = transfer.done()
+		if count < size:
+			raise EnvironmentError("transfer timeout, %d of %d bytes" %
+				(count, size))
+
+	def enableQueue(self, flushThreshold=None):
+		"""
+		Switch to queue mode: execute() and executeList() only queue the
+		commands, see program.Queue. execute() returns a program.Deferred.
+		The default flushThreshold is the size of a write chunk.
+		"""
+		self.flush()
+		if flushThreshold is None:
+			flushThreshold = self.writeChunkSize
+		self.queue = program.Queue(self, flushThreshold)
+
+	def disableQueue(self):
+		"Execute the pending commands and leave queue mode."
+		self.flush()
+		self.queue = None
+
+	def flush(self):
+		"Execute the commands pending in queue mode."
+		if self.queue:
+			self.queue.flush()
+
+	def getResult(self, command):
+		"""
+		Result of an executed command,
+		a program.Deferred for it in queue mode.
+		"""
+		if self.queue:
+			return program.Deferred(command)
+		return command.result
+
+	def execute(self, command):
+		"""
+		Execute a command on the device and return its result.
+		In queue mode the command is only queued, the return value is a
+		program.Deferred for the result then.
+		"""
+		if self.queue:
+			self.queue.append((command,))
+			return program.Deferred(command)
+		self.check(command)
+		if self.stats:
+			start = time.time()
+		writeData = command.getWriteData(self)
+		readCount = command.getReadCount(self)
+		if self.stats:
+			self.stats.encoded(time.time() - start)
+			self.stats.executed((command,))
+		if not writeData:
+			assert readCount == 0
+			return
+		if readCount != 0:
+			writeData += self.getFlushData()
+		readData = self.transfer(writeData, readCount)
+		if hasattr(command, "updateShadow"):
+			command.updateShadow(self)
+		if readCount != 0:
+			command.setReadData(self, memoryview(readData))
+			return command.result
+
+	def executeListSimple(self, commandList):
+		"Execute a list of commands. Simple and inefficient."
+		for command in commandList:
+			self.execute(command)
+
+	def compile(self, commandList):
+		"Compile a list of commands into a reusable program.Program."
+		return program.Program(self, commandList)
+
+	def executeList(self, commandList):
+		"Execute a list of commands."
+		if self.optimizer:
+			commandList = self.optimizer(commandList)
+		if self.queue:
+			self.queue.append(commandList)
+			return
+		self.compile(commandList).run()
+
+	def checkReadBufferEmpty(self):
+		self.flush()
+		self.complete()
+		readData = self.handle.read(0x100)
+		if readData == "":
+			return True
+		else:
+			print "Ftdi.checkReadBuffer:", readData.encode("hex")
+			return False
+
+class Mpsse(Ftdi):
+	"MPSSE interface of an FTDI device."
+	def __init__(self, handle, lowByteValue=MASK.SPI_S,
+			lowByteDirection=MASK.SPI_O):
+		assert handle.getDeviceInfo()["type"] in MPSSE_DEVICES
+		self.resetLowByteValue = lowByteValue
+		Ftdi.__init__(self, handle, lowByteDirection, BIT_MODE.MPSSE)
+
+	def reset(self):
+		"Reset the device and setup for MPSSE mode."
+		Ftdi.reset(self)
+		self.synchronize()
+		resetCommandList = [Loopback(False),
+					SetClockDivisor(0),
+					SetIo(self.resetLowByteValue,
+						self.lowByteDirection,
+						BYTE.LOW)]
+		if self.deviceInfo["type"] in HIGHSPEED_DEVICES:
+			resetCommandList += [ClockDivideByFive(True),
+				# compatible with low-speed by default
+				ThreePhaseClocking(False)]
+		# all settings known in the shadow, so restoreState() covers them
+		self.ioValue = [0, 0] # I/O shadow, index BYTE.LOW/HIGH
+		self.ioDirection = [0, 0] # all inputs after reset
+		self.settings = {} # setting command class -> value, when known
+		self.executeList(resetCommandList)
+
+	def getClockFrequency(self):
+		"TCK/SK frequency in Hz from the settings shadow, None if unknown."
+		divisor = self.settings.get(SetClockDivisor)
+		if divisor is None:
+			return None
+		base = 12e6
+		if (self.deviceInfo["type"] in HIGHSPEED_DEVICES and
+				not self.settings.get(ClockDivideByFive, True)):
+			base = 60e6
+		return base / ((1 + divisor) * 2)
+
+	def saveState(self):
+		"The I/O shadow and known settings, for restoreState()."
+		return (list(self.ioValue), list(self.ioDirection),
+			dict(self.settings))
+
+	def restoreState(self, state):
+		"""
+		Return to a state of saveState() in one transfer, with only the
+		I/O bytes and settings that differ. Settings unknown in the
+		state are left as they are.
+		"""
+		ioValue, ioDirection, settings = state
+		commandList = []
+		for lowHighByte in (BYTE.LOW, BYTE.HIGH):
+			if (ioValue[lowHighByte] != self.ioValue[lowHighByte] or
+					ioDirection[lowHighByte] !=
+					self.ioDirection[lowHighByte]):
+				commandList.append(SetIo(ioValue[lowHighByte],
+					ioDirection[lowHighByte], lowHighByte))
+		for setting, value in settings.items():
+			if self.settings.get(setting) != value:
+				commandList.append(setting(value))
+		if commandList:
+			self.executeList(commandList)
+
+	def writePins(self, value, direction=None, read=False):
+		"""
+		Set the value and optionally the direction of the 16 I/O lines,
+		the high byte in bits 8 to 15. Only the bytes that differ from the
+		I/O shadow are written. With read the I/O lines are read back in
+		the same transfer and returned.
+		"""
+		if direction is None:
+			direction = self.getPinDirection()
+		commandList = []
+		for lowHighByte in (BYTE.LOW, BYTE.HIGH):
+			shift = 8*lowHighByte
+			byteValue = (value>>shift)&0xFF
+			byteDirection = (direction>>shift)&0xFF
+			if (byteValue != self.ioValue[lowHighByte] or
+					byteDirection != self.ioDirection[lowHighByte]):
+				commandList.append(SetIo(byteValue, byteDirection,
+					lowHighByte))
+		if read:
+			getIoList = [GetIo(BYTE.LOW), GetIo(BYTE.HIGH)]
+			commandList += getIoList
+		if commandList:
+			self.executeList(commandList)
+		if read:
+			return getIoList[0].result | getIoList[1].result<<8
+
+	def readPins(self):
+		"Read the 16 I/O lines in one transfer."
+		return self.writePins(self.getPinValue(), read=True)
+
+	def setPins(self, mask, read=False):
+		return self.writePins(self.getPinValue() | mask, read=read)
+
+	def clearPins(self, mask, read=False):
+		return self.writePins(self.getPinValue() & ~mask, read=read)
+
+	def togglePins(self, mask, read=False):
+		return self.writePins(self.getPinValue() ^ mask, read=read)
+
+	def setDirection(self, direction, read=False):
+		"Set the direction of the 16 I/O lines, a set bit is an output."
+		return self.writePins(self.getPinValue(), direction, read=read)
+
+	def getPinValue(self):
+		"Output value of the 16 I/O lines from the shadow, no transfer."
+		return self.ioValue[BYTE.LOW] | self.ioValue[BYTE.HIGH]<<8
+
+	def getPinDirection(self):
+		"Direction of the 16 I/O lines from the shadow, no transfer."
+		return self.ioDirection[BYTE.LOW] | self.ioDirection[BYTE.HIGH]<<8
+
+	def synchronize(self, retries=3):
+		"""
+		Synchronize with the MPSSE command processor (FTDI AN135):
+		Send the bad commands 0xAA and 0xAB and read until each one is
+		echoed as 0xFA and the opcode, discarding any stale data before.
+		"""
+		for opcode in ("\xAA", "\xAB"):
+			echo = BAD_COMMAND + opcode
+			for attempt in range(retries):
+				self.write(opcode + SendImmediate().getWriteData(self))
+				readData = ""
+				deadline = time.time() + self.readTimeout/1000.0
+				while echo not in readData and time.time() < deadline:
+					readData += self.handle.read(len(echo))
+				if echo in readData:
+					break
+			else:
+				raise EnvironmentError("MPSSE synchronisation failed")
+
+_encodings = {} # (opcode, length[, data]) -> encoded command
+
+def _opcodes(opcode):
+	"Opcode table indexed by Ftdi.lsbFirst."
+	return (opcode, opcode|FLAG.LSB_FIRST)
+
+def _encodeLength(opcode, length):
+	"Encode a command with a 16 bit length field, cached."
+	key = (opcode, length)
+	encoding = _encodings.get(key)
+	if encoding is None:
+		count = length - 1
+		encoding = _encodings[key] = (chr(opcode) + chr(count&0xff) +
+			chr(count>>8))
+	return encoding
+
+class Command(object):
+	"""
+	Base of all commands. Commands use __slots__ to stay small,
+	constant properties like the bit modes are class attributes.
+	"""
+	__slots__ = ("queue", "result")
+	bitModes = (BIT_MODE.MPSSE,)
+
+	def getReadCount(self, ftdi):
+		return 0
+
+	def __getattr__(self, name):
+		# the result of a command pending in queue mode executes the queue
+		if name != "result" or getattr(self, "queue", None) is None:
+			raise AttributeError(name)
+		self.queue.flush()
+		return self.result
+
+class CommandContainer(Command):
+	__slots__ = ("subCommands", "bitCount", "writeData")
+
+	def __init__(self):
+		self.subCommands = []
+
+	def getWriteData(self, ftdi):
+		return "".join([command.getWriteData(ftdi) for
+				command in self.subCommands])
+
+	def getReadCount(self, ftdi):
+		return sum([command.getReadCount(ftdi) for
+				command in self.subCommands])
+
+	def setReadData(self, ftdi, readData):
+		assert len(readData) == self.getReadCount(ftdi)
+		self.result = readData
+
+class Loopback(Command):
+	"Enable/disable internal connection between TDI/DO and TDO/DI."
+	__slots__ = ("enableLoopback",)
+	encodings = ("\x85", "\x84")
+
+	def __init__(self, enableLoopback):
+		self.enableLoopback = enableLoopback
+
+	def getWriteData(self, mpsse):
+		return self.encodings[bool(self.enableLoopback)]
+
+	def updateShadow(self, mpsse):
+		mpsse.settings[Loopback] = bool(self.enableLoopback)
+
+class ClockDivideByFive(Command):
+	"""
+	Only for FT2232H, FT4232H!
+	Enable/disable divide by 5 from the 60 MHz clock in the FTDI device.
+	"""
+	__slots__ = ("enableClockDivideByFive",)
+	encodings = ("\x8A", "\x8B")
+
+	def __init__(self, enableClockDivideByFive):
+		self.enableClockDivideByFive = enableClockDivideByFive
+
+	def getWriteData(self, mpsse):
+		return self.encodings[bool(self.enableClockDivideByFive)]
+
+	def updateShadow(self, mpsse):
+		mpsse.settings[ClockDivideByFive] = bool(self.enableClockDivideByFive)
+
+class ThreePhaseClocking(Command):
+	"""
+	Only for FT2232H, FT4232H!
+	Enable/disable three phase data clocking:
+	Data setup, pulse clock, data hold.
+	"""
+	__slots__ = ("enableThreePhaseClocking",)
+	encodings = ("\x8D", "\x8C")
+
+	def __init__(self, enableThreePhaseClocking):
+		self.enableThreePhaseClocking = enableThreePhaseClocking
+
+	def getWriteData(self, mpsse):
+		return self.encodings[bool(self.enableThreePhaseClocking)]
+
+	def updateShadow(self, mpsse):
+		mpsse.settings[ThreePhaseClocking] = bool(self.enableThreePhaseClocking)
+
+class SetClockDivisor(Command):
+	"""
+	Set the clock divisor. The TCK/SK always has a duty cycle of 50%,
+	except between commands where it will remain in its initial state.
+	F(TCK/SK) = F(FTDI) / (( 1 + clockDivisorValue) * 2)
+	with F(FTDI) = 12MHz or 60MHz for high-speed devices
+	with clock divider off.
+	"""
+	__slots__ = ("clockDivisor",)
+
+	def __init__(self, clockDivisorValue):
+		assert clockDivisorValue <= 0xFFFF
+		self.clockDivisor = clockDivisorValue
+
+	def getWriteData(self, mpsse):
+		return ("\x86" + chr(self.clockDivisor & 0xFF) +
+			chr(self.clockDivisor >> 8))
+
+	def updateShadow(self, mpsse):
+		mpsse.settings[SetClockDivisor] = self.clockDivisor
+
+class SetClockFrequency(Command):
+	"""
+	Set the clock frequency by using SetClockDivisor
+	and ClockDivideByFive for high-speed devices.
+	"""
+	__slots__ = ("clockFrequency",)
+
+	def __init__(self, clockFrequency):
+		self.clockFrequency = clockFrequency
+
+	def getCommands(self, mpsse):
+		"The equivalent SetClockDivisor and ClockDivideByFive commands."
+		minFrequency = 6e6 / 0x1000
+		assert self.clockFrequency >= minFrequency
+		if mpsse.deviceInfo["type"] in HIGHSPEED_DEVICES:
+			minHsFrequency = 30e6 / 0x1000
+			divide = False
+			divisor = 30e6 / self.clockFrequency - 1
+			if self.clockFrequency < minHsFrequency:
+				divide = True
+				divisor = 6e6 / self.clockFrequency - 1
+			divint = int(round(divisor))
+			return [ClockDivideByFive(divide), SetClockDivisor(divint)]
+		else:
+			divisor = 6e6 / self.clockFrequency - 1
+			divint = int(round(divisor))
+			return [SetClockDivisor(divint)]
+
+	def getWriteData(self, mpsse):
+		return "".join([command.getWriteData(mpsse)
+			for command in self.getCommands(mpsse)])
+
+	def updateShadow(self, mpsse):
+		for command in self.getCommands(mpsse):
+			command.updateShadow(mpsse)
+
+class SendImmediate(Command):
+	"Make the FTDI flush its buffer back to the PC."
+	__slots__ = ()
+	bitModes = (BIT_MODE.MPSSE, BIT_MODE.MCU)
+
+	def getWriteData(self, ftdi):
+		return "\x87"
+
+class SetIo(Command):
+	"""
+	Setup the direction of the I/O lines and
+	force a value on the bits that are set as output.
+	"""
+	__slots__ = ("value", "direction", "lowHighByte")
+	opcodes = ("\x80", "\x82") # indexed by BYTE
+
+	def __init__(self, value, direction, lowHighByte=BYTE.LOW):
+		assert lowHighByte in (BYTE.LOW, BYTE.HIGH)
+		self.lowHighByte = lowHighByte
+		self.value = value
+		self.direction = direction
+
+	def getWriteData(self, ftdi):
+		return (self.opcodes[self.lowHighByte] + chr(self.value) +
+			chr(self.direction))
+
+	def updateShadow(self, mpsse):
+		"Track the I/O state in the Mpsse, called when executed."
+		mpsse.ioValue[self.lowHighByte] = self.value
+		mpsse.ioDirection[self.lowHighByte] = self.direction
+
+class GetIo(Command):
+	"Read the current state of the I/O lines."
+	__slots__ = ("lowHighByte",)
+	encodings = ("\x81", "\x83") # indexed by BYTE
+
+	def __init__(self, lowHighByte):
+		assert lowHighByte in (BYTE.LOW, BYTE.HIGH)
+		self.lowHighByte = lowHighByte
+
+	def getWriteData(self, mpsse):
+		return self.encodings[self.lowHighByte]
+
+	def getReadCount(self, mpsse):
+		return 1
+
+	def setReadData(self, mpsse, readData):
+		assert len(readData) == 1
+		self.result = ord(readData[0])
+
+class WaitOnIo(Command):
+	"""
+	Wait until GPIOL1 (MPSSE mode) or I/O1 (MCU mode)
+	is in a certain state then process the next instruction.
+	The only way out of this is to disable the FTDI
+	if the I/O never goes into the state,
+	see triggered.TriggeredSequence for a watchdog doing that.
+	"""
+	__slots__ = ("stateToWaitFor",)
+	bitModes = (BIT_MODE.MPSSE, BIT_MODE.MCU)
+	encodings = ("\x89", "\x88")
+
+	def __init__(self, stateToWaitFor):
+		self.stateToWaitFor = stateToWaitFor
+
+	def getWriteData(self, mpsse):
+		return self.encodings[bool(self.stateToWaitFor)]
+
+class ShiftCommand(Command):
+	"""
+	Common base of the shift commands, holds the slots of all of them
+	so that the in/out commands can inherit from both directions.
+	opcodes is indexed by Ftdi.lsbFirst.
+	"""
+	__slots__ = ("bitCount", "byteCount", "writeData", "resultReceiver")
+
+class ShiftInBit(ShiftCommand):
+	__slots__ = ()
+	opcodes = _opcodes(FLAG.READ_TDO|FLAG.BIT_MODE)
+
+	def __init__(self, bitCount):
+		assert bitCount >= 1
+		assert bitCount <= 8
+		self.bitCount = bitCount
+
+	def getWriteData(self, mpsse):
+		key = (self.opcodes[mpsse.lsbFirst], self.bitCount)
+		encoding = _encodings.get(key)
+		if encoding is None:
+			encoding = _encodings[key] = chr(key[0]) + chr(self.bitCount-1)
+		return encoding
+
+	def getReadCount(self, mpsse):
+		return 1
+
+	def setReadData(self, mpsse, readData):
+		assert len(readData) == 1
+		data = ord(readData[0])
+		if mpsse.lsbFirst:
+			data >>= 8 - self.bitCount
+		self.result = chr(data & self.getMask())
+
+	def getMask(self):
+		return (1 << self.bitCount) - 1
+
+class ShiftOutBit(ShiftCommand):
+	__slots__ = ()
+	opcodes = _opcodes(FLAG.WRITE_TDI|FLAG.BIT_MODE|FLAG.WRITE_NEGEDGE)
+
+	def __init__(self, bitCount, writeData):
+		assert bitCount > 0
+		assert bitCount <= 8
+		self.bitCount = bitCount
+		assert len(writeData) == 1
+		self.writeData = writeData
+
+	def getWriteData(self, mpsse):
+		key = (self.opcodes[mpsse.lsbFirst], self.bitCount, self.writeData)
+		encoding = _encodings.get(key)
+		if encoding is None:
+			encoding = _encodings[key] = self.encode(mpsse.lsbFirst)
+		return encoding
+
+	def encode(self, lsbFirst):
+		opcode = self.opcodes[lsbFirst]
+		data = ord(self.writeData)
+		if not lsbFirst:
+			if self.bitCount != 8:
+				data &= self.getMask()
+				addTrail = data & 1 != 0
+				data <<= 8 - self.bitCount
+				if addTrail:
+					data |= 1 << (8 - self.bitCount - 1)
+		return chr(opcode) + chr(self.bitCount - 1) + chr(data)
+
+	def getMask(self):
+		return (1 << self.bitCount) - 1
+
+class ShiftInOutBit(ShiftOutBit, ShiftInBit):
+	__slots__ = ()
+	opcodes = _opcodes(FLAG.WRITE_TDI|FLAG.READ_TDO|FLAG.BIT_MODE|
+		FLAG.WRITE_NEGEDGE)
+
+	def __init__(self, bitCount, writeData):
+		ShiftOutBit.__init__(self, bitCount, writeData)
+
+class ShiftInByte(ShiftCommand):
+	__slots__ = ()
+	opcodes = _opcodes(FLAG.READ_TDO)
+
+	def __init__(self, byteCount):
+		assert byteCount > 0
+		assert byteCount <= MAX_SHIFT_BYTES
+		self.byteCount = byteCount
+		self.resultReceiver = None
+
+	def getWriteData(self, mpsse):
+		return _encodeLength(self.opcodes[mpsse.lsbFirst], self.byteCount)
+
+	def getReadCount(self, mpsse):
+		return self.byteCount
+
+	def setReadData(self, mpsse, readData):
+		assert len(readData) == self.getReadCount(mpsse)
+		self.result = readData
+		if self.resultReceiver:
+			self.resultReceiver.result = readData
+
+	def split(self, size):
+		"The same shift as shifts of at most size bytes."
+		return [ShiftInByte(min(size, self.byteCount - i))
+			for i in range(0, self.byteCount, size)]
+
+class ShiftOutByte(ShiftCommand):
+	__slots__ = ()
+	opcodes = _opcodes(FLAG.WRITE_TDI|FLAG.WRITE_NEGEDGE)
+
+	def __init__(self, writeData):
+		assert len(writeData) <= MAX_SHIFT_BYTES
+		self.writeData = writeData
+
+	def getWriteData(self, mpsse):
+		return (_encodeLength(self.opcodes[mpsse.lsbFirst],
+			len(self.writeData)) + self.writeData)
+
+	def split(self, size):
+		"The same shift as shifts of at most size bytes."
+		return [type(self)(self.writeData[i:i + size])
+			for i in range(0, len(self.writeData), size)]
+
+class ShiftInOutByte(ShiftOutByte, ShiftInByte):
+	__slots__ = ()
+	opcodes = _opcodes(FLAG.WRITE_TDI|FLAG.READ_TDO|FLAG.WRITE_NEGEDGE)
+
+	def __init__(self, writeData):
+		ShiftInByte.__init__(self, len(writeData))
+		ShiftOutByte.__init__(self, writeData)
+
+def _pieces(data):
+	"data in pieces of at most MAX_SHIFT_BYTES."
+	return [data[i:i + MAX_SHIFT_BYTES] for i in
+		range(0, len(data), MAX_SHIFT_BYTES)]
+
+class ShiftOut(CommandContainer):
+	"""
+	Shift of any number of bits, the first byte of writeData holds the
+	bitCount%8 single bits. Longer payloads become several byte shifts,
+	all kept in memory; stream shifts them from a file or mmap.
+	"""
+	__slots__ = ()
+
+	def __init__(self, bitCount, writeData):
+		CommandContainer.__init__(self)
+		self.bitCount = bitCount
+		self.writeData = writeData
+		bits = bitCount%8
+		bytes = bitCount/8
+		offset = 0
+		if bits:
+			self.subCommands.append(
+				ShiftOutBit(bits, self.writeData[0]))
+			offset = 1
+		for piece in _pieces(self.writeData[offset:offset + bytes]):
+			self.subCommands.append(ShiftOutByte(piece))
+
+class ShiftIn(CommandContainer):
+	__slots__ = ()
+
+	def __init__(self, bitCount):
+		CommandContainer.__init__(self)
+		self.bitCount = bitCount
+		bits = bitCount%8
+		bytes = bitCount/8
+		if bits:
+			self.subCommands.append(ShiftInBit(bits))
+		for start in range(0, bytes, MAX_SHIFT_BYTES):
+			self.subCommands.append(ShiftInByte(
+				min(MAX_SHIFT_BYTES, bytes - start)))
+
+class ShiftInOut(CommandContainer):
+	__slots__ = ()
+
+	def __init__(self, bitCount, writeData):
+		CommandContainer.__init__(self)
+		self.bitCount = bitCount
+		self.writeData = writeData
+		bits = bitCount%8
+		bytes = bitCount/8
+		offset = 0
+		if bits:
+			self.subCommands.append(
+				ShiftInOutBit(bits, self.writeData[0]))
+			offset = 1
+		for piece in _pieces(self.writeData[offset:offset + bytes]):
+			self.subCommands.append(ShiftInOutByte(piece))
+
+class ShiftTms(Command):
+	"Clock data to TMS pin."
+	__slots__ = ("data",)
+
+	def __init__(self, data):
+		assert len(data) <= 7
+		self.data = data
+
+	def getWriteData(self, mpsse):
+		length = len(self.data)
+		byte = 0
+		for i in range(length):
+			if self.data[i] in (1, "1", "H"):
+				byte |= 1<<i
+		return "\x4A" + chr(length-1) + chr(byte)
+
+class Clock(Command):
+	"Clock without data transfer."
+	__slots__ = ("count",)
+
+	def __init__(self, count):
+		self.count = count
+
+	def getWriteData(self, mpsse):
+		# the length fields encode count - 1
+		result = ""
+		byteCount = self.count/8
+		bitCount = self.count%8
+		while byteCount:
+			length = min(byteCount, 0x10000)
+			result += _encodeLength(0x8F, length)
+			byteCount -= length
+		if bitCount:
+			result += "\x8E" + chr(bitCount - 1)
+		return result
+
+def ioTest(mpsse):
+	"""
+	Basic test of the I/O functions of an MPSSE.
+	This sets ports to output,
+	so don't execute with JTAG/SPI peripheral attached!
+	"""
+	ioCommandList = (
+		SetIo(0x3C, 0x0F, BYTE.LOW),
+		SetIo(0xC3, 0xF0, BYTE.HIGH),
+		GetIo(BYTE.LOW),
+		GetIo(BYTE.HIGH),
+		SendImmediate())
+	mpsse.executeList(ioCommandList)
+	low = ioCommandList[2].result
+	high = ioCommandList[3].result
+	assert low & 0x0F == 0x0C
+	assert high & 0xF0 == 0xC0
+	mpsse.executeList((
+		SetIo(0, 0, BYTE.LOW),
+		SetIo(0, 0, BYTE.HIGH)))
+
+def shiftTest(mpsse):
+	"""
+	Basic test of the shift functions of an MPSSE.
+	This sets ports to output,
+	so don't execute with JTAG/SPI peripheral attached!
+	"""
+	mpsse.execute(Loopback(True))
+	s = ShiftOutBit(5, "\x5C")
+	mpsse.execute(s)
+	s = ShiftInBit(4)
+	mpsse.execute(s)
+	shiftList = []
+	for l in range(1, 9):
+		for d in range(0, 1 << l):
+			s = ShiftInOutBit(l, chr(d))
+			shiftList.append(s)
+			if True:
+				mpsse.execute(s)
+				if s.result != s.writeData:
+					print ("Error:\n" +
+						"bitCount=%d\n" +
+						"result=0x%X\n" +
+						"expected=0x%X") % (
+						s.bitCount,
+						ord(s.result),
+						ord(s.writeData))
+				assert mpsse.checkReadBufferEmpty()
+				assert s.result == s.writeData
+	mpsse.executeList(shiftList)
+	assert mpsse.checkReadBufferEmpty()
+	for s in shiftList:
+		if s.result != s.writeData:
+			print ("Error:\n" +
+				"bitCount=%d\n" +
+				"result=0x%X\n" +
+				"expected=0x%X") % (
+				s.bitCount,
+				ord(s.result),
+				ord(s.writeData))
+		assert s.result == s.writeData
+	data = "\x01\x02\x03\xF0\xF1\xF2"
+	s = ShiftInByte(6)
+	mpsse.execute(s)
+	s = ShiftOutByte(data)
+	mpsse.execute(s)
+	s = ShiftInOutByte(data)
+	mpsse.execute(s)
+	assert s.result == data
+	mpsse.execute(Loopback(False))
+
+def test():
+	"Basic module self-test, on the emulator."
+	import emulator
+	print "Module 'ftdi_mpsse' self test:"
+	with Mpsse(emulator.MpsseEmulator(DEVICE.FT2232H), MASK.SPI_S, 0) as mpsse:
+		assert mpsse.checkReadBufferEmpty()
+		mpsse.readTimeout = 100
+		mpsse.reset()
+		assert mpsse.checkReadBufferEmpty()
+		mpsse.execute(SetClockDivisor(0))
+		mpsse.lsbFirst = True
+		ioTest(mpsse)
+		print "ioTest done"
+		shiftTest(mpsse)
+		print "shiftTest done"
+		# TMS bits go out first to last, LSB first in the data byte
+		assert ShiftTms([0, 1, 0, 0]).getWriteData(mpsse) == "\x4A\x03\x02"
+		mpsse.execute(ShiftTms([1, 1, 0]))
+		assert not mpsse.handle.value[BYTE.LOW] & PIN.TMS
+		assert mpsse.checkReadBufferEmpty()
+
+if __name__ == "__main__":
+	test()
@@ -0,0 +1,231 @@
+#!/usr/bin/env python2
+# Christian Unhold, DICE GmbH & Co KG
+"""
+Transport for ftdi_mpsse using the bulk endpoints directly through PyUSB 1.x
+(https://github.com/pyusb/pyusb) and libusb/usbfs, without a vendor library.
+Writes go out as one multi-packet bulk transfer, reads request whole packets
+and strip the two modem status bytes from each one here.
+PyUSB is only imported to find and claim devices, so a Transport also works
+on a fake device like emulator.UsbDevice.
+"""
+
+import errno
+from ftdi_mpsse import DEVICE, BUFFER_SIZES
+
+DEVICE_TYPES = { # bcdDevice -> DEVICE
+	0x200: DEVICE.AM,
+	0x400: DEVICE.BM,
+	0x500: DEVICE.FT2232C,
+	0x600: DEVICE.FT232R,
+	0x700: DEVICE.FT2232H,
+	0x800: DEVICE.FT4232H,
+	0x900: DEVICE.FT232H}
+
+class SIO:
+	"FTDI vendor requests and their values."
+	REQUEST_TYPE = 0x40 # vendor request to the device
+	RESET = 0x00
+	SET_BAUDRATE = 0x03
+	SET_LATENCY_TIMER = 0x09
+	SET_BITMODE = 0x0B
+	RESET_SIO = 0
+	PURGE_RX = 1
+	PURGE_TX = 2
+
+STATUS_SIZE = 2 # modem status bytes at the start of every packet read
+
+BAUD_CLOCK = 3000000 # Hz, base of the baud rate divisor
+BAUD_FRACTIONS = (0, 3, 2, 4, 1, 5, 6, 7) # code of n/8 at index n
+MULTI_CHANNEL = (DEVICE.FT2232C, DEVICE.FT2232H, DEVICE.FT4232H,
+	DEVICE.FT232H) # types with the channel in wIndex of SET_BAUDRATE
+
+def baudRateDivisor(baudRate):
+	"""
+	Encoded divisor of BAUD_CLOCK for a baud rate: 14 bits integer part,
+	the fraction in eighths in the 3 bits above.
+	"""
+	divisor = int(round(8.0*BAUD_CLOCK/baudRate)) # in eighths
+	divisor = max(8, min(divisor, 0x3FFF*8 + 7))
+	if divisor == 8:
+		return 0 # 3 MBaud
+	if divisor == 12:
+		return 1 # 2 MBaud
+	return divisor>>3 | BAUD_FRACTIONS[divisor & 7]<<14
+
+def _usb():
+	import usb.core, usb.util
+	return usb
+
+def load():
+	"Import PyUSB, raise ImportError if it is missing, see ftdi.setBackend()."
+	_usb()
+
+class Transport:
+	"""
+	pyusb device with the transport interface of ftdi_mpsse.
+	interface is the channel, 0 for A, 1 for B and so on.
+	Reads are bulk transfers of at most maxTransferSize bytes,
+	payload beyond the requested count is kept for the next read.
+	"""
+	def __init__(self, device, interface=0):
+		self.device = device
+		self.interface = interface
+		self.index = interface + 1 # wIndex of the vendor requests
+		self.outEndpoint = 0x02 + 2*interface
+		self.inEndpoint = 0x81 + 2*interface
+		deviceType = DEVICE_TYPES.get(device.bcdDevice, DEVICE.UNKNOWN)
+		self.packetSize = BUFFER_SIZES.get(deviceType, (0, 0, 64))[2]
+		self.maxTransferSize = 0x4000
+		self.readTimeout = 1000 # ms
+		self.writeTimeout = 1000 # ms
+		self.readData = bytearray() # received, not yet returned
+		self.claimed = False
+		self.deviceInfo = {
+			"type": deviceType,
+			"serial": device.serial_number or "",
+			"description": device.product or ""}
+
+	def getDeviceInfo(self):
+		return self.deviceInfo
+
+	def _control(self, request, value, index=None):
+		if index is None:
+			index = self.index
+		self.device.ctrl_transfer(SIO.REQUEST_TYPE, request, value,
+			index, None, self.writeTimeout)
+
+	def resetDevice(self):
+		self._control(SIO.RESET, SIO.RESET_SIO)
+		self.readData = bytearray()
+
+	def purge(self):
+		self._control(SIO.RESET, SIO.PURGE_RX)
+		self._control(SIO.RESET, SIO.PURGE_TX)
+		self.readData = bytearray()
+
+	def setLatencyTimer(self, latencyTimer):
+		self._control(SIO.SET_LATENCY_TIMER, latencyTimer)
+
+	def setTimeouts(self, readTimeout, writeTimeout):
+		self.readTimeout = readTimeout
+		self.writeTimeout = writeTimeout
+
+	def setBitMode(self, mask, bitMode):
+		self._control(SIO.SET_BITMODE, mask | bitMode<<8)
+
+	def setBaudRate(self, baudRate):
+		"""
+		The bits above 16 of the divisor go to wIndex, in its high byte
+		with the channel in the low byte on multi-channel types, like
+		libftdi does. No factor is applied in bit-bang mode.
+		"""
+		divisor = baudRateDivisor(baudRate)
+		if self.deviceInfo["type"] in MULTI_CHANNEL:
+			index = divisor>>8 & 0xFF00 | self.index
+		else:
+			index = divisor>>16
+		self._control(SIO.SET_BAUDRATE, divisor & 0xFFFF, index)
+
+	def write(self, writeData):
+		return self.device.write(self.outEndpoint, writeData,
+			self.writeTimeout)
+
+	def read(self, readCount):
+		"""
+		Read up to readCount bytes. The packets needed for the missing
+		bytes are requested in one bulk transfer, it ends early with the
+		first short packet.
+		"""
+		missing = readCount - len(self.readData)
+		if missing > 0:
+			payload = self.packetSize - STATUS_SIZE
+			packets = min((missing + payload - 1)/payload,
+				self.maxTransferSize/self.packetSize)
+			try:
+				data = self.device.read(self.inEndpoint,
+					packets*self.packetSize, self.readTimeout)
+			except _usb().core.USBError as error:
+				if error.errno != errno.ETIMEDOUT:
+					raise
+				data = ()
+			data = bytearray(data)
+			for begin in range(0, len(data), self.packetSize):
+				self.readData += data[begin + STATUS_SIZE:
+					begin + self.packetSize]
+		readData = str(self.readData[:readCount])
+		del self.readData[:readCount]
+		return readData
+
+	def close(self):
+		if self.claimed:
+			usb = _usb()
+			usb.util.release_interface(self.device, self.interface)
+			usb.util.dispose_resources(self.device)
+			self.claimed = False
+
+def _open(device, interface):
+	usb = _usb()
+	if device.is_kernel_driver_active(interface):
+		device.detach_kernel_driver(interface)
+	usb.util.claim_interface(device, interface)
+	transport = Transport(device, interface)
+	transport.claimed = True
+	return transport
+
+def findDevices(vendor=0x0403, product=0x6010):
+	"All USB devices with the IDs, FT2232 by default."
+	return list(_usb().core.find(find_all=True,
+		idVendor=vendor, idProduct=product))
+
+def openDevice(vendor, product, serialNumber=None, description=None,
+		interface=0):
+	"Open the first device with the USB IDs and optional serial/description."
+	for device in findDevices(vendor, product):
+		if serialNumber is not None and device.serial_number != serialNumber:
+			continue
+		if description is not None and device.product != description:
+			continue
+		return _open(device, interface)
+	raise EnvironmentError("no device %04X:%04X found" % (vendor, product))
+
+def openBySerialNumber(serialNumber, vendor=0x0403, product=0x6010,
+		interface=0):
+	return openDevice(vendor, product, serialNumber, interface=interface)
+
+def openIndex(index=0, vendor=0x0403, product=0x6010, interface=0):
+	"Open the index-th device with the USB IDs, FT2232 by default."
+	devices = findDevices(vendor, product)
+	if index >= len(devices):
+		raise EnvironmentError("no device %04X:%04X with index %d" %
+			(vendor, product, index))
+	return _open(devices[index], interface)
+
+def test():
+	"Basic module self-test, on a fake device of the emulator."
+	import emulator, ftdi_mpsse
+	print "Module 'ftdi_pyusb' self test:"
+	device = emulator.UsbDevice(emulator.MpsseEmulator(DEVICE.FT2232H))
+	transport = Transport(device)
+	transport.maxTransferSize = 4*transport.packetSize
+	with ftdi_mpsse.Mpsse(transport, ftdi_mpsse.MASK.SPI_S, 0) as mpsse:
+		ftdi_mpsse.ioTest(mpsse)
+		ftdi_mpsse.shiftTest(mpsse)
+		mpsse.execute(ftdi_mpsse.Loopback(True))
+		data = "".join([chr(i & 0xFF) for i in range(0x1000)])
+		shift = ftdi_mpsse.ShiftInOutByte(data)
+		mpsse.execute(shift)
+		assert shift.result == data
+		assert mpsse.checkReadBufferEmpty()
+	# bit-bang rates are set as given, the high divisor bit by device type
+	for bcdDevice in (0x700, 0x600):
+		device = emulator.UsbDevice(emulator.MpsseEmulator(DEVICE.FT2232H),
+			bcdDevice)
+		transport = Transport(device)
+		transport.setBitMode(0xFF, ftdi_mpsse.BIT_MODE.SYNC)
+		for baudRate in (187500, 29888, 300):
+			transport.setBaudRate(baudRate)
+			assert round(device.emulator.baudRate) == baudRate
+	print "ftdi_pyusb test done"
+
+if __name__ == "__main__":
+	test()
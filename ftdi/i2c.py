@@ -11,10 +11,21 @@ import ftdi
 class I2C:
     def __init__(self, mpsse, address=0):
         assert mpsse.deviceInfo["type"] in ftdi.HIGHSPEED_DEVICES
-        mpsse.execute(ftdi.SetClockDivisor(119))
-        mpsse.execute(ftdi.ThreePhaseClocking(True))
+        mpsse.executeList(self.SETUP)
         self.address = address
         self.mpsse = mpsse
+        self.addressCommand, self.ackCommand = byteCommands(0)
+        self.addressProgram = mpsse.compile(self.START +
+            (self.addressCommand, self.ackCommand))
+        self.readCommand, self.readAckCommand = readCommands(0)
+        self.readProgram = mpsse.compile((self.readCommand,
+            self.readAckCommand))
+        self.writeCommand, self.writeAckCommand = byteCommands(0)
+        self.writeProgram = mpsse.compile((self.writeCommand,
+            self.writeAckCommand))
+        self.stopProgram = mpsse.compile(self.STOP)
+
+    SETUP = (ftdi.SetClockDivisor(119), ftdi.ThreePhaseClocking(True))
 
     COUNT = 40
 
@@ -32,43 +43,50 @@ class I2C:
         byte = self.address&0xFE
         if readWrite:
             byte |= 1
-        ack_command = ftdi.ShiftInOutBit(1, chr(1))
-        address_command = self.START + (ftdi.ShiftOutByte(chr(byte)), ack_command)
-        self.mpsse.executeList(address_command)
-        ack = ord(ack_command.result)
+        self.addressProgram.patch(self.addressCommand, chr(byte))
+        self.addressProgram.run()
+        ack = ord(self.ackCommand.result)
         return ack == 0
 
     def read(self, length):
         data = ""
         if not self._address(True):
-            self.mpsse.executeList(self.STOP)
+            self.stopProgram.run()
             return None
         for i in range(length):
             ack = 1 if i == length-1 else 0
-            read_byte = (ftdi.ShiftInOutByte("\xFF"), ftdi.ShiftOutBit(1, chr(ack)))
-            self.mpsse.executeList(read_byte)
-            byte = read_byte[0].result
-            data += byte
-        self.mpsse.executeList(self.STOP)
+            self.readProgram.patch(self.readAckCommand, chr(ack))
+            self.readProgram.run()
+            byte = self.readCommand.result
+            data += byte.tobytes()
+        self.stopProgram.run()
         return data
 
     def write(self, data):
         i = 0
         if not self._address(False):
-            self.mpsse.executeList(self.STOP)
+            self.stopProgram.run()
             return None
         for byte in data:
             if isinstance(byte, int):
                 byte = chr(byte)
-            write_byte = (ftdi.ShiftOutByte(byte), ftdi.ShiftInOutBit(1, chr(1)))
-            self.mpsse.executeList(write_byte)
-            ack = ord(write_byte[1].result)
+            self.writeProgram.patch(self.writeCommand, byte)
+            self.writeProgram.run()
+            ack = ord(self.writeAckCommand.result)
             if ack != 0:
                 break
             i += 1
-        self.mpsse.executeList(self.STOP)
+        self.stopProgram.run()
         return i
 
+def byteCommands(byte):
+    "Commands to send a byte, an int, and read its acknowledge."
+    return (ftdi.ShiftOutByte(chr(byte)), ftdi.ShiftInOutBit(1, chr(1)))
+
+def readCommands(ack):
+    "Commands to read a byte and send ack, 0 to acknowledge it."
+    return (ftdi.ShiftInOutByte("\xFF"), ftdi.ShiftOutBit(1, chr(ack)))
+
 def open(address = 0xE8):
     mpsse = ftdi.open(ftdi.MASK.I2C_O, ftdi.MASK.I2C_O)
     i2c = I2C(mpsse, address)
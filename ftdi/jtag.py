@@ -19,9 +19,22 @@ class Jtag:
         self.dr_end_state = "IDLE"
         self.run_state = "IDLE"
         self.end_state = "IDLE"
-        self.mpsse.execute(ftdi.ShiftTms([1]*5))
+        self._run((ftdi.ShiftTms([1]*5),))
         self.state = "RESET"
 
+    def _run(self, commandList, resultCommand=None):
+        """
+        Execute the commands of a JTAG operation, return the result of
+        resultCommand as a string. Override to execute them some other way.
+        """
+        self.mpsse.executeList(commandList)
+        if resultCommand is not None:
+            result = self.mpsse.getResult(resultCommand)
+            if isinstance(result, memoryview):
+                # a view of a read buffer that the next run reuses
+                result = result.tobytes()
+            return result
+
     def execute(self, svfCommand):
         print(svfCommand)
         svfCommand.execute(self)
@@ -33,28 +46,25 @@ class Jtag:
     def set_state(self, state):
         if state != self.state:
             shiftTms = get_state_change_command(self.state, state)
-            self.mpsse.execute(shiftTms)
+            self._run((shiftTms,))
             self.state = state
 
-    def shift_ir(self, length, data):
-        commandList = (get_state_change_command(self.state, "IRSHIFT"),
+    def _shift(self, shiftState, endState, length, data):
+        commandList = (get_state_change_command(self.state, shiftState),
             ftdi.ShiftInOut(length, data),
-            get_state_change_command("IRSHIFT", self.ir_end_state),)
-        self.mpsse.executeList(commandList)
-        self.state = self.ir_end_state
-        return commandList[1].result
+            get_state_change_command(shiftState, endState),)
+        self.state = endState
+        return self._run(commandList, commandList[1])
+
+    def shift_ir(self, length, data):
+        return self._shift("IRSHIFT", self.ir_end_state, length, data)
 
     def shift_dr(self, length, data):
-        commandList = (get_state_change_command(self.state, "DRSHIFT"),
-            ftdi.ShiftInOut(length, data),
-            get_state_change_command("DRSHIFT", self.dr_end_state),)
-        self.mpsse.executeList(commandList)
-        self.state = self.dr_end_state
-        return commandList[1].result
+        return self._shift("DRSHIFT", self.dr_end_state, length, data)
 
     def run(self, cycles):
         self.set_state(self.run_state)
-        self.mpsse.execute(ftdi.Clock(cycles))
+        self._run((ftdi.Clock(cycles),))
         self.set_state(self.end_state)
 
 def readIdCode():
@@ -0,0 +1,185 @@
+#!/usr/bin/env python2
+# Christian Unhold, DICE GmbH & Co KG
+"""
+Peephole optimizer for MPSSE command lists.
+Merges adjacent byte shifts and clocks, drops settings that are repeated or
+superseded before they take effect, and optionally replaces SetIo repetitions
+used as delays by idle clock cycles.
+Use it for executeList by setting Ftdi.optimizer = optimize.optimize.
+Idle clocks toggle TCK/SK, which clocks an SPI device with its chip select
+active, so they are only for JTAG between shifts with the TAP in a stable
+state, e.g. Run-Test/Idle: mpsse.optimizer = optimize.jtagIdleOptimizer(mpsse)
+"""
+
+from ftdi_mpsse import (BYTE, PIN, Loopback, ClockDivideByFive,
+	ThreePhaseClocking, SetClockDivisor, SetClockFrequency, SetIo, GetIo,
+	SendImmediate, WaitOnIo, ShiftOutByte, Clock, MAX_SHIFT_BYTES)
+from waveform import SET_IO_TIME
+
+SETTINGS = {
+	Loopback: "enableLoopback",
+	ClockDivideByFive: "enableClockDivideByFive",
+	ThreePhaseClocking: "enableThreePhaseClocking",
+	SetClockDivisor: "clockDivisor",
+}
+
+# Commands not affected by the settings.
+PASSIVE = (SetIo, GetIo, SendImmediate, WaitOnIo)
+
+def _dropSettings(commandList):
+	"""
+	Drop settings equal to the one in effect, and settings overridden by the
+	next one of the same kind before any command depending on them.
+	"""
+	result = []
+	current = {} # kind -> value in effect at the end of result
+	unused = {} # kind -> index in result, value before
+	for command in commandList:
+		kind = type(command)
+		if kind is SetClockFrequency:
+			for setting in (ClockDivideByFive, SetClockDivisor):
+				current.pop(setting, None)
+				unused.pop(setting, None)
+		elif kind in SETTINGS:
+			value = getattr(command, SETTINGS[kind])
+			if current.get(kind) == value:
+				continue
+			if kind in unused:
+				index, before = unused.pop(kind)
+				result[index] = None
+				if before is None:
+					del current[kind]
+				else:
+					current[kind] = before
+			if current.get(kind) == value:
+				continue
+			unused[kind] = (len(result), current.get(kind))
+			current[kind] = value
+		elif kind not in PASSIVE:
+			unused.clear()
+		result.append(command)
+	return [command for command in result if command is not None]
+
+def _holdsTms(setIo):
+	"If a SetIo drives TCK low and TMS, so that clocking TCK keeps the TAP."
+	return (setIo.lowHighByte == BYTE.LOW and
+		setIo.direction & (PIN.TCK|PIN.TMS) == PIN.TCK|PIN.TMS and
+		not setIo.value & PIN.TCK)
+
+def _idleClocks(commandList, frequency, setIoTime):
+	"""
+	Replace each run of repetitions of a SetIo holding TMS by a Clock of
+	about the same duration, at TCK frequency, if that is at least one
+	cycle. Clocks between the repetitions do not end a run. After a clock
+	setting the frequency is unknown and nothing is replaced.
+	"""
+	result = []
+	setIo = None # last SetIo holding TMS, if only clocks follow it
+	repeats = 0 # repetitions of setIo at the end of result
+	for command in commandList + [None]:
+		kind = type(command)
+		if kind is SetIo and setIo is not None and (
+				(setIo.value, setIo.direction, setIo.lowHighByte) ==
+				(command.value, command.direction, command.lowHighByte)):
+			result.append(command)
+			repeats += 1
+			continue
+		if repeats and frequency:
+			count = int(round(repeats*setIoTime*frequency))
+			if count >= 1:
+				del result[-repeats:]
+				result.append(Clock(count))
+		repeats = 0
+		if kind is SetIo:
+			setIo = command if _holdsTms(command) else None
+		elif kind is not Clock:
+			setIo = None
+		if kind in (SetClockFrequency, SetClockDivisor, ClockDivideByFive):
+			frequency = None
+		if command is not None:
+			result.append(command)
+	return result
+
+def _merge(commandList):
+	result = []
+	for command in commandList:
+		kind = type(command)
+		previous = result and result[-1]
+		if (kind is ShiftOutByte and type(previous) is ShiftOutByte and
+				len(previous.writeData) + len(command.writeData) <=
+					MAX_SHIFT_BYTES):
+			result[-1] = ShiftOutByte(previous.writeData +
+				command.writeData)
+		elif kind is Clock and type(previous) is Clock:
+			result[-1] = Clock(previous.count + command.count)
+		elif kind is not Clock or command.count != 0:
+			result.append(command)
+	return result
+
+def optimize(commandList, idleClock=None, setIoTime=SET_IO_TIME):
+	"""
+	Return an optimized copy of a command list.
+	Only commands without read data are replaced, so the results of the
+	other commands are still set on the original objects.
+	Do not use on lists compiled into a program that is patched later.
+	idleClock is the TCK frequency in Hz, see Mpsse.getClockFrequency(),
+	and states that the SetIo repetitions in the list are delays of
+	setIoTime each in which clocking TCK is harmless, see the module
+	docstring: repetitions of a SetIo driving TCK low and TMS are then
+	replaced by idle clock cycles of about the same duration.
+	"""
+	commandList = _dropSettings(commandList)
+	if idleClock:
+		commandList = _idleClocks(commandList, idleClock, setIoTime)
+	return _merge(commandList)
+
+def jtagIdleOptimizer(mpsse, setIoTime=SET_IO_TIME):
+	"""
+	Optimizer for mpsse.optimizer with idle clocks at the TCK frequency of
+	mpsse when the list is executed, for JTAG only, see optimize().
+	"""
+	def optimizer(commandList):
+		return optimize(commandList, mpsse.getClockFrequency(), setIoTime)
+	return optimizer
+
+def test():
+	"Basic module self-test."
+	print "Module 'optimize' self test:"
+	from ftdi_mpsse import ShiftInOutByte
+	setIo = SetIo(1, 1)
+	getIo = GetIo(0)
+	commandList = ([Loopback(True), SetClockDivisor(5), SetClockDivisor(7),
+		Loopback(True), ShiftOutByte("ab"), ShiftOutByte("cd"),
+		Loopback(True), SetClockDivisor(7), getIo] +
+		[setIo]*20 + [ShiftInOutByte("x"), Clock(3), Clock(5)])
+	result = optimize(commandList)
+	assert [command.__class__.__name__ for command in result] == [
+		"Loopback", "SetClockDivisor", "ShiftOutByte", "GetIo"] + \
+		["SetIo"]*20 + ["ShiftInOutByte", "Clock"]
+	assert result[1].clockDivisor == 7
+	assert result[2].writeData == "abcd"
+	assert result[3] is getIo
+	assert result[-1].count == 8
+	names = [command.__class__.__name__ for command in result]
+	assert [command.__class__.__name__ for command in optimize(commandList,
+		idleClock=6e6)] == names # SetIo(1, 1) drives TCK high
+	setIo = SetIo(PIN.TMS, PIN.TCK|PIN.TMS)
+	commandList = [setIo]*20 + [Clock(3)] + [setIo]*11 + [
+		SetIo(0, PIN.TMS)]*3 + [SetClockDivisor(0)] + [setIo]*20
+	result = optimize(commandList, idleClock=6e6)
+	assert [command.__class__.__name__ for command in result] == [
+		"SetIo", "Clock"] + ["SetIo"]*3 + ["SetClockDivisor"] + ["SetIo"]*20
+	assert result[1].count == 11 + 3 + 7 # 100 ns per SetIo at 6 MHz
+	assert optimize([setIo]*5, idleClock=1e6) == [setIo]*5 # < 1 cycle
+	import emulator, ftdi_mpsse
+	with ftdi_mpsse.Mpsse(emulator.MpsseEmulator(
+			ftdi_mpsse.DEVICE.FT2232H)) as mpsse:
+		mpsse.execute(SetClockFrequency(1e6))
+		optimizer = jtagIdleOptimizer(mpsse)
+		assert [command.__class__.__name__ for command in optimizer(
+			[setIo]*51)] == ["SetIo", "Clock"]
+		assert optimizer([setIo]*51)[1].count == 5
+	print "optimize test done"
+
+if __name__ == "__main__":
+	test()
@@ -0,0 +1,212 @@
+#!/usr/bin/env python2
+# Christian Unhold, DICE GmbH & Co KG
+"""
+Run the same work on several Mpsse instances at once,
+e.g. one per channel of a rack of FT2232H/FT4232H adapters.
+Every Mpsse gets its own worker thread, so the wall-clock time of a run is
+about the one of the slowest device. The threads only overlap while waiting
+on USB in a native call that releases the GIL. Calls through ctypes do:
+PyUSB and the asynchronous transfers of the libftdi transport. The blocking
+calls of the ftdi1 SWIG binding do not, so the Executor turns on
+asyncTransfers on transports that have them, and programs and executeList
+then run in parallel. Single execute() calls on libftdi still run one
+device at a time, as does a d2xx module that holds the GIL.
+Usage:
+	def readId(mpsse):
+		shift = ftdi.ShiftInOutByte("\\x9F\\x00\\x00\\x00")
+		mpsse.executeList([ftdi.SetIo(0, ftdi.MASK.SPI_O), shift,
+			ftdi.SetIo(ftdi.MASK.SPI_S, ftdi.MASK.SPI_O)])
+		return shift.result.tobytes()[1:]
+	with parallel.Executor(mpsses) as executor:
+		ids = parallel.gather(executor.run(readId))
+"""
+
+import sys, threading, Queue
+import ftdi
+from ftdi import MASK
+
+ASYNC_TRANSFERS = 4 # in flight per device, see Executor
+
+class Job:
+	"Work for one Mpsse, with its result or error when done."
+	def __init__(self, mpsse, function, args):
+		self.mpsse = mpsse
+		self.function = function
+		self.args = args
+		self.result = None
+		self.error = None # sys.exc_info() of a failed job
+		self.event = threading.Event()
+
+	def run(self):
+		try:
+			self.result = self.function(self.mpsse, *self.args)
+		except Exception:
+			self.error = sys.exc_info()
+		self.event.set()
+
+	def wait(self):
+		"Wait for the job to be done, return its result or raise its error."
+		self.event.wait()
+		if self.error:
+			raise self.error[0], self.error[1], self.error[2]
+		return self.result
+
+def _worker(queue):
+	while True:
+		job = queue.get()
+		if job is None:
+			return
+		job.run()
+
+class Executor:
+	"""
+	One worker thread for each Mpsse of a list.
+	A function given to submit() or run() is called as
+	function(mpsse, *args) on every Mpsse, in the thread of that Mpsse.
+	While the executor is open, devices on a transport with asynchronous
+	transfers have at least asyncTransfers of them in flight, see the
+	module docstring.
+	"""
+	def __init__(self, mpsses, asyncTransfers=ASYNC_TRANSFERS):
+		self.mpsses = list(mpsses)
+		self.queues = []
+		self.threads = []
+		self.asyncTransfers = [mpsse.asyncTransfers for mpsse in self.mpsses]
+		for mpsse in self.mpsses:
+			if hasattr(mpsse.handle, "readSubmit"):
+				mpsse.asyncTransfers = max(mpsse.asyncTransfers,
+					asyncTransfers)
+			queue = Queue.Queue()
+			thread = threading.Thread(target=_worker, args=(queue,))
+			thread.daemon = True
+			thread.start()
+			self.queues.append(queue)
+			self.threads.append(thread)
+
+	def __enter__(self):
+		return self
+
+	def __exit__(self, exc_type, exc_value, traceback):
+		self.close()
+
+	def submit(self, function, *args):
+		"Start function on all devices, return the jobs in device order."
+		jobs = []
+		for mpsse, queue in zip(self.mpsses, self.queues):
+			job = Job(mpsse, function, args)
+			queue.put(job)
+			jobs.append(job)
+		return jobs
+
+	def run(self, function, *args):
+		"Run function on all devices, return the done jobs."
+		jobs = self.submit(function, *args)
+		for job in jobs:
+			job.event.wait()
+		return jobs
+
+	def executeList(self, getCommandList):
+		"""
+		Execute a command list on all devices, return the done jobs with
+		the executed list of each device as result.
+		getCommandList() makes the list for one device, as a command
+		holds its own result and cannot be shared.
+		"""
+		def execute(mpsse):
+			commandList = getCommandList()
+			mpsse.executeList(commandList)
+			return commandList
+		return self.run(execute)
+
+	def close(self, closeDevices=False):
+		"Stop the worker threads and optionally close the devices."
+		for queue in self.queues:
+			queue.put(None)
+		for thread in self.threads:
+			thread.join()
+		self.queues = []
+		self.threads = []
+		for mpsse, asyncTransfers in zip(self.mpsses, self.asyncTransfers):
+			if hasattr(mpsse, "handle"):
+				mpsse.complete()
+				mpsse.asyncTransfers = asyncTransfers
+		if closeDevices:
+			for mpsse in self.mpsses:
+				mpsse.__del__()
+
+def gather(jobs):
+	"""
+	The results of done jobs in their order.
+	If any failed, raise an EnvironmentError naming every failed device.
+	"""
+	failed = [job for job in jobs if job.error]
+	if failed:
+		raise EnvironmentError("%d of %d devices failed: %s" % (
+			len(failed), len(jobs), "; ".join(["%s: %s" % (
+				job.mpsse.deviceInfo["serial"], job.error[1])
+				for job in failed])))
+	return [job.result for job in jobs]
+
+def openAll(serialNumbers,
+		lowByteValue=MASK.SPI_S,
+		lowByteDirection=MASK.SPI_O):
+	"""
+	Open the devices with the serial numbers at once,
+	e.g. "FT123456A" and "FT123456B" for the channels of an FT2232H.
+	"""
+	threads = []
+	results = [None]*len(serialNumbers)
+	def open(index, serialNumber):
+		try:
+			results[index] = ftdi.openBySerialNumber(serialNumber,
+				lowByteValue, lowByteDirection)
+		except EnvironmentError as error:
+			results[index] = error
+	for index, serialNumber in enumerate(serialNumbers):
+		thread = threading.Thread(target=open, args=(index, serialNumber))
+		thread.start()
+		threads.append(thread)
+	for thread in threads:
+		thread.join()
+	errors = [result for result in results
+		if isinstance(result, EnvironmentError)]
+	if errors:
+		for result in results:
+			if not isinstance(result, EnvironmentError):
+				result.__del__()
+		raise errors[0]
+	return results
+
+def test():
+	"Basic module self-test, on emulators."
+	import emulator
+	print "Module 'parallel' self test:"
+	mpsses = [ftdi.Mpsse(emulator.MpsseEmulator(ftdi.DEVICE.FT4232H,
+		"EMU0000%d" % index), MASK.SPI_S, 0) for index in range(4)]
+	with Executor(mpsses) as executor:
+		assert mpsses[0].asyncTransfers == ASYNC_TRANSFERS
+		gather(executor.run(ftdi.shiftTest))
+		def getCommandList():
+			return [ftdi.Loopback(True), ftdi.ShiftInOutByte("\x12\x34")]
+		jobs = executor.executeList(getCommandList)
+		assert [commandList[1].result.tobytes() for commandList in
+			gather(jobs)] == ["\x12\x34"]*4
+		def fail(mpsse):
+			if mpsse.deviceInfo["serial"] == "EMU00002":
+				raise EnvironmentError("failed")
+			return mpsse.deviceInfo["serial"]
+		jobs = executor.run(fail)
+		assert jobs[0].wait() == "EMU00000"
+		try:
+			gather(jobs)
+			assert False
+		except EnvironmentError as error:
+			assert "EMU00002: failed" in str(error)
+	for mpsse in mpsses:
+		assert mpsse.asyncTransfers == 0
+		assert mpsse.checkReadBufferEmpty()
+		mpsse.__del__()
+	print "parallel test done"
+
+if __name__ == "__main__":
+	test()
@@ -0,0 +1,199 @@
+#!/usr/bin/env python2
+# Christian Unhold, DICE GmbH & Co KG
+"""
+Process-wide pool of opened and initialised Mpsse instances.
+Opening through the pool hands out an idle Mpsse of the same device if there
+is one, without USB reset and MPSSE setup. Releasing it only restores the
+I/O lines and settings of the time it was opened, see Mpsse.restoreState(),
+and keeps it open for the next user. Instances idle for longer than
+idleTimeout seconds are closed.
+Closing the Mpsse of a lease closes the device behind the pool's back, it
+is then dropped on release. Give wrappers that close what they are given,
+like spi.SPI, the lease instead: closing or deleting a lease releases it.
+Usage:
+	with pool.openBySerialNumber("FT123456") as mpsse:
+		...
+	with spi.SPI(pool.openFirst()) as flash:
+		...
+"""
+
+import threading, time
+import ftdi
+from ftdi import MASK, BYTE, LATENCY
+
+class Lease:
+	"""
+	An Mpsse handed out by a Pool, usable like the Mpsse itself.
+	Give it back with release() or by a with statement.
+	"""
+	def __init__(self, pool, key, mpsse, state):
+		self.pool = pool
+		self.key = key
+		self.mpsse = mpsse
+		self.state = state
+
+	def __getattr__(self, name):
+		return getattr(self.mpsse, name)
+
+	def __enter__(self):
+		return self.mpsse
+
+	def __exit__(self, exc_type, exc_value, traceback):
+		self.release()
+
+	def __del__(self):
+		self.release()
+
+	def release(self):
+		if self.mpsse is not None:
+			self.pool.release(self)
+			self.mpsse = None
+
+class Pool:
+	"Idle Mpsse instances by key, a tuple naming the device."
+	def __init__(self, idleTimeout=60.0):
+		self.idleTimeout = idleTimeout
+		self.lock = threading.Lock()
+		self.idle = {} # key -> list of (mpsse, state, release time)
+
+	def acquire(self, key, open, lowByteValue, lowByteDirection):
+		"""
+		Lease an idle Mpsse for key, or a new one from open(lowByteValue,
+		lowByteDirection). An idle one is set to the low byte given.
+		"""
+		with self.lock:
+			self._evict()
+			entries = self.idle.get(key)
+			entry = entries and entries.pop()
+			if entries == []:
+				del self.idle[key]
+		if not entry:
+			mpsse = open(lowByteValue, lowByteDirection)
+			return Lease(self, key, mpsse, mpsse.saveState())
+		mpsse, state, releaseTime = entry
+		if (mpsse.resetLowByteValue, mpsse.lowByteDirection) != (
+				lowByteValue, lowByteDirection):
+			mpsse.resetLowByteValue = lowByteValue
+			mpsse.lowByteDirection = lowByteDirection
+			state[0][BYTE.LOW] = lowByteValue
+			state[1][BYTE.LOW] = lowByteDirection
+			mpsse.restoreState(state)
+		return Lease(self, key, mpsse, state)
+
+	def release(self, lease):
+		"""
+		Restore the Mpsse of a lease and keep it for the next user.
+		If that fails, the Mpsse is closed.
+		"""
+		mpsse = lease.mpsse
+		if not hasattr(mpsse, "handle"): # closed by its user
+			return
+		try:
+			self._restore(mpsse, lease.state)
+		except EnvironmentError:
+			mpsse.__del__()
+			return
+		with self.lock:
+			self.idle.setdefault(lease.key, []).append(
+				(mpsse, lease.state, time.time()))
+			self._evict()
+
+	def _restore(self, mpsse, state):
+		mpsse.disableQueue()
+		mpsse.complete()
+		mpsse.asyncTransfers = 0
+		mpsse.optimizer = None
+		mpsse.lsbFirst = False
+		if mpsse.receiveBufferTimeout != LATENCY.BULK:
+			mpsse.setLatencyPolicy(LATENCY.BULK)
+		mpsse.handle.purge() # responses nobody read
+		mpsse.restoreState(state)
+
+	def _evict(self, now=None):
+		"Close the instances idle for too long, called with the lock held."
+		if now is None:
+			now = time.time()
+		for key, entries in self.idle.items():
+			for entry in entries[:]:
+				if now - entry[2] > self.idleTimeout:
+					entries.remove(entry)
+					entry[0].__del__()
+			if not entries:
+				del self.idle[key]
+
+	def clear(self):
+		"Close all idle instances."
+		with self.lock:
+			self._evict(float("inf"))
+
+_pool = Pool()
+
+def getPool():
+	"The process-wide pool."
+	return _pool
+
+def openFirst(lowByteValue=MASK.SPI_S, lowByteDirection=MASK.SPI_O):
+	return _pool.acquire(("index", 0), ftdi.openFirst,
+		lowByteValue, lowByteDirection)
+
+def openBySerialNumber(serialNumber,
+		lowByteValue=MASK.SPI_S,
+		lowByteDirection=MASK.SPI_O):
+	def open(lowByteValue, lowByteDirection):
+		return ftdi.openBySerialNumber(serialNumber,
+			lowByteValue, lowByteDirection)
+	return _pool.acquire(("serial", serialNumber), open,
+		lowByteValue, lowByteDirection)
+
+def openDevice(vendor, product, lowByteValue, lowByteDirection,
+		serialNumber=None):
+	def open(lowByteValue, lowByteDirection):
+		return ftdi.openDevice(vendor, product,
+			lowByteValue, lowByteDirection, serialNumber)
+	return _pool.acquire(("usb", vendor, product, serialNumber), open,
+		lowByteValue, lowByteDirection)
+
+def clear():
+	"Close all idle instances of the process-wide pool."
+	_pool.clear()
+
+def test():
+	"Basic module self-test, on emulators."
+	import emulator, spi
+	from ftdi import (DEVICE, PIN, Loopback, SetClockDivisor,
+		ThreePhaseClocking)
+	print "Module 'pool' self test:"
+	handles = []
+	def open(lowByteValue, lowByteDirection):
+		handles.append(emulator.MpsseEmulator(DEVICE.FT2232H))
+		return ftdi.Mpsse(handles[-1], lowByteValue, lowByteDirection)
+	pool = Pool()
+	with pool.acquire("emu", open, MASK.SPI_S, MASK.SPI_O) as mpsse:
+		mpsse.executeList([SetClockDivisor(119), ThreePhaseClocking(True),
+			Loopback(True)])
+		mpsse.writePins(PIN.GPIOH0, MASK.SPI_O | PIN.GPIOH0)
+		mpsse.lsbFirst = True
+		mpsse.write("\xAA") # a response nobody reads
+	handle = handles[0]
+	lease = pool.acquire("emu", open, MASK.SPI_S, MASK.SPI_O)
+	assert lease.mpsse is mpsse and len(handles) == 1
+	assert handle.clockDivisor == 0 and not handle.threePhaseClocking
+	assert not handle.loopback and handle.direction == [MASK.SPI_O, 0]
+	assert mpsse.getClockFrequency() == 6e6 and not mpsse.lsbFirst
+	assert mpsse.checkReadBufferEmpty()
+	lease.release()
+	with spi.SPI(pool.acquire("emu", open, MASK.SPI_S, MASK.SPI_O)):
+		pass
+	assert len(pool.idle["emu"]) == 1 # released, not closed
+	with pool.acquire("emu", open, MASK.SPI_S, MASK.SPI_O) as mpsse:
+		mpsse.__del__()
+	assert "emu" not in pool.idle # closed by its user, dropped
+	pool.acquire("emu", open, MASK.SPI_S, MASK.SPI_O).release()
+	assert len(handles) == 2
+	pool.idleTimeout = 0
+	pool._evict(time.time() + 1)
+	assert not pool.idle
+	print "pool test done"
+
+if __name__ == "__main__":
+	test()
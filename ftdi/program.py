@@ -0,0 +1,296 @@
+#!/usr/bin/env python2
+# Christian Unhold, DICE GmbH & Co KG
+"""
+Precompiled command programs for the MPSSE.
+A program encodes a list of commands once into a write buffer and a table
+of read slices, and is then executed any number of times.
+Long programs are split into chunks that fit the device buffers and are
+pipelined: the next chunk is written before the previous one is read.
+The pieces of ShiftIn/ShiftOut/ShiftInOut and byte shifts longer than a
+chunk are split up for this, the command still gets all its read data.
+With asynchronous transfers (libftdi, emulator) the chunks are submitted
+without waiting, and a program without reads returns while still in flight.
+Every chunk that expects read data ends with a SendImmediate, so the device
+does not hold the response back until its latency timer expires.
+In queue mode commands are collected in a Queue and executed as one program
+when a result is needed.
+Commands that track device state in the Ftdi/Mpsse, like SetIo for the I/O
+shadow, update it when run or queued.
+"""
+
+import time
+
+class Program:
+	"""
+	A list of commands compiled for an Ftdi/Mpsse instance.
+	Payloads of commands can be changed between runs with patch(),
+	which only rewrites the bytes of that command.
+	All responses are read into one buffer owned by the program,
+	commands get memoryview slices of it. Such a result is only valid
+	until the next run, copy it with tobytes() to keep it.
+	"""
+	def __init__(self, ftdi, commandList):
+		self.ftdi = ftdi
+		self.commandList = tuple(commandList)
+		self.compile()
+
+	def compile(self):
+		"Encode the commands, done again if the encoding settings change."
+		ftdi = self.ftdi
+		stats = getattr(ftdi, "stats", None)
+		if stats:
+			start = time.time()
+		self.lsbFirst = ftdi.lsbFirst
+		flush = ftdi.getFlushData()
+		writeData = []
+		writeIndex = 0
+		readIndex = 0
+		self.writeSlices = {}
+		self.readSlices = []
+		self.chunks = []
+		self.splitCommands = set()
+		chunkWrite = chunkRead = 0
+		lastData = None
+		for command in self.commandList:
+			ftdi.check(command)
+			pieces = self._split(command, len(flush))
+			if pieces[0] is not command:
+				self.splitCommands.add(command)
+			commandRead = readIndex
+			for piece in pieces:
+				data = piece.getWriteData(ftdi)
+				readCount = piece.getReadCount(ftdi)
+				if writeIndex > chunkWrite and (
+						writeIndex + len(data) + len(flush) - chunkWrite >
+							ftdi.writeChunkSize or
+						readIndex + readCount - chunkRead >
+							ftdi.readChunkSize):
+					if readIndex > chunkRead and lastData != flush:
+						writeData.append(flush)
+						writeIndex += len(flush)
+					self.chunks.append((chunkWrite, writeIndex,
+						chunkRead, readIndex))
+					chunkWrite, chunkRead = writeIndex, readIndex
+				writeData.append(data)
+				lastData = data
+				end = writeIndex + len(data)
+				self.writeSlices.setdefault(piece, []).append(
+					(writeIndex, end))
+				writeIndex = end
+				readIndex += readCount
+			if readIndex != commandRead:
+				self.readSlices.append((command, commandRead, readIndex))
+		if writeIndex > chunkWrite:
+			if readIndex > chunkRead and lastData != flush:
+				writeData.append(flush)
+				writeIndex += len(flush)
+			self.chunks.append((chunkWrite, writeIndex,
+				chunkRead, readIndex))
+		self.writeData = bytearray("".join(writeData))
+		self.readCount = readIndex
+		self.readBuffer = bytearray(readIndex)
+		self.readView = memoryview(self.readBuffer)
+		self.shadowCommands = [command for command in self.commandList
+			if hasattr(command, "updateShadow")]
+		if stats:
+			stats.encoded(time.time() - start)
+
+	def _split(self, command, flushSize):
+		"""
+		The commands to encode for command: the pieces of a container,
+		a byte shift split to fit a chunk, or command itself.
+		"""
+		ftdi = self.ftdi
+		subCommands = getattr(command, "subCommands", None)
+		if subCommands is not None:
+			pieces = []
+			for subCommand in subCommands:
+				pieces += self._split(subCommand, flushSize)
+			return pieces
+		if not hasattr(command, "split"):
+			return [command]
+		readCount = command.getReadCount(ftdi)
+		writeSize = len(command.getWriteData(ftdi))
+		if (readCount <= ftdi.readChunkSize and
+				writeSize + flushSize <= ftdi.writeChunkSize):
+			return [command]
+		size = ftdi.writeChunkSize - flushSize - 3 # opcode and length
+		if readCount:
+			size = min(size, ftdi.readChunkSize)
+		return command.split(size)
+
+	def patch(self, command, writeData):
+		"""
+		Replace the write data of a command in the program.
+		The encoded length of the command must not change.
+		"""
+		command.writeData = writeData
+		if (self.lsbFirst != self.ftdi.lsbFirst or
+				command in self.splitCommands):
+			self.compile()
+			return
+		data = command.getWriteData(self.ftdi)
+		for begin, end in self.writeSlices[command]:
+			assert len(data) == end - begin
+			self.writeData[begin:end] = data
+
+	def run(self):
+		"Execute the program on the device."
+		ftdi = self.ftdi
+		ftdi.flush()
+		if self.lsbFirst != ftdi.lsbFirst:
+			self.compile()
+		if getattr(ftdi, "stats", None):
+			ftdi.stats.executed(self.commandList)
+		if not self.writeData:
+			assert self.readCount == 0
+			return
+		writeData = self.writeData
+		readView = self.readView
+		chunks = self.chunks
+		if getattr(ftdi, "asyncTransfers", 0):
+			for writeBegin, writeEnd, readBegin, readEnd in chunks:
+				ftdi.submit(writeData[writeBegin:writeEnd],
+					readEnd - readBegin, readView[readBegin:readEnd])
+			if self.readCount != 0:
+				ftdi.complete()
+		else:
+			self._runPipelined()
+		self.setResults()
+
+	def setResults(self):
+		"Hand the read data to the commands, after the transfers are done."
+		ftdi = self.ftdi
+		readView = self.readView
+		for command, begin, end in self.readSlices:
+			command.setReadData(ftdi, readView[begin:end])
+		for command in self.shadowCommands:
+			command.updateShadow(ftdi)
+
+	def _runPipelined(self):
+		"""
+		Write the next chunk before reading the current one, unless one
+		of them reads more than a read chunk: only two read chunks fit
+		the receive buffer, the rest would block the write.
+		"""
+		ftdi = self.ftdi
+		writeData = self.writeData
+		readView = self.readView
+		chunks = self.chunks
+		def fits(chunk):
+			return chunk[3] - chunk[2] <= ftdi.readChunkSize
+		written = 0 # number of chunks written
+		for i in range(len(chunks)):
+			if written == i:
+				writeBegin, writeEnd = chunks[i][:2]
+				ftdi.write(writeData[writeBegin:writeEnd])
+				written += 1
+			if written < len(chunks) and fits(chunks[i]) and fits(
+					chunks[written]):
+				writeBegin, writeEnd = chunks[written][:2]
+				ftdi.write(writeData[writeBegin:writeEnd])
+				written += 1
+			readBegin, readEnd = chunks[i][2:]
+			if readEnd != readBegin:
+				ftdi.read(readEnd - readBegin,
+					readView[readBegin:readEnd])
+
+class Deferred:
+	"Future-like handle for the result of a queued command."
+	def __init__(self, command):
+		self.command = command
+
+	def done(self):
+		return getattr(self.command, "queue", None) is None
+
+	def getResult(self):
+		"Result of the command, flushes the queue if still pending."
+		return self.command.result
+
+class Queue:
+	"""
+	Commands of an Ftdi/Mpsse in queue mode, not yet executed.
+	They are executed together as one program on flush(), which happens
+	when the result of a queued command is accessed, when flushThreshold
+	bytes of write data are pending or when a program is run.
+	"""
+	def __init__(self, ftdi, flushThreshold):
+		self.ftdi = ftdi
+		self.flushThreshold = flushThreshold
+		self.commandList = []
+		self.writeCount = 0
+
+	def append(self, commandList):
+		ftdi = self.ftdi
+		for command in commandList:
+			ftdi.check(command)
+			command.queue = self
+			try: # the result of a reused command is read by the flush
+				del command.result
+			except AttributeError:
+				pass
+			if hasattr(command, "updateShadow"):
+				command.updateShadow(ftdi)
+			self.commandList.append(command)
+			self.writeCount += len(command.getWriteData(ftdi))
+		if self.writeCount >= self.flushThreshold:
+			self.flush()
+
+	def flush(self):
+		"Execute all pending commands."
+		commandList = self.commandList
+		self.commandList = []
+		self.writeCount = 0
+		for command in commandList:
+			command.queue = None
+		if commandList:
+			Program(self.ftdi, commandList).run()
+
+def test():
+	"Basic module self-test, on the emulator."
+	import emulator, ftdi_mpsse
+	from ftdi_mpsse import DEVICE, Loopback, ShiftInOut, ShiftInOutByte
+	print "Module 'program' self test:"
+	data = "".join([chr(i*7 & 0xFF) for i in range(10000)])
+	handle = emulator.MpsseEmulator(DEVICE.FT2232H)
+	with ftdi_mpsse.Mpsse(handle) as mpsse:
+		mpsse.execute(Loopback(True))
+		for shift in (ShiftInOut(8*len(data), data),
+				ShiftInOutByte(data[:4000])):
+			program = Program(mpsse, [shift])
+			assert len(program.chunks) > 1
+			for writeBegin, writeEnd, readBegin, readEnd in program.chunks:
+				assert writeEnd - writeBegin <= mpsse.writeChunkSize
+				assert readEnd - readBegin <= mpsse.readChunkSize
+			program.run()
+			assert shift.result.tobytes() == shift.writeData
+		program.patch(shift, shift.writeData[::-1])
+		program.run()
+		assert shift.result.tobytes() == data[:4000][::-1]
+		# chunks reading more than a read chunk are not written ahead
+		shifts = [ShiftInOutByte(data[:2000]), ShiftInOutByte(data[:2000])]
+		program = Program(mpsse, shifts)
+		assert len(program.chunks) == 2
+		mpsse.readChunkSize = 1000
+		program.run()
+		mpsse.readChunkSize = 2040
+		assert shifts[1].result.tobytes() == data[:2000]
+		# a reused command gets the result of the run it is queued for
+		shift = ShiftInOutByte("\x12")
+		mpsse.execute(shift)
+		mpsse.enableQueue()
+		shift.writeData = "\x34"
+		mpsse.execute(shift)
+		assert shift.result.tobytes() == "\x34"
+		# a reset executes the queue and itself immediately
+		shift.writeData = "\x56"
+		assert isinstance(mpsse.execute(shift), ftdi_mpsse.program.Deferred)
+		mpsse.reset()
+		assert mpsse.queue is None and shift.queue is None
+		assert shift.result.tobytes() == "\x56"
+		assert mpsse.settings[Loopback] is False
+		assert mpsse.checkReadBufferEmpty()
+	print "program test done"
+
+if __name__ == "__main__":
+	test()
@@ -0,0 +1,402 @@
+#!/usr/bin/env python2
+# Christian Unhold, DICE GmbH & Co KG
+"""
+Requests from many callers merged into shared transfers of one Mpsse.
+A Scheduler owns an Mpsse and a worker thread. Command lists submitted
+while the worker is busy, or within tick seconds of the first one, are
+executed together as one executeList, so many small requests share the
+USB round trips instead of waiting for one each. A Request is completed
+with the results of its own commands, in the order of submission.
+The protocol layers AsyncSpi, AsyncI2c and AsyncJtag submit the command
+lists of spi, i2c and jtag, so both paths send the same commands.
+For asyncio, wrap() turns a Request into an awaitable future of an event
+loop. This needs trollius on Python 2, or asyncio.
+Usage:
+	with scheduler.Scheduler(mpsse) as s:
+		spi = scheduler.AsyncSpi(s)
+		requests = [spi.transfer("\\x9F\\x00\\x00\\x00") for i in range(10)]
+		ids = [request.wait() for request in requests]
+	# in a coroutine:
+	#	id = yield From(scheduler.wrap(spi.transfer("\\x9F\\x00\\x00\\x00")))
+"""
+
+import sys, time, threading
+import spi, i2c, jtag
+from ftdi_mpsse import PIN, MASK, HIGHSPEED_DEVICES, ShiftInOutByte
+
+def _asyncio():
+	try:
+		import trollius
+		return trollius
+	except ImportError:
+		import asyncio
+		return asyncio
+
+def _result(command):
+	"""
+	A command result, a memoryview or bytearray as a string, other results
+	like the int of GetIo unchanged.
+	"""
+	result = command.result
+	if isinstance(result, (memoryview, bytearray)):
+		return memoryview(result).tobytes()
+	return result
+
+class Request:
+	"""
+	A command list submitted to a Scheduler. Its result is the list of
+	the results of the commands that read data, or what convert returns
+	for the command list, if given.
+	"""
+	def __init__(self, commandList, convert=None):
+		self.commandList = list(commandList)
+		self.convert = convert
+		self.result = None
+		self.error = None # sys.exc_info() of a failed request
+		self.event = threading.Event()
+		self.lock = threading.Lock()
+		self.callbacks = []
+
+	def done(self):
+		return self.event.is_set()
+
+	def wait(self, timeout=None):
+		"""
+		Wait for the request to be done, return its result or raise its
+		error. Raise an EnvironmentError if timeout s pass first.
+		"""
+		if not self.event.wait(timeout):
+			raise EnvironmentError("request timeout")
+		if self.error:
+			raise self.error[0], self.error[1], self.error[2]
+		return self.result
+
+	def addCallback(self, callback):
+		"""
+		Call callback(request) when done, in the worker thread, or right
+		away if already done.
+		"""
+		with self.lock:
+			if not self.done():
+				self.callbacks.append(callback)
+				return
+		callback(self)
+
+	def _finish(self, mpsse, error=None):
+		if not error:
+			try:
+				if self.convert:
+					self.result = self.convert(self.commandList)
+				else:
+					self.result = [_result(command) for command in
+						self.commandList if command.getReadCount(mpsse)]
+			except Exception:
+				error = sys.exc_info()
+		self.error = error
+		with self.lock:
+			self.event.set()
+			callbacks, self.callbacks = self.callbacks, []
+		for callback in callbacks:
+			callback(self)
+
+class Scheduler:
+	"""
+	Executes the requests for one Mpsse in its own thread, see the module
+	docstring. Do not use the Mpsse directly while the scheduler runs.
+	Each request is checked on its own before merging, one that the Mpsse
+	cannot encode fails alone. If a merged executeList fails on the
+	device, all requests of it get the error.
+	Commands are not shared between requests, a command object holds
+	only one result.
+	"""
+	def __init__(self, mpsse, tick=0):
+		self.mpsse = mpsse
+		self.tick = tick
+		self.pending = []
+		self.closed = False
+		self.ticks = 0 # merged executeList calls so far
+		self.condition = threading.Condition()
+		self.thread = threading.Thread(target=self._worker)
+		self.thread.daemon = True
+		self.thread.start()
+
+	def __enter__(self):
+		return self
+
+	def __exit__(self, exc_type, exc_value, traceback):
+		self.close()
+
+	def submit(self, commandList, convert=None):
+		"Queue a command list, return its Request, see Request."
+		request = Request(commandList, convert)
+		with self.condition:
+			assert not self.closed
+			self.pending.append(request)
+			self.condition.notify()
+		return request
+
+	def executeList(self, commandList):
+		"Like Mpsse.executeList(), return a Request."
+		return self.submit(commandList)
+
+	def execute(self, command):
+		"Like Mpsse.execute(), return a Request for the command result."
+		if not command.getReadCount(self.mpsse):
+			return self.submit([command], lambda commandList: None)
+		return self.submit([command], lambda commandList:
+			_result(command))
+
+	def _worker(self):
+		while True:
+			with self.condition:
+				while not self.pending and not self.closed:
+					self.condition.wait()
+				if not self.pending:
+					return
+			if self.tick:
+				time.sleep(self.tick)
+			with self.condition:
+				requests, self.pending = self.pending, []
+			self._execute(requests)
+
+	def _check(self, request):
+		"Encode the commands of a request like compiling does, or raise."
+		mpsse = self.mpsse
+		for command in request.commandList:
+			mpsse.check(command)
+			command.getWriteData(mpsse)
+			command.getReadCount(mpsse)
+
+	def _execute(self, requests):
+		commandList = []
+		valid = []
+		for request in requests:
+			try:
+				self._check(request)
+			except Exception:
+				request._finish(self.mpsse, sys.exc_info())
+				continue
+			valid.append(request)
+			commandList += request.commandList
+		requests = valid
+		if not requests:
+			return
+		error = None
+		try:
+			self.mpsse.executeList(commandList)
+			self.mpsse.flush()
+			self.mpsse.complete()
+		except Exception:
+			error = sys.exc_info()
+		self.ticks += 1
+		for request in requests:
+			request._finish(self.mpsse, error)
+
+	def close(self):
+		"Execute the pending requests and stop the worker thread."
+		with self.condition:
+			self.closed = True
+			self.condition.notify()
+		self.thread.join()
+
+def wrap(request, loop=None):
+	"""
+	An asyncio (trollius on Python 2) future of an event loop, done with
+	the result or error of request. The loop makes the future if it can.
+	"""
+	if loop is None:
+		loop = _asyncio().get_event_loop()
+	if hasattr(loop, "create_future"):
+		future = loop.create_future()
+	else:
+		future = _asyncio().Future(loop=loop)
+	def done(request):
+		if future.cancelled():
+			return
+		if request.error:
+			future.set_exception(request.error[1])
+		else:
+			future.set_result(request.result)
+	request.addCallback(lambda request:
+		loop.call_soon_threadsafe(done, request))
+	return future
+
+class AsyncSpi:
+	"SPI master like spi.SPI, whole transfers of spi.transferCommands()."
+	def __init__(self, scheduler):
+		self.scheduler = scheduler
+		scheduler.submit(spi.SPI.SETUP)
+
+	def _transfer(self, data, convert):
+		shift = ShiftInOutByte(data)
+		return self.scheduler.submit(spi.transferCommands(shift),
+			lambda commandList: convert(_result(shift)))
+
+	def transfer(self, data):
+		"Shift data in and out with chip select low, Request for the input."
+		return self._transfer(data, str)
+
+	def readWrite(self, word):
+		"One byte, like spi.SPI.readWrite(), Request for the input byte."
+		return self._transfer(chr(word), ord)
+
+class AsyncI2c:
+	"""
+	I2C master like i2c.I2C, with its commands. A read or write is sent as
+	one transaction, so it is not stopped early at a missing acknowledge,
+	the acknowledges are checked in the result.
+	"""
+	def __init__(self, scheduler, address=0):
+		assert scheduler.mpsse.deviceInfo["type"] in HIGHSPEED_DEVICES
+		self.scheduler = scheduler
+		self.address = address
+		scheduler.submit(i2c.I2C.SETUP)
+
+	def _start(self, read):
+		byte = self.address & 0xFE | (1 if read else 0)
+		return i2c.I2C.START + i2c.byteCommands(byte)
+
+	def read(self, length):
+		"Request for length bytes, None if the address is not acknowledged."
+		commandList = self._start(True)
+		ackCommand = commandList[-1]
+		reads = []
+		for i in range(length):
+			commands = i2c.readCommands(1 if i == length - 1 else 0)
+			reads.append(commands[0])
+			commandList += commands
+		commandList += i2c.I2C.STOP
+		def convert(commandList):
+			if ord(_result(ackCommand)) & 1:
+				return None
+			return "".join([_result(command) for command in reads])
+		return self.scheduler.submit(commandList, convert)
+
+	def write(self, data):
+		"""
+		Request for the number of bytes acknowledged before the first
+		one that is not, None if the address is not acknowledged.
+		"""
+		commandList = self._start(False)
+		acks = [commandList[-1]]
+		for byte in data:
+			if not isinstance(byte, int):
+				byte = ord(byte)
+			commands = i2c.byteCommands(byte)
+			acks.append(commands[1])
+			commandList += commands
+		commandList += i2c.I2C.STOP
+		def convert(commandList):
+			bits = [ord(_result(command)) & 1 for command in acks]
+			if bits[0]:
+				return None
+			return (bits[1:] + [1]).index(1)
+		return self.scheduler.submit(commandList, convert)
+
+class AsyncJtag(jtag.Jtag):
+	"""
+	jtag.Jtag on a scheduler, the shifts return Requests. The TAP state is
+	tracked at submission, which is also the order of execution.
+	"""
+	def __init__(self, scheduler):
+		self.scheduler = scheduler
+		jtag.Jtag.__init__(self, scheduler.mpsse)
+
+	def _run(self, commandList, resultCommand=None):
+		if resultCommand is None:
+			return self.scheduler.submit(commandList,
+				lambda commandList: None)
+		return self.scheduler.submit(commandList,
+			lambda commandList: _result(resultCommand))
+
+def test():
+	"Basic module self-test, on the emulator."
+	import emulator, ftdi_mpsse
+	from ftdi_mpsse import DEVICE, Loopback
+	print "Module 'scheduler' self test:"
+	handle = emulator.MpsseEmulator(DEVICE.FT2232H)
+	mpsse = ftdi_mpsse.Mpsse(handle)
+	with Scheduler(mpsse, tick=0.05) as s:
+		spi = AsyncSpi(s)
+		s.execute(Loopback(True))
+		requests = []
+		threads = [threading.Thread(target=lambda i=i: requests.append(
+			spi.transfer(chr(i)*3))) for i in range(20)]
+		for thread in threads:
+			thread.start()
+		for thread in threads:
+			thread.join()
+		assert sorted([request.wait(1) for request in requests]) == [
+			chr(i)*3 for i in range(20)]
+		assert s.ticks == 1
+		assert spi.readWrite(0x5A).wait(1) == 0x5A
+		called = []
+		request = s.execute(ftdi_mpsse.GetIo(ftdi_mpsse.BYTE.LOW))
+		request.addCallback(called.append)
+		assert request.wait(1) == MASK.SPI_S
+		request.addCallback(called.append)
+		assert called == [request, request]
+		getIo = ftdi_mpsse.GetIo(ftdi_mpsse.BYTE.LOW)
+		assert s.executeList([getIo, Loopback(True)]).wait(1) == [MASK.SPI_S]
+		s.execute(Loopback(False)).wait(1)
+		s.execute(Loopback(False)).wait(1)
+		class Bypass: # one bit register between TDI and TDO
+			bit = False
+			def clock(self, tdi, tms):
+				tdo, self.bit = self.bit, tdi
+				return tdo
+		handle.target = Bypass()
+		j = AsyncJtag(s)
+		j.dr_end_state = "DRPAUSE"
+		j.run(3)
+		requests = [j.shift_dr(13, "\x15\xA5"), j.shift_dr(8, "\x3C")]
+		assert [r.wait(1) for r in requests] == ["\x50\x4B", "\x78"]
+		assert j.state == "DRPAUSE"
+		i2c = AsyncI2c(s, 0xE8)
+		handle.target = None
+		handle.setInput(0)
+		assert i2c.write("\x05\x03").wait(1) == 2
+		assert i2c.read(2).wait(1) == "\x00\x00"
+		handle.setInput(PIN.DI)
+		assert i2c.write("\x05").wait(1) is None
+		# a bad request merged with others fails alone
+		ticks = s.ticks
+		requests = [spi.readWrite(0), s.submit([None]), spi.readWrite(0)]
+		try:
+			requests[1].wait(1)
+			assert False
+		except AttributeError:
+			pass
+		assert [requests[0].wait(1), requests[2].wait(1)] == [0xFF, 0xFF]
+		assert s.ticks == ticks + 1
+		class Future: # of a stub event loop
+			def __init__(self):
+				self.result = self.exception = None
+			def cancelled(self):
+				return False
+			def set_result(self, result):
+				self.result = result
+			def set_exception(self, exception):
+				self.exception = exception
+		class Loop:
+			calls = []
+			def create_future(self):
+				return Future()
+			def call_soon_threadsafe(self, function, *args):
+				self.calls.append((function, args))
+		loop = Loop()
+		futures = [wrap(spi.readWrite(0x5A), loop), wrap(s.submit([None]),
+			loop)]
+		for future in futures:
+			while not loop.calls:
+				time.sleep(0.01)
+			function, args = loop.calls.pop(0)
+			function(*args)
+		assert futures[0].result == 0xFF
+		assert isinstance(futures[1].exception, AttributeError)
+	assert mpsse.checkReadBufferEmpty()
+	mpsse.__del__()
+	print "scheduler test done"
+
+if __name__ == "__main__":
+	test()
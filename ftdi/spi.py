@@ -10,9 +10,10 @@ import ftdi
 
 class SPI:
     def __init__(self, mpsse):
-        mpsse.execute(ftdi.SetClockDivisor(59))
-        #mpsse.execute(ftdi.ThreePhaseClocking(False))
+        mpsse.executeList(self.SETUP)
         self.mpsse = mpsse
+        self.shift = ftdi.ShiftInOutByte("\x00")
+        self.readWriteProgram = mpsse.compile(transferCommands(self.shift))
 
     def __del__(self):
         self.mpsse.__del__()
@@ -23,17 +24,23 @@ class SPI:
     def __exit__(self, exc_type, exc_value, traceback):
         self.mpsse.__exit__(exc_type, exc_value, traceback)
 
+    SETUP = (ftdi.SetClockDivisor(59),
+        #ftdi.ThreePhaseClocking(False),
+        )
+
     COUNT = 20
 
     CS_LOW = tuple([ftdi.SetIo(ftdi.MASK.SPI_S&~ftdi.PIN.CS, ftdi.MASK.SPI_O) for i in range(COUNT)])
     CS_HIGH = tuple([ftdi.SetIo(ftdi.MASK.SPI_S, ftdi.MASK.SPI_O) for i in range(COUNT)])
 
     def readWrite(self, word):
-        byte = chr(word)
-        shift = ftdi.ShiftInOutByte(byte)
-        commandList = self.CS_HIGH + self.CS_LOW + (shift,) + self.CS_LOW + self.CS_HIGH
-        self.mpsse.executeList(commandList)
-        return ord(shift.result)
+        self.readWriteProgram.patch(self.shift, chr(word))
+        self.readWriteProgram.run()
+        return ord(self.shift.result[0])
+
+def transferCommands(shift):
+    "The commands of a transfer, shift with the chip select and its delays."
+    return SPI.CS_HIGH + SPI.CS_LOW + (shift,) + SPI.CS_LOW + SPI.CS_HIGH
 
 def open():
     mpsse = ftdi.open(ftdi.MASK.SPI_S, ftdi.MASK.SPI_O)
@@ -0,0 +1,220 @@
+#!/usr/bin/env python2
+# Christian Unhold, DICE GmbH & Co KG
+"""
+Opt-in instrumentation of an Ftdi/Mpsse.
+enable() puts a counting Transport in front of the handle and sets the
+Ftdi.stats hook of the core, which reports the time spent encoding commands
+and the commands executed. Compare encodeTime with wireTime to see if a
+step is encoding-bound, and roundTrips and bytes per second with the
+device limits to see if it is latency- or bandwidth-bound.
+Hooks subscribed to a Stats are called as hook(event, value) with the
+events "write", "read" (byte counts), "roundTrip", "shortRead",
+"encode", "wire" (seconds) and "commands" (the executed command list).
+Usage:
+	s = stats.enable(mpsse)
+	...
+	print s.report()
+"""
+
+import math, time
+
+class Histogram:
+	"Durations in powers of two buckets, from 1 us up."
+	def __init__(self):
+		self.buckets = {} # exponent -> count, 2**exponent us upper bound
+		self.count = 0
+		self.total = 0.0 # s
+
+	def add(self, seconds):
+		micro = seconds*1e6
+		exponent = 0
+		if micro > 1:
+			exponent = int(math.ceil(math.log(micro, 2)))
+		self.buckets[exponent] = self.buckets.get(exponent, 0) + 1
+		self.count += 1
+		self.total += seconds
+
+	def report(self):
+		lines = ["%d in %.6f s" % (self.count, self.total)]
+		for exponent in sorted(self.buckets):
+			lines.append("  <= %9d us: %d" % (2**exponent,
+				self.buckets[exponent]))
+		return "\n".join(lines)
+
+class Stats:
+	"Counters and histograms of one device."
+	def __init__(self):
+		self.hooks = []
+		self.clear()
+
+	def clear(self):
+		self.writes = 0
+		self.reads = 0
+		self.writeBytes = 0
+		self.readBytes = 0
+		self.roundTrips = 0 # reads following a write
+		self.shortReads = 0 # reads returning less than requested
+		self.commands = {} # command class name -> count
+		self.encodeTime = Histogram()
+		self.wireTime = Histogram()
+
+	def subscribe(self, hook):
+		self.hooks.append(hook)
+
+	def unsubscribe(self, hook):
+		self.hooks.remove(hook)
+
+	def _notify(self, event, value):
+		for hook in self.hooks:
+			hook(event, value)
+
+	def encoded(self, seconds):
+		"Called by the core for the time of encoding commands."
+		self.encodeTime.add(seconds)
+		self._notify("encode", seconds)
+
+	def executed(self, commandList):
+		"Called by the core for the commands executed."
+		commands = self.commands
+		for command in commandList:
+			name = command.__class__.__name__
+			commands[name] = commands.get(name, 0) + 1
+		self._notify("commands", commandList)
+
+	def wire(self, seconds):
+		self.wireTime.add(seconds)
+		self._notify("wire", seconds)
+
+	def wrote(self, count):
+		self.writes += 1
+		self.writeBytes += count
+		self._notify("write", count)
+
+	def read(self, count, readCount, afterWrite):
+		self.reads += 1
+		self.readBytes += count
+		self._notify("read", count)
+		if afterWrite:
+			self.roundTrips += 1
+			self._notify("roundTrip", 1)
+		if count < readCount:
+			self.shortReads += 1
+			self._notify("shortRead", readCount - count)
+
+	def report(self):
+		lines = [
+			"writes %d, %d bytes" % (self.writes, self.writeBytes),
+			"reads %d, %d bytes, %d short" % (self.reads, self.readBytes,
+				self.shortReads),
+			"round trips %d" % (self.roundTrips,),
+			"encode time " + self.encodeTime.report(),
+			"wire time " + self.wireTime.report()]
+		for name in sorted(self.commands):
+			lines.append("%s: %d" % (name, self.commands[name]))
+		return "\n".join(lines)
+
+class _Transfer:
+	"Submitted transfer of a Transport, counted when done."
+	def __init__(self, transport, transfer, size, isRead):
+		self.transport = transport
+		self.transfer = transfer
+		self.size = size
+		self.isRead = isRead
+
+	def done(self):
+		stats = self.transport.stats
+		start = time.time()
+		count = self.transfer.done()
+		stats.wire(time.time() - start)
+		if self.isRead:
+			self.transport._read(count, self.size)
+		else:
+			self.transport._wrote(count)
+		return count
+
+class Transport:
+	"""
+	Counting proxy for the transport of an Ftdi, see enable().
+	The wire time of asynchronous transfers is the wait in done().
+	"""
+	def __init__(self, handle, stats):
+		self.handle = handle
+		self.stats = stats
+		self.afterWrite = False
+
+	def __getattr__(self, name):
+		return getattr(self.handle, name)
+
+	def _wrote(self, count):
+		self.stats.wrote(count)
+		self.afterWrite = True
+
+	def _read(self, count, readCount):
+		self.stats.read(count, readCount, self.afterWrite)
+		self.afterWrite = False
+
+	def write(self, writeData):
+		start = time.time()
+		count = self.handle.write(writeData)
+		self.stats.wire(time.time() - start)
+		self._wrote(count)
+		return count
+
+	def read(self, readCount):
+		start = time.time()
+		readData = self.handle.read(readCount)
+		self.stats.wire(time.time() - start)
+		self._read(len(readData), readCount)
+		return readData
+
+	def writeSubmit(self, writeData):
+		return _Transfer(self, self.handle.writeSubmit(writeData),
+			len(writeData), False)
+
+	def readSubmit(self, readCount, readBuffer):
+		return _Transfer(self, self.handle.readSubmit(readCount, readBuffer),
+			readCount, True)
+
+def enable(ftdi, stats=None):
+	"Instrument an Ftdi/Mpsse, return its Stats."
+	if ftdi.stats is None:
+		ftdi.stats = stats or Stats()
+		ftdi.handle = Transport(ftdi.handle, ftdi.stats)
+	return ftdi.stats
+
+def disable(ftdi):
+	"Remove the instrumentation of enable()."
+	if ftdi.stats is not None:
+		ftdi.handle = ftdi.handle.handle
+		ftdi.stats = None
+
+def test():
+	"Basic module self-test, on the emulator."
+	import emulator, ftdi_mpsse
+	print "Module 'stats' self test:"
+	handle = emulator.MpsseEmulator(ftdi_mpsse.DEVICE.FT2232H)
+	with ftdi_mpsse.Mpsse(handle, ftdi_mpsse.MASK.SPI_S, 0) as mpsse:
+		s = enable(mpsse)
+		events = []
+		s.subscribe(lambda event, value: events.append(event))
+		mpsse.execute(ftdi_mpsse.Loopback(True))
+		shift = ftdi_mpsse.ShiftInOutByte("\x55"*100)
+		mpsse.executeList([shift, ftdi_mpsse.GetIo(ftdi_mpsse.BYTE.LOW)])
+		assert s.writes == 2 and s.reads >= 1 and s.roundTrips == 1
+		assert s.readBytes == 101
+		assert s.commands == {"Loopback": 1, "ShiftInOutByte": 1,
+			"GetIo": 1}
+		assert s.encodeTime.count == 2
+		assert s.wireTime.count == s.writes + s.reads
+		assert "roundTrip" in events and "encode" in events
+		mpsse.asyncTransfers = 2
+		mpsse.executeList([ftdi_mpsse.ShiftInOutByte("\xAA"*10)])
+		assert s.readBytes == 111 and s.roundTrips == 2
+		print s.report()
+		disable(mpsse)
+		assert mpsse.handle is handle
+		assert mpsse.checkReadBufferEmpty()
+	print "stats test done"
+
+if __name__ == "__main__":
+	test()
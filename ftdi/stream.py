@@ -0,0 +1,197 @@
+#!/usr/bin/env python2
+# Christian Unhold, DICE GmbH & Co KG
+"""
+Byte shifts of any length, streamed from a source to a sink.
+A source is a string, bytearray, memoryview or mmap, or a file object that
+is read piece by piece. A sink is a writable buffer (bytearray, memoryview,
+mmap) filled from the start, or a file object or anything else with a
+write() method. Neither the payload nor the response
+is held in memory as a whole, only the blocks in flight.
+Shifts are split into ShiftOutByte/ShiftInByte/ShiftInOutByte commands.
+Shifts with read data are sent in blocks of one read chunk, with the next
+block written before the previous one is read, like program.Program does.
+Shifts without read data are sent in blocks of one write chunk.
+Usage:
+	with open("image.bin", "rb") as image:
+		stream.shiftOut(mpsse, image)
+	stream.shiftIn(mpsse, 16 << 20, open("dump.bin", "wb"))
+"""
+
+import mmap, collections
+from ftdi_mpsse import (MAX_SHIFT_BYTES, ShiftOutByte, ShiftInByte,
+	ShiftInOutByte)
+
+class _Source:
+	"Pieces of a buffer or a file, in order."
+	def __init__(self, source, length=None):
+		self.source = source
+		self.isFile = (hasattr(source, "read") and
+			not isinstance(source, mmap.mmap))
+		if length is None and not self.isFile:
+			length = len(source)
+		self.left = length # None for the rest of the file
+		self.offset = 0
+
+	def read(self, size):
+		"The next up to size bytes as a string, empty at the end."
+		if self.left is not None:
+			size = min(size, self.left)
+		if self.isFile:
+			data = self.source.read(size) if size else ""
+		else:
+			data = self.source[self.offset:self.offset + size]
+			if isinstance(data, memoryview):
+				data = data.tobytes()
+			else:
+				data = str(data)
+		self.offset += len(data)
+		if self.left is not None:
+			self.left -= len(data)
+		return data
+
+class _Sink:
+	"Consecutive writes to a buffer or to an object with write()."
+	def __init__(self, sink):
+		self.sink = sink
+		self.isFile = (hasattr(sink, "write") and
+			not isinstance(sink, mmap.mmap))
+		self.offset = 0
+
+	def write(self, data):
+		if self.sink is None:
+			return
+		if self.isFile:
+			self.sink.write(data)
+		else:
+			end = self.offset + len(data)
+			assert end <= len(self.sink), "sink too small"
+			self.sink[self.offset:end] = data
+			self.offset = end
+
+def _blockSize(mpsse, read):
+	"Payload bytes per block, see the module docstring."
+	if read:
+		return mpsse.readChunkSize
+	return max(1, mpsse.writeChunkSize - 3)
+
+def _encode(mpsse, command, payload):
+	"Encoding of a block, split into commands of at most MAX_SHIFT_BYTES."
+	if command is ShiftInByte:
+		return "".join([ShiftInByte(min(MAX_SHIFT_BYTES,
+			payload - i)).getWriteData(mpsse) for i in
+			xrange(0, payload, MAX_SHIFT_BYTES)])
+	return "".join([command(payload[i:i + MAX_SHIFT_BYTES]).getWriteData(
+		mpsse) for i in xrange(0, len(payload), MAX_SHIFT_BYTES)])
+
+def _run(mpsse, blocks, sink):
+	"""
+	Send the blocks, (write data, read count), keeping two in flight,
+	and write the read data to sink. Return the number of bytes read.
+	"""
+	mpsse.flush()
+	mpsse.complete()
+	sink = _Sink(sink)
+	flush = mpsse.getFlushData()
+	readBuffer = bytearray(mpsse.readChunkSize)
+	inFlight = collections.deque()
+	total = 0
+	for writeData, readCount in blocks:
+		if readCount:
+			writeData += flush
+		mpsse.write(writeData)
+		if not readCount:
+			continue
+		inFlight.append(readCount)
+		if len(inFlight) > 1:
+			total += _readBlock(mpsse, readBuffer, inFlight, sink)
+	while inFlight:
+		total += _readBlock(mpsse, readBuffer, inFlight, sink)
+	return total
+
+def _readBlock(mpsse, readBuffer, inFlight, sink):
+	view = memoryview(readBuffer)[:inFlight.popleft()]
+	mpsse.read(len(view), view)
+	sink.write(view.tobytes())
+	return len(view)
+
+def _sourceBlocks(mpsse, command, source, read):
+	size = _blockSize(mpsse, read)
+	while True:
+		payload = source.read(size)
+		if not payload:
+			return
+		yield _encode(mpsse, command, payload), len(payload) if read else 0
+
+def shiftOut(mpsse, source, length=None):
+	"""
+	Shift out length bytes of source, all of a buffer or the rest of
+	a file by default. Return the number of bytes shifted.
+	"""
+	source = _Source(source, length)
+	_run(mpsse, _sourceBlocks(mpsse, ShiftOutByte, source, False), None)
+	return source.offset
+
+def shiftIn(mpsse, length, sink=None):
+	"Shift in length bytes to sink. Return the number of bytes shifted."
+	size = _blockSize(mpsse, True)
+	blocks = ((_encode(mpsse, ShiftInByte, min(size, length - start)),
+		min(size, length - start)) for start in xrange(0, length, size))
+	return _run(mpsse, blocks, sink)
+
+def shiftInOut(mpsse, source, sink=None, length=None):
+	"""
+	Shift out length bytes of source, see shiftOut(), and the bytes
+	shifted in to sink. Return the number of bytes shifted.
+	"""
+	source = _Source(source, length)
+	return _run(mpsse, _sourceBlocks(mpsse, ShiftInOutByte, source, True),
+		sink)
+
+def test():
+	"Basic module self-test, on the emulator."
+	import emulator, ftdi_mpsse, tempfile, os
+	from ftdi_mpsse import DEVICE, Loopback
+	print "Module 'stream' self test:"
+	data = "".join([chr(i*7 & 0xFF) for i in range(100000)])
+	fileName = tempfile.mktemp(".bin")
+	with open(fileName, "wb") as file:
+		file.write(data)
+	handle = emulator.MpsseEmulator(DEVICE.FT2232H)
+	with ftdi_mpsse.Mpsse(handle) as mpsse:
+		mpsse.execute(Loopback(True))
+		out = bytearray(len(data))
+		assert shiftInOut(mpsse, data, out) == len(data)
+		assert out == data
+		with open(fileName, "rb") as file:
+			with open(fileName + ".out", "wb") as outFile:
+				assert shiftInOut(mpsse, file, outFile) == len(data)
+			with open(fileName + ".out", "rb") as outFile:
+				assert outFile.read() == data
+			os.remove(fileName + ".out")
+		with open(fileName, "r+b") as file:
+			mapped = mmap.mmap(file.fileno(), 0)
+			out = bytearray(1000)
+			shiftInOut(mpsse, mapped, memoryview(out), 1000)
+			assert out == data[:1000]
+			mapped[:] = "\x00"*len(data)
+			shiftInOut(mpsse, memoryview(bytearray(data)), mapped)
+			assert mapped[:] == data
+			mapped.close()
+		written = handle.bytesWritten
+		assert shiftOut(mpsse, data) == len(data)
+		assert handle.bytesWritten - written < len(data)*1.01
+		mpsse.execute(Loopback(False))
+		handle.setInput(ftdi_mpsse.PIN.TDO)
+		out = bytearray(len(data))
+		assert shiftIn(mpsse, len(data), out) == len(data)
+		assert out == "\xFF"*len(data)
+		shift = ftdi_mpsse.ShiftInOut(8*len(data[:10000]), data[:10000])
+		assert len(shift.subCommands) == 3
+		mpsse.execute(shift)
+		assert shift.result.tobytes() == "\xFF"*10000
+		assert mpsse.checkReadBufferEmpty()
+	os.remove(fileName)
+	print "stream test done"
+
+if __name__ == "__main__":
+	test()
@@ -0,0 +1,261 @@
+#!/usr/bin/env python2
+# Christian Unhold, DICE GmbH & Co KG
+"""
+Record and replay of the raw byte stream of an Ftdi/Mpsse.
+A Recorder in front of the transport captures every write and the data
+read back, which becomes the expected response. A trace file holds the
+sequence of write and read lengths, then all write data, the expected
+read data and optionally a compare mask, each in one piece.
+replay() sends the write data straight from the file, mapped with mmap,
+reads into one buffer and compares all responses at once at the end.
+No commands are built or encoded, so it runs at wire speed.
+Replay needs the device in the state it was recorded in, usually right
+after opening it the same way.
+Usage:
+	recorder = trace.record(mpsse)
+	... program the golden board ...
+	recorder.stop()
+	recorder.save("flash.trace")
+	trace.replay(otherMpsse, "flash.trace")
+"""
+
+import struct, mmap, binascii
+
+MAGIC = "MPSSETRC"
+VERSION = 1
+HEADER = struct.Struct("<8sIIIII") # magic, version, ops, write, read, mask
+OP = struct.Struct("<I")
+READ = 0x80000000 # flag of a read op, the length is in the other bits
+
+class _Transfer:
+	"A submitted read, its data is recorded when it is done."
+	def __init__(self, transfer, recorder, index, readCount, readBuffer):
+		self.transfer = transfer
+		self.recorder = recorder
+		self.index = index
+		self.readCount = readCount
+		self.readBuffer = readBuffer
+
+	def done(self):
+		count = self.transfer.done()
+		readData, mask = self.recorder.readData[self.index]
+		self.recorder.readData[self.index] = (
+			str(bytearray(self.readBuffer[:self.readCount])), mask)
+		return count
+
+class Recorder:
+	"""
+	Transport proxy recording the byte stream, see record().
+	While compare is False, the bytes read are not compared on replay.
+	"""
+	def __init__(self, ftdi):
+		self.ftdi = ftdi
+		self.handle = ftdi.handle
+		self.compare = True
+		self.ops = [] # [length | READ] of consecutive writes and reads
+		self.writeData = []
+		self.readData = [] # (data, mask) per read, data None while submitted
+		self.masked = False
+
+	def __getattr__(self, name):
+		return getattr(self.handle, name)
+
+	def _write(self, writeData):
+		if writeData:
+			self.ops.append(len(writeData))
+			self.writeData.append(str(writeData))
+
+	def _read(self, readCount, readData):
+		"Record a read, readData is filled in later for a submitted one."
+		if readCount == 0:
+			return
+		mask = "\xFF" if self.compare else "\x00"
+		if not self.compare:
+			self.masked = True
+		if self.ops and self.ops[-1] & READ:
+			self.ops[-1] += readCount
+		else:
+			self.ops.append(READ | readCount)
+		self.readData.append((readData, mask*readCount))
+
+	def write(self, writeData):
+		count = self.handle.write(writeData)
+		self._write(writeData[:count])
+		return count
+
+	def read(self, readCount):
+		readData = self.handle.read(readCount)
+		self._read(len(readData), readData)
+		return readData
+
+	def writeSubmit(self, writeData):
+		self._write(writeData)
+		return self.handle.writeSubmit(writeData)
+
+	def readSubmit(self, readCount, readBuffer):
+		transfer = self.handle.readSubmit(readCount, readBuffer)
+		if readCount == 0:
+			return transfer
+		self._read(readCount, None)
+		return _Transfer(transfer, self, len(self.readData) - 1, readCount,
+			readBuffer)
+
+	def stop(self):
+		"Stop recording, the transfers in flight are completed first."
+		self.ftdi.complete()
+		if self.ftdi.handle is self:
+			self.ftdi.handle = self.handle
+
+	def save(self, fileName):
+		"Write the trace file."
+		writeData = "".join(self.writeData)
+		expected = "".join([str(data) for data, mask in self.readData])
+		mask = ""
+		if self.masked:
+			mask = "".join([mask for data, mask in self.readData])
+		with open(fileName, "wb") as file:
+			file.write(HEADER.pack(MAGIC, VERSION, len(self.ops),
+				len(writeData), len(expected), len(mask)))
+			file.write("".join([OP.pack(op) for op in self.ops]))
+			file.write(writeData)
+			file.write(expected)
+			file.write(mask)
+
+def record(ftdi):
+	"Start recording the byte stream of an Ftdi/Mpsse, return the Recorder."
+	ftdi.flush()
+	ftdi.complete()
+	recorder = Recorder(ftdi)
+	ftdi.handle = recorder
+	return recorder
+
+class Trace:
+	"The sections of a trace file, in a string or mmap."
+	def __init__(self, data):
+		self.data = data
+		magic, version, opCount, writeSize, readSize, maskSize = \
+			HEADER.unpack_from(data)
+		if magic != MAGIC or version != VERSION:
+			raise EnvironmentError("not a trace file of version %d" %
+				(VERSION,))
+		offset = HEADER.size
+		self.ops = struct.unpack_from("<%dI" % opCount, data, offset)
+		offset += OP.size*opCount
+		self.writeOffset = offset
+		self.expectedOffset = offset + writeSize
+		self.readSize = readSize
+		self.maskOffset = None
+		if maskSize:
+			self.maskOffset = self.expectedOffset + readSize
+
+	def getExpected(self):
+		return self.data[self.expectedOffset:
+			self.expectedOffset + self.readSize]
+
+	def getMask(self):
+		if self.maskOffset is None:
+			return None
+		return self.data[self.maskOffset:self.maskOffset + self.readSize]
+
+def compare(readData, expected, mask=None):
+	"""
+	Index of the first byte of readData that differs from expected where
+	mask has set bits, or None if they are all equal.
+	"""
+	readData = str(readData)
+	if mask is None:
+		if readData == expected:
+			return None
+	else:
+		hexMask = binascii.hexlify(mask)
+		if (long(binascii.hexlify(readData) or "0", 16) &
+				long(hexMask or "0", 16)) == (
+				long(binascii.hexlify(expected) or "0", 16) &
+				long(hexMask or "0", 16)):
+			return None
+	for index in xrange(len(readData)):
+		if mask is None:
+			if readData[index] != expected[index]:
+				return index
+		elif (ord(readData[index]) ^ ord(expected[index])) & ord(
+				mask[index]):
+			return index
+
+def replay(ftdi, fileName, useMmap=True):
+	"""
+	Replay a trace file on an Ftdi/Mpsse and compare the responses.
+	Raise an EnvironmentError at the first byte that differs.
+	"""
+	with open(fileName, "rb") as file:
+		if useMmap:
+			data = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+		else:
+			data = file.read()
+		try:
+			replayTrace(ftdi, Trace(data))
+		finally:
+			if useMmap:
+				data.close()
+
+def replayTrace(ftdi, trace):
+	"Replay a Trace, see replay()."
+	ftdi.flush()
+	readBuffer = bytearray(trace.readSize)
+	readView = memoryview(readBuffer)
+	data = trace.data
+	writeIndex = trace.writeOffset
+	readIndex = 0
+	for op in trace.ops:
+		if op & READ:
+			count = op & ~READ
+			ftdi.read(count, readView[readIndex:readIndex + count])
+			readIndex += count
+		else:
+			ftdi.write(data[writeIndex:writeIndex + op])
+			writeIndex += op
+	index = compare(readBuffer, trace.getExpected(), trace.getMask())
+	if index is not None:
+		raise EnvironmentError("replay response differs at byte %d of %d" %
+			(index, trace.readSize))
+
+def test():
+	"Basic module self-test, on the emulator."
+	import emulator, tempfile, os, ftdi_mpsse
+	print "Module 'trace' self test:"
+	fileName = tempfile.mktemp(".trace")
+	def open():
+		return ftdi_mpsse.Mpsse(emulator.MpsseEmulator(
+			ftdi_mpsse.DEVICE.FT2232H), ftdi_mpsse.MASK.SPI_S, 0)
+	for asyncTransfers in (4, 0):
+		with open() as mpsse:
+			mpsse.asyncTransfers = asyncTransfers
+			recorder = record(mpsse)
+			mpsse.execute(ftdi_mpsse.Loopback(True))
+			mpsse.execute(ftdi_mpsse.ShiftInOutByte("\x12\x34\x56"))
+			mpsse.executeList([ftdi_mpsse.ShiftInOutByte("\xA5"*0x1000)]*8)
+			recorder.compare = False
+			mpsse.execute(ftdi_mpsse.GetIo(ftdi_mpsse.BYTE.LOW))
+			recorder.stop()
+			assert mpsse.handle is recorder.handle
+			recorder.save(fileName)
+		for useMmap in (True, False):
+			with open() as mpsse:
+				replay(mpsse, fileName, useMmap)
+				assert mpsse.checkReadBufferEmpty()
+	with open() as mpsse:
+		mpsse.handle.setInput(0xFF) # differs only in the masked GetIo
+		replay(mpsse, fileName)
+		mpsse.handle.maxClockFrequency = 1e6 # shifts read as ones
+		try:
+			replay(mpsse, fileName)
+			assert False
+		except EnvironmentError as error:
+			assert "at byte 0 " in str(error)
+		mpsse.reset()
+	assert compare("\x01\x02", "\x01\x03", "\xFF\xFE") is None
+	assert compare("\x01\x02", "\x01\x03", "\xFF\xFF") == 1
+	os.remove(fileName)
+	print "trace test done"
+
+if __name__ == "__main__":
+	test()
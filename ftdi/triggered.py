@@ -0,0 +1,110 @@
+#!/usr/bin/env python2
+# Christian Unhold, DICE GmbH & Co KG
+"""
+Command sequences started by the adapter on a level of GPIOL1.
+A TriggeredSequence is a WaitOnIo followed by any commands, e.g. GetIo or
+shifts to capture or a CompiledWaveform.commandList as stimulus, sent to
+the device in advance. The MPSSE runs them as soon as GPIOL1 (ADBUS5 or
+BDBUS5) is at the level, within microseconds instead of a host polling
+loop. A host-side watchdog ends a wait that takes longer than timeout:
+the only way out of WaitOnIo is a reset of the MPSSE, after which the I/O
+lines and settings of the time of arming are restored.
+Usage:
+	read = ftdi.ShiftInByte(4)
+	sequence = triggered.TriggeredSequence(mpsse, [read])
+	if sequence.run(timeout=0.5):
+		print read.result.tobytes().encode("hex")
+"""
+
+import program
+from ftdi_mpsse import BYTE, BIT_MODE, WaitOnIo, GetIo
+
+class TriggeredSequence:
+	"""
+	WaitOnIo(state) and a command list, compiled for an Mpsse.
+	The whole sequence has to fit in the device buffers, as the host
+	cannot send more while the MPSSE waits.
+	"""
+	def __init__(self, mpsse, commandList, state=True):
+		self.mpsse = mpsse
+		self.done = GetIo(BYTE.LOW) # read last, tells that all ran
+		self.program = program.Program(mpsse,
+			[WaitOnIo(state)] + list(commandList) + [self.done])
+		assert len(self.program.chunks) == 1, "sequence too long"
+		self.state = None # of the Mpsse when armed
+
+	def arm(self):
+		"Send the sequence, the MPSSE waits for the trigger from now on."
+		mpsse = self.mpsse
+		mpsse.flush()
+		mpsse.complete()
+		self.state = mpsse.saveState()
+		mpsse.write(self.program.writeData)
+
+	def wait(self, timeout=1.0):
+		"""
+		Wait up to timeout s for the sequence to run, then set the
+		results of its commands and return True. Otherwise cancel it
+		and return False.
+		"""
+		mpsse = self.mpsse
+		assert self.state is not None, "not armed"
+		readTimeout = mpsse.readTimeout
+		mpsse.readTimeout = timeout*1000
+		try:
+			mpsse.read(self.program.readCount, self.program.readView)
+		except EnvironmentError:
+			self.cancel()
+			return False
+		finally:
+			mpsse.readTimeout = readTimeout
+		self.state = None
+		self.program.setResults()
+		return True
+
+	def cancel(self):
+		"""
+		End a wait by resetting the MPSSE, and restore the I/O lines
+		and settings of the time of arming. Only BIT_MODE.RESET leaves
+		WaitOnIo, re-entering MPSSE mode alone does not.
+		"""
+		mpsse = self.mpsse
+		mpsse.transfers.clear()
+		mpsse.readsInFlight = 0
+		mpsse.handle.setBitMode(mpsse.lowByteDirection, BIT_MODE.RESET)
+		mpsse.reset()
+		mpsse.restoreState(self.state)
+		self.state = None
+
+	def run(self, timeout=1.0):
+		"Arm and wait, see wait()."
+		self.arm()
+		return self.wait(timeout)
+
+def test():
+	"Basic module self-test, on the emulator."
+	import emulator, ftdi_mpsse
+	from ftdi_mpsse import PIN, MASK, Loopback, SetClockDivisor, SetIo
+	print "Module 'triggered' self test:"
+	handle = emulator.MpsseEmulator(ftdi_mpsse.DEVICE.FT2232H)
+	with ftdi_mpsse.Mpsse(handle) as mpsse:
+		mpsse.executeList([Loopback(True), SetClockDivisor(3)])
+		mpsse.setPins(PIN.GPIOL0)
+		shift = ftdi_mpsse.ShiftInOutByte("\x12\x34")
+		sequence = TriggeredSequence(mpsse, [SetIo(0, MASK.SPI_O), shift])
+		sequence.arm()
+		assert handle.waitOnIo is True
+		assert not sequence.wait(0.05)
+		assert handle.waitOnIo is None and handle.loopback
+		assert handle.clockDivisor == 3
+		assert handle.value[BYTE.LOW] == MASK.SPI_S|PIN.GPIOL0
+		assert mpsse.checkReadBufferEmpty()
+		handle.setInput(PIN.GPIOL1)
+		assert sequence.run()
+		assert shift.result.tobytes() == "\x12\x34"
+		assert mpsse.getPinValue() == 0 and handle.value[BYTE.LOW] == 0
+		assert mpsse.checkReadBufferEmpty()
+	print "triggered test done"
+
+if __name__ == "__main__":
+	test()
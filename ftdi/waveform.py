@@ -0,0 +1,180 @@
+#!/usr/bin/env python2
+# Christian Unhold, DICE GmbH & Co KG
+"""
+Compiled GPIO waveforms for bit-banged protocols and stimulus.
+A Waveform is a sequence of pin states with durations in seconds, use NS
+and US for readable ones. compile() turns it into SetIo commands for the
+edges and delays in between, as one program.Program that is run any number
+of times in one transfer.
+Delays are Clock commands, which take a known number of TCK periods, or,
+for delays shorter than a Clock command, repeated SetIo. As Clock toggles
+TCK, TCK is an input during the waveform unless it is one of the waveform
+pins, in which case the delays are made of SetIo only.
+The execution time of a SetIo is not specified by FTDI, setIoTime is an
+estimate; measure the edges once and adjust it for exact timing.
+Usage:
+	w = waveform.Waveform(PIN.GPIOL0|PIN.GPIOL1)
+	w.add(PIN.GPIOL0, 500*NS).add(PIN.GPIOL1, 2*US).add(0, 1*US)
+	w.compile(mpsse).run()
+"""
+
+from ftdi_mpsse import (BYTE, PIN, MASK, HIGHSPEED_DEVICES, SetIo, Clock,
+	ClockDivideByFive, SetClockDivisor)
+
+NS = 1e-9
+US = 1e-6
+MS = 1e-3
+
+SET_IO_TIME = 100*NS # approximate, for FT2232H at 60 MHz
+
+class Waveform:
+	"""
+	Pin states of the pins in mask, the 16 I/O lines with the high byte
+	in bits 8 to 15. The pins are outputs during the waveform.
+	"""
+	def __init__(self, mask, setIoTime=SET_IO_TIME):
+		self.mask = mask
+		self.setIoTime = setIoTime
+		self.segments = [] # (value, duration)
+
+	def add(self, value, duration):
+		"Set the pins to value and hold them for duration s."
+		self.segments.append((value & self.mask, duration))
+		return self
+
+	def hold(self, duration):
+		"Keep the last state for duration s longer."
+		value = 0
+		if self.segments:
+			value = self.segments[-1][0]
+		return self.add(value, duration)
+
+	def pulse(self, pins, width, idle=0):
+		"""
+		A pulse on pins of width s from the last state,
+		then idle s in the last state.
+		"""
+		value = 0
+		if self.segments:
+			value = self.segments[-1][0]
+		self.add(value ^ pins, width)
+		return self.add(value, idle)
+
+	def compile(self, mpsse, repeat=1):
+		"Compile for an Mpsse, see CompiledWaveform."
+		return CompiledWaveform(mpsse, self, repeat)
+
+class CompiledWaveform:
+	"""
+	A Waveform as commands for an Mpsse, repeated repeat times.
+	timing holds (requested, achieved) duration of each segment.
+	If the TCK frequency is not known from the Mpsse settings shadow,
+	the clock is set to the maximum first.
+	"""
+	def __init__(self, mpsse, waveform, repeat=1):
+		self.mpsse = mpsse
+		self.waveform = waveform
+		setupList = []
+		frequency = mpsse.getClockFrequency()
+		if frequency is None:
+			if mpsse.deviceInfo["type"] in HIGHSPEED_DEVICES:
+				setupList.append(ClockDivideByFive(False))
+				frequency = 30e6
+			else:
+				frequency = 6e6
+			setupList.append(SetClockDivisor(0))
+		self.period = 1/frequency
+		self.useClock = not waveform.mask & PIN.TCK
+		value = mpsse.getPinValue() & ~waveform.mask
+		direction = mpsse.getPinDirection() | waveform.mask
+		if self.useClock:
+			direction &= ~PIN.TCK
+		self.timing = []
+		commandList = []
+		last = None
+		for segmentValue, duration in waveform.segments:
+			value = value & ~waveform.mask | segmentValue
+			setIoList = self._setIo(value, direction, last)
+			last = value
+			achieved = len(setIoList)*waveform.setIoTime
+			delayList, delay = self._delay(duration - achieved,
+				setIoList[-1])
+			commandList += setIoList + delayList
+			self.timing.append((duration, achieved + delay))
+		# back to the direction of TCK before the waveform
+		tckDirection = mpsse.getPinDirection() & PIN.TCK
+		if self.useClock and tckDirection:
+			commandList.append(SetIo(value & 0xFF,
+				(direction | tckDirection) & 0xFF))
+		self.commandList = setupList + commandList*repeat
+		self.program = mpsse.compile(self.commandList)
+
+	def _setIo(self, value, direction, last):
+		"SetIo for the bytes of value that differ from last, at least one."
+		setIoList = []
+		for lowHighByte in (BYTE.LOW, BYTE.HIGH):
+			shift = 8*lowHighByte
+			if last is None:
+				changed = (self.waveform.mask >> shift) & 0xFF
+			else:
+				changed = ((value ^ last) >> shift) & 0xFF
+			if changed:
+				setIoList.append(SetIo((value >> shift) & 0xFF,
+					(direction >> shift) & 0xFF, lowHighByte))
+		if not setIoList:
+			setIoList.append(SetIo(value & 0xFF, direction & 0xFF))
+		return setIoList
+
+	def _delay(self, delay, setIo):
+		"""
+		The commands closest to delay s and the delay they take:
+		a Clock if it is not too short, else setIo repeated.
+		"""
+		setIoTime = self.waveform.setIoTime
+		if self.useClock:
+			count = int(round(delay/self.period))
+			if count >= 1 and count*self.period >= setIoTime/2:
+				return [Clock(count)], count*self.period
+		count = max(0, int(round(delay/setIoTime)))
+		return [setIo]*count, count*setIoTime
+
+	def run(self):
+		"Output the waveform."
+		self.program.run()
+
+	def getWriteSize(self):
+		"Bytes sent per run."
+		return len(self.program.writeData)
+
+def test():
+	"Basic module self-test, on the emulator."
+	import emulator, ftdi_mpsse
+	print "Module 'waveform' self test:"
+	handle = emulator.MpsseEmulator(ftdi_mpsse.DEVICE.FT2232H)
+	with ftdi_mpsse.Mpsse(handle) as mpsse:
+		w = Waveform(PIN.GPIOL0|PIN.GPIOH0)
+		w.add(PIN.GPIOL0, 1*US).add(PIN.GPIOH0, 300*NS).pulse(PIN.GPIOL0,
+			200*NS, 10*US)
+		del mpsse.settings[SetClockDivisor] # unknown, set to the maximum
+		c = w.compile(mpsse, repeat=3)
+		assert mpsse.getClockFrequency() is None
+		for requested, achieved in c.timing:
+			assert abs(requested - achieved) <= 50*NS
+		clocks = handle.clockCount
+		c.run()
+		assert mpsse.getClockFrequency() == 30e6
+		assert handle.clockCount - clocks == 3*(24 + 3 + 3 + 297)
+		assert mpsse.getPinValue() == PIN.TMS|PIN.GPIOH0
+		assert mpsse.getPinDirection() == MASK.SPI_O|PIN.GPIOL0|PIN.GPIOH0
+		assert handle.value == [PIN.TMS, 1]
+		c.run()
+		print "%d bytes per run" % (c.getWriteSize(),)
+		w = Waveform(PIN.SK|PIN.DO).add(PIN.SK, 1*US).add(0, 1*US)
+		c = w.compile(mpsse)
+		assert not c.useClock and len(c.commandList) == 20
+		c.run()
+		assert mpsse.checkReadBufferEmpty()
+	print "waveform test done"
+
+if __name__ == "__main__":
+	test()